@@ -0,0 +1,278 @@
+import calendar
+
+import numpy as np
+import pandas as pd
+
+from DataProcessing import PAYMENT_DATE_COLUMN
+from Diagnostics import instrument
+from ParallelAgg import PARALLEL_WORKERS, STATUS_RADIX, month_partitions, partitioned_counts
+from TransactionStatus import STATUS_COUNT, STATUS_DECLINED, STATUS_PENDING, STATUS_SUCCESSFUL, transaction_status
+
+DIMENSIONS = ['Year', 'Month', 'DayOfWeek', 'ProcessType_Description', 'Status', 'CompanyId']
+ordered_days = list(calendar.day_name)
+
+# Largest groups × companies bitset built for distinct counts; bigger ones fall back to np.unique
+BITSET_MAX_BYTES = 64 * 1024 ** 2
+
+
+def company_ids(company_names):
+    # Integer id per company, with names compared after stripping whitespace; -1 for missing names
+    codes, uniques = pd.factorize(company_names)
+    stripped_codes, names = pd.factorize(pd.Index(uniques).astype(str).str.strip())
+    ids = np.where(codes >= 0, stripped_codes.take(codes), -1).astype(np.int32)
+    return ids, pd.Index(names)
+
+
+def top_k(counts, number):
+    # Positions of the `number` largest non-zero counts, largest first and ties to the lower position
+    # (like nlargest(keep='first')), from a partial selection instead of a full sort
+    number = min(number, int(np.count_nonzero(counts)))
+    if number <= 0:
+        return np.array([], dtype=np.intp)
+    threshold = np.partition(counts, len(counts) - number)[len(counts) - number]
+    above = np.flatnonzero(counts > threshold)
+    tied = np.flatnonzero(counts == threshold)[:number - len(above)]
+    chosen = np.concatenate([above, tied])
+    return chosen[np.lexsort((chosen, -counts[chosen]))]
+
+
+def distinct_counts(groups, ids, group_count, id_count):
+    # Distinct ids per group code, exact, from a groups × ids bitset: no hashing and no sort
+    if group_count * id_count > BITSET_MAX_BYTES:
+        pairs = np.unique(groups.astype(np.int64) * id_count + ids)
+        return np.bincount(pairs // id_count, minlength=group_count)
+    seen = np.zeros((group_count, id_count), dtype=bool)
+    seen[groups, ids] = True
+    return np.count_nonzero(seen, axis=1)
+
+
+# Page layouts shared by every backend, built from per-group counts
+
+def quarterly_frame(summary):
+    # `summary` has Count and Amount indexed by quarter number
+    if len(summary):
+        # Quarters without transactions between the first and last one show up as zero
+        summary = summary.reindex(range(summary.index.min(), summary.index.max() + 1), fill_value=0)
+    return pd.DataFrame({
+        'Quarter': [f'Q{quarter}' for quarter in summary.index],
+        'TransactionCount': summary['Count'].to_numpy(),
+        'TotalAmount': summary['Amount'].to_numpy(),
+    })
+
+
+def year_metrics_frame(metrics):
+    # `metrics` has total, amount, successful, pending, declined and companies per year
+    metrics = metrics.astype({'total': 'int64', 'successful': 'int64', 'pending': 'int64', 'declined': 'int64', 'companies': 'int64'})
+    metrics['not_declined'] = metrics['successful'] + metrics['pending']
+    metrics['success_ratio'] = metrics['successful'] / metrics['total']
+    metrics['declined_ratio'] = metrics['declined'] / metrics['total']
+    metrics.index = metrics.index.astype(int)
+    return metrics
+
+
+def type_totals_frame(counts, years):
+    # Transactions per type (rows) and year (columns); years without a type count zero
+    totals = counts.pivot_table(index='ProcessType_Description', columns='Year', values='Count', aggfunc='sum', fill_value=0, observed=True)
+    totals.columns = totals.columns.astype(int)
+    totals = totals.reindex(columns=sorted(int(year) for year in years), fill_value=0).astype('int64')
+    totals.index = totals.index.astype(str)
+    totals.columns.name = 'Year'
+    return totals
+
+
+def type_by_weekday_frame(counts):
+    counts = counts.copy()
+    counts['ProcessType_Description'] = counts['ProcessType_Description'].astype(str)
+    counts[PAYMENT_DATE_COLUMN] = np.array(ordered_days)[counts['DayOfWeek'].astype(int)]
+    return counts[['ProcessType_Description', PAYMENT_DATE_COLUMN, 'Count']].reset_index(drop=True)
+
+
+class AggregateCube:
+    # Counts and amount sums over (year, month, weekday, type, status, company), built once per dataset.
+    # Every dashboard metric and chart is answered by slicing this instead of regrouping the rows.
+    def __init__(self, data, version=None, status=None):
+        self.version = version
+        if status is None:
+            status = transaction_status(data)
+        payment_date = data[PAYMENT_DATE_COLUMN]
+        ids, self.company_names = company_ids(data['CompanyName'])
+
+        keys = pd.DataFrame({
+            'Year': payment_date.dt.year.astype('Int16'),
+            'Month': payment_date.dt.month.astype('Int8'),
+            'DayOfWeek': payment_date.dt.dayofweek.astype('Int8'),
+            'ProcessType_Description': data['ProcessType_Description'],
+            'Status': status,
+            'CompanyId': ids,
+            'Amount': data['Amount'].to_numpy(),
+        })
+        keys = keys[keys['Year'].notna()]
+
+        self.cube = (
+            keys.groupby(DIMENSIONS, observed=True, dropna=False)
+            .agg(Count=('Amount', 'size'), Amount=('Amount', 'sum'))
+            .reset_index()
+        )
+
+    @classmethod
+    def partitioned(cls, data, version=None, status=None, workers=PARALLEL_WORKERS):
+        # The same cube as AggregateCube(data) for rows sorted by PaymentDate, counted month by month in
+        # a process pool over shared memory. Each month's groups are final, so merging is a concatenation.
+        if status is None:
+            status = transaction_status(data)
+        ids, company_names = company_ids(data['CompanyName'])
+        descriptions = data['ProcessType_Description']
+        if isinstance(descriptions.dtype, pd.CategoricalDtype):
+            type_codes, types = descriptions.cat.codes.to_numpy(), descriptions.cat.categories
+        else:
+            type_codes, types = pd.factorize(descriptions, sort=True)
+        type_radix = len(types) + 1
+        company_radix = len(company_names) + 1
+        dates = data[PAYMENT_DATE_COLUMN].to_numpy(dtype='datetime64[ns]')
+
+        partitions = month_partitions(dates)
+        columns = {
+            'dates': dates.view(np.int64),
+            # Missing types sort after every type and missing companies (-1) before every company, as in groupby
+            'types': np.where(type_codes >= 0, type_codes, len(types)).astype(np.int16),
+            'status': np.asarray(status, dtype=np.int8),
+            'companies': ids + 1,
+            # groupby sums skip missing amounts
+            'amount': np.nan_to_num(data['Amount'].to_numpy(dtype=np.float64)),
+        }
+        results = partitioned_counts(columns, partitions, type_radix, company_radix, workers)
+        del columns
+
+        groups = np.concatenate([result[0] for result in results]) if results else np.array([], dtype=np.int64)
+        month_starts = [pd.Timestamp(dates[start]) for start, _ in partitions]
+        sizes = [len(result[0]) for result in results]
+        company = groups % company_radix - 1
+        rest = groups // company_radix
+        status_codes = rest % STATUS_RADIX
+        rest //= STATUS_RADIX
+        type_code = rest % type_radix
+        weekday = rest // type_radix
+
+        if isinstance(descriptions.dtype, pd.CategoricalDtype):
+            type_values = pd.Categorical.from_codes(np.where(type_code < len(types), type_code, -1), dtype=descriptions.dtype)
+        else:
+            type_values = np.append(np.asarray(types, dtype=object), np.nan).take(type_code)
+
+        cube = cls.__new__(cls)
+        cube.version = version
+        cube.company_names = company_names
+        cube.cube = pd.DataFrame({
+            'Year': pd.array(np.repeat([start.year for start in month_starts], sizes), dtype='Int16'),
+            'Month': pd.array(np.repeat([start.month for start in month_starts], sizes), dtype='Int8'),
+            'DayOfWeek': pd.array(weekday, dtype='Int8'),
+            'ProcessType_Description': type_values,
+            'Status': status_codes.astype(np.int8),
+            'CompanyId': company.astype(np.int32),
+            'Count': np.concatenate([result[1] for result in results]).astype(np.int64) if results else np.array([], dtype=np.int64),
+            'Amount': np.concatenate([result[2] for result in results]) if results else np.array([], dtype=np.float64),
+        })
+        return cube
+
+    @classmethod
+    def combine(cls, cubes, version=None):
+        # One cube over the rows of several, e.g. the chunks of a file still being read.
+        # Company ids are local to each cube, so they are mapped onto the combined names first.
+        names = pd.Index(pd.unique(np.concatenate([cube.company_names.to_numpy(dtype=object) for cube in cubes])))
+        frames = []
+        for cube in cubes:
+            ids = cube.cube['CompanyId'].to_numpy()
+            remap = np.append(names.get_indexer(cube.company_names), -1).astype(np.int32)
+            frames.append(cube.cube.assign(CompanyId=remap.take(ids)))
+
+        combined = cls.__new__(cls)
+        combined.version = version
+        combined.company_names = names
+        combined.cube = (
+            pd.concat(frames, ignore_index=True)
+            .groupby(DIMENSIONS, observed=True, dropna=False)
+            .agg(Count=('Count', 'sum'), Amount=('Amount', 'sum'))
+            .reset_index()
+        )
+        return combined
+
+    @property
+    def nbytes(self):
+        # What the memo charges for the cube: its groups (one per company and key) and the company names
+        return int(self.cube.memory_usage(index=True).sum()) + int(self.company_names.memory_usage(deep=True))
+
+    def slice(self, year=None, status=None, types=None):
+        cube = self.cube
+        mask = np.ones(len(cube), dtype=bool)
+        if year is not None:
+            # One year, or a list of them for comparisons
+            mask &= cube['Year'].isin(np.atleast_1d(year)).to_numpy(dtype=bool, na_value=False)
+        if status is not None:
+            mask &= cube['Status'].isin(np.atleast_1d(status)).to_numpy()
+        if types is not None:
+            mask &= cube['ProcessType_Description'].isin(types).to_numpy()
+        return cube[mask]
+
+    def distinct_companies(self, cube):
+        ids = cube['CompanyId'].to_numpy()
+        ids = ids[ids >= 0]
+        return int(distinct_counts(np.zeros(len(ids), dtype=np.intp), ids, 1, len(self.company_names))[0])
+
+    @instrument
+    def metrics(self, year):
+        cube = self.slice(year=year)
+        status_counts = np.bincount(cube['Status'], weights=cube['Count'], minlength=STATUS_COUNT).astype(np.int64)
+        descriptions = cube['ProcessType_Description'].dropna()
+        return {
+            'total': int(cube['Count'].sum()),
+            'amount': float(cube['Amount'].sum()),
+            'successful': int(status_counts[STATUS_SUCCESSFUL]),
+            'pending': int(status_counts[STATUS_PENDING]),
+            'declined': int(status_counts[STATUS_DECLINED]),
+            'not_declined': int(status_counts[STATUS_SUCCESSFUL] + status_counts[STATUS_PENDING]),
+            'companies': self.distinct_companies(cube),
+            'types': list(pd.unique(descriptions)),
+        }
+
+    @instrument
+    def year_metrics(self, years):
+        # The metrics of several years at once, from one grouped pass over the year key
+        cube = self.slice(year=years)
+        grouped = cube.groupby('Year', observed=True)
+        status_counts = cube.pivot_table(index='Year', columns='Status', values='Count', aggfunc='sum', fill_value=0, observed=True)
+        status_counts = status_counts.reindex(columns=range(STATUS_COUNT), fill_value=0)
+        metrics = pd.DataFrame({
+            'total': grouped['Count'].sum(),
+            'amount': grouped['Amount'].sum(),
+            'successful': status_counts[STATUS_SUCCESSFUL],
+            'pending': status_counts[STATUS_PENDING],
+            'declined': status_counts[STATUS_DECLINED],
+        }).fillna(0)
+        known = cube[cube['CompanyId'] >= 0]
+        year_codes = metrics.index.get_indexer(known['Year'])
+        metrics['companies'] = distinct_counts(year_codes, known['CompanyId'].to_numpy(), len(metrics), len(self.company_names))
+        return year_metrics_frame(metrics)
+
+    @instrument
+    def type_totals(self, years, status=STATUS_SUCCESSFUL):
+        cube = self.slice(year=years, status=status)
+        counts = cube.groupby(['ProcessType_Description', 'Year'], observed=True)['Count'].sum().reset_index()
+        return type_totals_frame(counts, years)
+
+    @instrument
+    def type_summary(self, year, status=STATUS_SUCCESSFUL):
+        cube = self.slice(year=year, status=status)
+        cube = cube[(cube['CompanyId'] >= 0) & cube['ProcessType_Description'].notna()]
+        codes, types = pd.factorize(cube['ProcessType_Description'], sort=True)
+        return pd.DataFrame({
+            'TotalCompanies': distinct_counts(codes, cube['CompanyId'].to_numpy(), len(types), len(self.company_names)),
+            'TotalAmount': np.bincount(codes, weights=cube['Amount'].to_numpy(), minlength=len(types)),
+        }, index=pd.Index(types, name='ProcessType_Description'))
+
+    @instrument
+    def top_companies(self, year, number, status=STATUS_SUCCESSFUL):
+        # Transactions per company id from one bincount, then a partial selection of the largest
+        cube = self.slice(year=year, status=status)
+        cube = cube[cube['CompanyId'] >= 0]
+        counts = np.bincount(cube['CompanyId'], weights=cube['Count'], minlength=len(self.company_names)).astype(np.int64)
+        top = top_k(counts, number)
+        return pd.Series(counts[top], index=self.company_names[top], name='Count')
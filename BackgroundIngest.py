@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import streamlit as st
+
+from AggregateCube import AggregateCube
+from DataProcessing import process_transactions
+from DatasetStore import DEFAULT_YEAR, session_is_active
+from TransactionStatus import STATUS_COUNT
+
+# Uploads parsed at the same time across all sessions; further uploads queue
+INGEST_WORKERS = int(os.environ.get("GAPS_INGEST_WORKERS", 2))
+
+# How often a session waiting on an ingest reruns to pick up newer partial results
+INGEST_REFRESH_SECONDS = 1.0
+
+
+class PartialDataset:
+    # The part of a file read so far, answering the dashboard from a cube of the chunks seen.
+    # It has no version, so nothing derived from it is memoized.
+    def __init__(self, cube, rows):
+        self.aggregate = cube
+        self.rows = rows
+        self.version = None
+
+    def year_options(self):
+        return sorted(int(year) for year in self.aggregate.cube['Year'].dropna().unique())
+
+    def default_year(self):
+        year_options = self.year_options()
+        return DEFAULT_YEAR if DEFAULT_YEAR in year_options else year_options[-1]
+
+    def cube(self):
+        return self.aggregate
+
+    def status_counts(self, selected_year):
+        cube = self.aggregate.slice(year=selected_year)
+        return np.bincount(cube['Status'], weights=cube['Count'], minlength=STATUS_COUNT).astype(np.int64)
+
+
+class IngestJob:
+    # One upload being parsed on a worker thread. Each chunk read is also folded into a small
+    # aggregate cube, so sessions can show partial results long before the full dataset exists.
+    def __init__(self, key, total_bytes):
+        self.key = key
+        self.total_bytes = total_bytes
+        self.sessions = set()
+        self.started = time.monotonic()
+        self.bytes_read = 0
+        self.rows_read = 0
+        self.pending_cubes = []
+        self.cube = None
+        self.cube_rows = 0
+        self.data = None
+        self.error = None
+        self.warnings = []
+        self.date_report = None
+        self.finished = threading.Event()
+        self.lock = threading.Lock()
+
+    def add_chunk(self, chunk, bytes_read):
+        cube = AggregateCube(process_transactions(chunk))
+        with self.lock:
+            self.pending_cubes.append((cube, len(chunk)))
+            self.rows_read += len(chunk)
+            self.bytes_read = bytes_read
+
+    def fraction(self):
+        if not self.total_bytes:
+            return 0.0
+        return min(self.bytes_read / self.total_bytes, 1.0)
+
+    def partial(self):
+        # Chunk cubes are merged only when a session asks, not once per chunk
+        with self.lock:
+            if self.pending_cubes:
+                cubes = [cube for cube, _ in self.pending_cubes]
+                if self.cube is not None:
+                    cubes.insert(0, self.cube)
+                self.cube = AggregateCube.combine(cubes)
+                self.cube_rows += sum(rows for _, rows in self.pending_cubes)
+                self.pending_cubes = []
+            if self.cube is None or not len(self.cube.cube):
+                return None
+            return PartialDataset(self.cube, self.cube_rows)
+
+    def run(self, work):
+        try:
+            self.data = work(self)
+        except Exception as error:
+            self.error = error
+        finally:
+            # The partial cube is not needed once the full dataset exists
+            with self.lock:
+                self.pending_cubes = []
+                self.cube = None
+            self.finished.set()
+
+    def done(self):
+        return self.finished.is_set()
+
+
+class IngestWorkers:
+    # Process-wide pool parsing uploads off the script thread, with one job per dataset key
+    # shared by every session that uploads the same file.
+    def __init__(self, max_workers=INGEST_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gaps-ingest")
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def job(self, session_id, key):
+        # The job already parsing (or holding) `key`, if any, now also followed by this session
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None:
+                job.sessions.add(session_id)
+            return job
+
+    def submit(self, session_id, key, total_bytes, work, store):
+        # Returns the running or finished job for `key`, or None when the dataset is already in the store
+        with self.lock:
+            self.sweep()
+            job = self.jobs.get(key)
+            if job is None:
+                if store.get(key) is not None:
+                    return None
+                job = self.jobs[key] = IngestJob(key, total_bytes)
+                self.executor.submit(job.run, work)
+            job.sessions.add(session_id)
+            return job
+
+    def claim(self, session_id, job, store):
+        # Hands the finished dataset to the store for this session; the job is kept until the
+        # store has it, so sessions checking the store first never start a second parse
+        dataset = store.open(session_id, job.key, lambda: job.data)
+        with self.lock:
+            job.sessions.discard(session_id)
+            if self.jobs.get(job.key) is job:
+                del self.jobs[job.key]
+        return dataset
+
+    def forget(self, job):
+        with self.lock:
+            if self.jobs.get(job.key) is job:
+                del self.jobs[job.key]
+
+    def sweep(self):
+        # Finished jobs nobody is waiting for any more would otherwise hold their data forever
+        for key, job in list(self.jobs.items()):
+            job.sessions = {session_id for session_id in job.sessions if session_is_active(session_id)}
+            if job.done() and not job.sessions:
+                del self.jobs[key]
+
+
+@st.cache_resource
+def get_ingest_workers():
+    return IngestWorkers()
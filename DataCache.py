@@ -0,0 +1,109 @@
+import hashlib
+import os
+
+import pyarrow.feather as feather
+
+from DataProcessing import PROCESSING_VERSION
+
+# Where parsed uploads are kept and how much disk they may use. Both can be set from the environment.
+CACHE_DIR = os.environ.get("GAPS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "gaps_dashboard"))
+CACHE_MAX_BYTES = int(os.environ.get("GAPS_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+
+CACHE_SUFFIX = ".arrow"
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def fingerprint(uploaded_file):
+    # sha256 of the uploaded bytes, read in blocks so no second copy of the file is made
+    digest = hashlib.sha256()
+    buffer = uploaded_file.getbuffer()
+    for start in range(0, len(buffer), HASH_BLOCK_SIZE):
+        digest.update(buffer[start:start + HASH_BLOCK_SIZE])
+    return digest.hexdigest()
+
+
+def file_fingerprint(path):
+    # Same digest for a file on disk, so a dropped export and the same file uploaded share a key
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def dataset_key(digest):
+    # Datasets are keyed by the file's content and the processing version that produced them
+    return f"{digest}-p{PROCESSING_VERSION}"
+
+
+class DataCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, suffix=CACHE_SUFFIX, in_use=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # Other storage backends keep their database files here under their own suffix
+        self.suffix = suffix
+        # Keys of datasets still open, whose files are never removed: SQL datasets reopen theirs on every script thread
+        self.in_use = in_use if in_use is not None else set
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def key(self, path):
+        return os.path.basename(path)[:-len(self.suffix)]
+
+    def get(self, key):
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+
+        # Touch the file so eviction sees it as recently used
+        os.utime(path)
+
+        # Uncompressed Arrow IPC files are memory-mapped, numeric columns come back without a copy
+        table = feather.read_table(path, memory_map=True)
+        return table.to_pandas(split_blocks=True)
+
+    def put(self, key, data):
+        path = self.path(key)
+        tmp_path = path + ".tmp"
+        feather.write_feather(data, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def entries(self):
+        # (path, size, last_used) for every cached dataset, least recently used first
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            stat = os.stat(path)
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        in_use = self.in_use()
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if self.key(path) in in_use:
+                continue
+            os.remove(path)
+            total -= size
+
+    def invalidate(self, key=None):
+        # Drop one dataset, or the whole cache when no key is given
+        if key is not None:
+            paths = [self.path(key)]
+        else:
+            paths = [path for path, _, _ in self.entries()]
+        in_use = self.in_use()
+        for path in paths:
+            if os.path.exists(path) and self.key(path) not in in_use:
+                os.remove(path)
@@ -0,0 +1,125 @@
+import pandas as pd
+
+from Diagnostics import instrument
+from TimeIndex import sort_by_time
+
+PAID_DATE_COLUMN = "PaidDate"
+PAYMENT_DATE_COLUMN = "PaymentDate"
+
+PROCESS_TYPE_MAPPING = pd.DataFrame({
+    'ProcessType': [1, 10, 11, 12, 13, 14, 2, 3, 4, 5, 6, 7, 8, 9],
+    'ProcessType_Description': [
+        "GTB", "CONFIRMCHEQUE", "RTGS", "ATW", "AGENCYBANKING", "AIRTIME",
+        "AUTOPAY", "DRAFT", "NEFT", "NIPS", "CIT", "OWN", "NEFTDEBIT", "DIT"
+    ]
+})
+
+SELECTED_COLUMNS = [
+    'TransID',
+    'BatchID',
+    'VendorName',
+    'VendorBankName',
+    'VendorAcctNumber',
+    'Amount',
+    'Currency',
+    'CustomerAcctNumber',
+    'CompanyName',
+    'PaymentDate',
+    'PaidDate',
+    'ProcessFlag',
+    'ProcessType',
+    'ProcessType_Description',
+    'PaymentDeclined',
+    'PaymentFlag',
+    'Remarks'
+]
+
+# String columns that are dictionary-encoded when they repeat enough
+CATEGORY_COLUMNS = ['VendorName', 'VendorBankName', 'CompanyName', 'Currency', 'ProcessFlag', 'ProcessType_Description', 'Remarks']
+# Encode only when there are at most this many distinct values per row
+CATEGORY_MAX_RATIO = 0.5
+
+INTEGER_COLUMNS = ['ProcessType']
+FLAG_COLUMNS = ['PaymentDeclined', 'PaymentFlag']
+
+
+# Bump when the processed layout changes so stale on-disk cache entries are not reused
+PROCESSING_VERSION = 2
+
+
+@instrument
+def process_transactions(raw_data):
+    # Look the description up instead of merging, and build the frame from the existing
+    # columns without copying them, so the result shares memory with raw_data
+    descriptions = dict(zip(PROCESS_TYPE_MAPPING['ProcessType'], PROCESS_TYPE_MAPPING['ProcessType_Description']))
+    columns = {column: raw_data[column] for column in SELECTED_COLUMNS if column != 'ProcessType_Description'}
+    columns['ProcessType_Description'] = raw_data['ProcessType'].map(descriptions)
+    processed_data = pd.DataFrame({column: columns[column] for column in SELECTED_COLUMNS}, copy=False)
+
+    # Remove records with PaidDate of null
+    # processed_data = processed_data.dropna(subset=[PAID_DATE_COLUMN])
+
+    return processed_data
+
+
+@instrument
+def prepare_dataset(raw_data):
+    processed_data = process_transactions(raw_data)
+
+    # Dictionary-encode the repeated strings and shrink the flag columns
+    optimized_data = optimize_dtypes(processed_data)
+    memory_report(processed_data, optimized_data)
+
+    # Sorted once by PaymentDate so year and date-range selections are positional slices
+    return sort_by_time(optimized_data, PAYMENT_DATE_COLUMN)
+
+
+def downcast_integers(values):
+    if values.isna().any():
+        return values
+    return pd.to_numeric(values.astype('int64'), downcast='integer')
+
+
+@instrument
+def optimize_dtypes(data):
+    data = data.copy(deep=False)
+
+    for column in CATEGORY_COLUMNS:
+        if column not in data or isinstance(data[column].dtype, pd.CategoricalDtype):
+            continue
+        if data[column].nunique() <= CATEGORY_MAX_RATIO * len(data):
+            data[column] = data[column].astype('category')
+
+    for column in INTEGER_COLUMNS:
+        if column in data:
+            data[column] = downcast_integers(data[column])
+
+    for column in FLAG_COLUMNS:
+        if column not in data:
+            continue
+        values = data[column]
+        if not values.isna().any() and values.isin([0, 1]).all():
+            data[column] = values.astype('bool')
+        else:
+            data[column] = downcast_integers(values)
+
+    return data
+
+
+def memory_report(before, after):
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'dtype_after': after.dtypes.astype(str),
+        'mb_before': before.memory_usage(deep=True, index=False) / 1024 ** 2,
+        'mb_after': after.memory_usage(deep=True, index=False) / 1024 ** 2,
+    })
+
+    total_before = report['mb_before'].sum()
+    total_after = report['mb_after'].sum()
+    saved = (1 - total_after / total_before) * 100 if total_before else 0
+
+    print("Processed data memory usage")
+    print(report.round(2).to_string())
+    print(f"Total: {total_before:,.1f} MB -> {total_after:,.1f} MB ({saved:.0f}% smaller)")
+
+    return report
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from Diagnostics import instrument
+from Memo import memoize
+
+PAGE_SIZES = [25, 50, 100, 500]
+
+
+@memoize
+def sort_order(data, column):
+    # Row positions of `data` ordered by `column` (stable, missing values last); computed once per frame and column
+    values = data[column].reset_index(drop=True)
+    if isinstance(values.dtype, pd.CategoricalDtype) and not values.cat.categories.is_monotonic_increasing:
+        # Appended categories sit after the original ones; sort by category value, not position
+        values = values.cat.reorder_categories(values.cat.categories.sort_values())
+    return values.sort_values(kind='stable', na_position='last').index.to_numpy()
+
+
+@memoize
+def filter_mask(data, column, text):
+    values = data[column]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Match against the categories once and map the result through the codes
+        matches = values.cat.categories.astype(str).str.contains(text, case=False, regex=False)
+        codes = values.cat.codes.to_numpy()
+        return np.where(codes >= 0, np.append(matches, False).take(codes), False)
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        number = pd.to_numeric(text, errors='coerce')
+        return np.asarray((values == number).fillna(False), dtype=bool) if not np.isnan(number) else np.zeros(len(values), dtype=bool)
+    return np.asarray(values.astype(str).str.contains(text, case=False, regex=False).fillna(False), dtype=bool)
+
+
+@instrument
+def paged_table(source, key):
+    # Table that sorts, filters and pages on the server and only sends the visible page to the browser.
+    # `source` is a DataFrame (or SqlTable) or a callable returning one, evaluated only when the table is drawn.
+    data = source() if callable(source) else source
+    columns = list(data.columns)
+
+    col1, col2, col3, col4 = st.columns([2, 2, 2, 1])
+    with col1:
+        sort_column = st.selectbox("Sort by", ["(none)"] + columns, key=f"{key}_sort")
+    with col2:
+        filter_column = st.selectbox("Filter column", ["(none)"] + columns, key=f"{key}_filter_column")
+    with col3:
+        filter_text = st.text_input("Filter value", key=f"{key}_filter_text", disabled=filter_column == "(none)")
+    with col4:
+        descending = st.checkbox("Descending", key=f"{key}_descending")
+
+    filtering = filter_column != "(none)" and bool(filter_text)
+    if hasattr(data, 'page'):
+        # Tables kept in a database (SqlTable) count, sort and filter with queries instead
+        total_rows = data.count(filter_column, filter_text) if filtering else len(data)
+    else:
+        if sort_column != "(none)":
+            order = sort_order(data, sort_column)
+            if descending:
+                order = order[::-1]
+        else:
+            order = np.arange(len(data))
+
+        if filtering:
+            order = order[filter_mask(data, filter_column, filter_text)[order]]
+
+        total_rows = len(order)
+    col1, col2, col3 = st.columns([1, 1, 4])
+    with col1:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_page_size")
+    page_count = max((total_rows + page_size - 1) // page_size, 1)
+    # A filter can leave fewer pages than the one currently selected
+    if st.session_state.get(f"{key}_page", 1) > page_count:
+        st.session_state[f"{key}_page"] = page_count
+    with col2:
+        page = st.number_input("Page", min_value=1, max_value=page_count, step=1, key=f"{key}_page")
+    with col3:
+        st.write(f"{total_rows:,} rows, page {page} of {page_count:,}")
+
+    start = (page - 1) * page_size
+    if hasattr(data, 'page'):
+        rows = data.page(
+            sort_column if sort_column != "(none)" else None, descending,
+            filter_column if filtering else None, filter_text, start, page_size,
+        )
+    else:
+        rows = data.take(order[start:start + page_size])
+    st.dataframe(rows, use_container_width=True)
@@ -0,0 +1,209 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from AggregateCube import AggregateCube
+from DataProcessing import PAYMENT_DATE_COLUMN
+from Diagnostics import instrument
+from Memo import memo, set_version
+from ParallelAgg import PARALLEL_MIN_ROWS, PARALLEL_WORKERS, month_partitions
+from TimeBuckets import bucket_totals
+from TimeIndex import TimeIndex, sort_by_time
+from TransactionStatus import DECLINED, NOT_DECLINED, STATUS_COUNT, SUCCESSFUL, StatusView, transaction_status
+from WeekdayHours import WeekdayHours, type_codes, weekday_hour_counts
+
+DEFAULT_YEAR = 2022
+
+
+def current_session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "bare"
+
+
+def session_is_active(session_id):
+    # Outside a running server (bare mode, AppTest) every session counts as active
+    if not runtime.exists():
+        return True
+    return runtime.get_instance().is_active_session(session_id)
+
+
+class Dataset:
+    # One processed dataset shared read-only by every session that opened the same file.
+    # Derived frames go through the process-wide memo, keyed by the dataset key and their parameters.
+    def __init__(self, key, data):
+        self.key = key
+        self.version = key
+        self.data = set_version(sort_by_time(data, PAYMENT_DATE_COLUMN), key)
+        self.time_index = TimeIndex(self.data[PAYMENT_DATE_COLUMN])
+
+    def derive(self, name, *params, build):
+        return memo.get_or_build((self.key, name) + params, build)
+
+    def year_options(self):
+        return self.time_index.year_options()
+
+    def default_year(self):
+        year_options = self.year_options()
+        return DEFAULT_YEAR if DEFAULT_YEAR in year_options else year_options[-1]
+
+    @instrument
+    def cube(self):
+        # Rows are date-sorted, so the cube is counted month by month; large datasets use every core
+        workers = PARALLEL_WORKERS if len(self.data) >= PARALLEL_MIN_ROWS else 1
+        return self.derive('cube', build=lambda: AggregateCube.partitioned(
+            self.data, version=(self.key, 'cube'), status=self.status(), workers=workers,
+        ))
+
+    @instrument
+    def year(self, selected_year):
+        # Positional slice of the date-sorted frame: a view, no scan and no copy
+        start, stop = self.time_index.year_bounds(selected_year)
+        return self.versioned(self.data.iloc[start:stop], 'year', selected_year)
+
+    @instrument
+    def date_range(self, start, end):
+        start, stop = self.time_index.range_bounds(start, end)
+        return self.versioned(self.data.iloc[start:stop], 'rows', start, stop)
+
+    def versioned(self, frame, *params):
+        return set_version(frame, (self.key,) + params)
+
+    def trans_ids(self):
+        # Hash index over TransID, built on first use; appends look their rows up in it
+        return self.derive('trans_ids', build=lambda: pd.Index(self.data['TransID'].to_numpy()))
+
+    @instrument
+    def status(self):
+        # Status code per row of the whole dataset, computed in one pass
+        return self.derive('status', build=lambda: transaction_status(self.data))
+
+    @instrument
+    def status_counts(self, selected_year):
+        # Rows per status code in the year, from a single bincount
+        def build():
+            start, stop = self.time_index.year_bounds(selected_year)
+            return np.bincount(self.status()[start:stop], minlength=STATUS_COUNT)
+
+        return self.derive('status_counts', selected_year, build=build)
+
+    @instrument
+    def weekday_hours(self, selected_year, column):
+        # Successful transactions of the year by type, weekday and hour of `column`; only the
+        # two columns needed are gathered for the year's rows
+        def build():
+            positions = self.successful(selected_year).positions()
+            codes, types = type_codes(self.data['ProcessType_Description'])
+            dates = self.data[column].to_numpy()[positions]
+            partitions, workers = self.partitioning(positions)
+            return WeekdayHours(types, weekday_hour_counts(codes[positions], len(types), dates, partitions, workers))
+
+        return self.derive('weekday_hours', selected_year, column, build=build)
+
+    @instrument
+    def time_buckets(self, selected_year, bucket):
+        # Successful transactions of the year per day, week, month or quarter and type, over every
+        # bucket from the year's first transaction to its last
+        def build():
+            start, stop = self.time_index.year_bounds(selected_year)
+            positions = self.successful(selected_year).positions()
+            dates = self.data[PAYMENT_DATE_COLUMN].to_numpy()
+            codes, types = type_codes(self.data['ProcessType_Description'])
+            # Rows are date-sorted, so the year's first and last transactions bound its slice
+            span = dates[[start, stop - 1]]
+            partitions, workers = self.partitioning(positions)
+            return bucket_totals(
+                bucket, span, dates[positions], codes[positions], types, self.data['Amount'].to_numpy()[positions],
+                partitions=partitions, workers=workers,
+            )
+
+        return self.derive('time_buckets', selected_year, bucket, build=build)
+
+    def partitioning(self, positions):
+        # Month slices of the given (date-sorted) rows and the pool size to count them with, like the cube's.
+        # Fewer than PARALLEL_MIN_ROWS rows are counted in one pass in the calling thread.
+        if len(positions) < PARALLEL_MIN_ROWS or PARALLEL_WORKERS <= 1:
+            return None, 1
+        return month_partitions(self.data[PAYMENT_DATE_COLUMN].to_numpy()[positions]), PARALLEL_WORKERS
+
+    def successful(self, selected_year):
+        return StatusView(self, selected_year, 'successful', SUCCESSFUL)
+
+    def declined(self, selected_year):
+        return StatusView(self, selected_year, 'declined', DECLINED)
+
+    def not_declined(self, selected_year):
+        return StatusView(self, selected_year, 'not_declined', NOT_DECLINED)
+
+
+class DatasetStore:
+    # Process-wide registry of datasets keyed by content fingerprint. Sessions only keep the key;
+    # a dataset is dropped once no live session refers to it, unless it is pinned.
+    def __init__(self):
+        self.datasets = {}
+        self.sessions = {}
+        self.pinned = set()
+        self.building = {}
+        self.lock = threading.RLock()
+
+    def get(self, key):
+        with self.lock:
+            return self.datasets.get(key)
+
+    def keys(self):
+        with self.lock:
+            return set(self.datasets)
+
+    def open(self, session_id, key, build):
+        # Build outside the registry lock so other sessions are not blocked; a per-key lock
+        # makes sessions opening the same file at once wait for a single build.
+        with self.lock:
+            building = self.building.setdefault(key, threading.Lock())
+
+        with building:
+            with self.lock:
+                dataset = self.datasets.get(key)
+            if dataset is None:
+                # Builders return the processed rows, or a dataset they have already prepared
+                dataset = build()
+                if isinstance(dataset, pd.DataFrame):
+                    dataset = Dataset(key, dataset)
+
+            with self.lock:
+                dataset = self.datasets.setdefault(key, dataset)
+                self.building.pop(key, None)
+                self.sessions[session_id] = key
+                self.sweep()
+        return dataset
+
+    def release(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+            self.sweep()
+
+    def pin(self, key):
+        # Pinned datasets (e.g. the data folder's) stay loaded with no session on them
+        with self.lock:
+            self.pinned.add(key)
+
+    def unpin(self, key):
+        with self.lock:
+            self.pinned.discard(key)
+            self.sweep()
+
+    def sweep(self):
+        with self.lock:
+            for session_id in [session_id for session_id in self.sessions if not session_is_active(session_id)]:
+                del self.sessions[session_id]
+            in_use = set(self.sessions.values()) | self.pinned
+            for key in [key for key in self.datasets if key not in in_use]:
+                del self.datasets[key]
+                memo.invalidate(key)
+
+
+@st.cache_resource
+def get_dataset_store():
+    return DatasetStore()
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+# Shape signatures (digit runs -> '0', letter runs -> 'a') of the date layouts seen in GAPS exports,
+# mapped to the fixed format that parses them. Slash dates are month first, like format='mixed'.
+SIGNATURE_FORMATS = {
+    '0-0-0': '%Y-%m-%d',
+    '0-0-0 0:0': '%Y-%m-%d %H:%M',
+    '0-0-0 0:0:0': '%Y-%m-%d %H:%M:%S',
+    '0-0-0 0:0:0.0': '%Y-%m-%d %H:%M:%S.%f',
+    '0-0-0a0:0:0': '%Y-%m-%dT%H:%M:%S',
+    '0-0-0a0:0:0.0': '%Y-%m-%dT%H:%M:%S.%f',
+    '0/0/0': '%m/%d/%Y',
+    '0/0/0 0:0': '%m/%d/%Y %H:%M',
+    '0/0/0 0:0:0': '%m/%d/%Y %H:%M:%S',
+    '0/0/0 0:0 a': '%m/%d/%Y %I:%M %p',
+    '0/0/0 0:0:0 a': '%m/%d/%Y %I:%M:%S %p',
+}
+
+# How many unparseable values to keep as examples in the report
+SAMPLE_SIZE = 5
+
+
+def date_signatures(values):
+    return (
+        values.str.replace(r'\d+', '0', regex=True)
+        .str.replace(r'[A-Za-z]+', 'a', regex=True)
+    )
+
+
+def parse_dates(column, formats=SIGNATURE_FORMATS):
+    # Parse each distinct string once, grouped by layout, then broadcast back to the rows.
+    # Returns the parsed column and a report of the formats used and the values that failed.
+    codes, uniques = pd.factorize(column, use_na_sentinel=True)
+    uniques = pd.Series(uniques, dtype='str').str.strip()
+
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[us]')
+    signatures = date_signatures(uniques)
+    formats_used = {}
+
+    for signature, positions in signatures.groupby(signatures, sort=False).groups.items():
+        date_format = formats.get(signature)
+        if date_format is None:
+            continue
+        parsed[positions] = pd.to_datetime(uniques[positions], format=date_format, errors='coerce')
+        formats_used[date_format] = int(parsed[positions].notna().sum())
+
+    # Layouts we have no fixed format for fall back to the per-value parser, only for the leftover uniques
+    leftover = parsed.isna() & (uniques != '')
+    if leftover.any():
+        parsed[leftover] = pd.to_datetime(uniques[leftover], format='mixed', errors='coerce')
+        formats_used['mixed'] = int(parsed[leftover].notna().sum())
+
+    failed = parsed.isna() & (uniques != '')
+    failed_rows = int(np.isin(codes, np.flatnonzero(failed)).sum()) if failed.any() else 0
+    report = {
+        'unique_values': len(uniques),
+        'formats': formats_used,
+        'unparseable_values': int(failed.sum()),
+        'unparseable_rows': failed_rows,
+        'unparseable_samples': uniques[failed].head(SAMPLE_SIZE).tolist(),
+    }
+
+    result = parsed.to_numpy().take(codes)
+    result[codes == -1] = np.datetime64('NaT')
+    return pd.Series(result, index=column.index, name=column.name), report
+
+
+def merge_reports(reports):
+    # Combine the per-chunk reports produced while streaming a file
+    merged = {'unique_values': 0, 'formats': {}, 'unparseable_values': 0, 'unparseable_rows': 0, 'unparseable_samples': []}
+    for report in reports:
+        merged['unique_values'] += report['unique_values']
+        merged['unparseable_values'] += report['unparseable_values']
+        merged['unparseable_rows'] += report['unparseable_rows']
+        for date_format, count in report['formats'].items():
+            merged['formats'][date_format] = merged['formats'].get(date_format, 0) + count
+        room = SAMPLE_SIZE - len(merged['unparseable_samples'])
+        merged['unparseable_samples'].extend(report['unparseable_samples'][:room])
+    return merged
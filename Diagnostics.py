@@ -0,0 +1,268 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from Memo import memo
+
+# Recording is off unless switched on here or from the sidebar panel; GAPS_DIAGNOSTICS=memory also traces allocations
+DIAGNOSTICS_ENABLED = os.environ.get("GAPS_DIAGNOSTICS", "").lower() in ("1", "true", "yes", "memory")
+DIAGNOSTICS_MEMORY = os.environ.get("GAPS_DIAGNOSTICS", "").lower() == "memory"
+
+# Records kept per session
+MAX_RECORDS = 500
+
+# Per script-run thread: whether recording is on, and the stack of open stages
+state = threading.local()
+
+
+def is_enabled():
+    return getattr(state, 'enabled', DIAGNOSTICS_ENABLED)
+
+
+def session_id():
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else "bare"
+
+
+def row_count(value):
+    # Rows of frames, arrays and the objects wrapping them; None for anything else
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(value)
+    frame = getattr(value, 'data', None)
+    if isinstance(frame, pd.DataFrame):
+        return len(frame)
+    frame = getattr(value, 'cube', None)
+    if isinstance(frame, pd.DataFrame):
+        return len(frame)
+    return None
+
+
+def rows_of(args):
+    counts = [row_count(arg) for arg in args]
+    counts = [count for count in counts if count is not None]
+    return sum(counts) if counts else None
+
+
+class Stage:
+    # Context manager recording one pipeline step: wall time, allocation peak above the level at entry
+    # (when tracemalloc runs), rows in and out, and the memo hits and misses during the step
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+
+    def __enter__(self):
+        self.stack = getattr(state, 'stack', None)
+        if self.stack is None:
+            self.stack = state.stack = []
+        self.tracing = tracemalloc.is_tracing()
+        if self.tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.stack:
+                # Resetting the peak below would hide what the enclosing stage reached so far
+                parent = self.stack[-1]
+                parent.peak_floor = max(parent.peak_floor, peak)
+            self.start_bytes = current
+            self.peak_floor = current
+            tracemalloc.reset_peak()
+        self.stack.append(self)
+        self.hits, self.misses = memo.hits, memo.misses
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        self.stack.pop()
+        peak_bytes = None
+        if self.tracing and tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1], self.peak_floor)
+            peak_bytes = peak - self.start_bytes
+            if self.stack:
+                self.stack[-1].peak_floor = max(self.stack[-1].peak_floor, peak)
+        # Memo counters are process-wide, so concurrent sessions can add to these
+        diagnostics.add({
+            'stage': self.name,
+            'session': session_id(),
+            'depth': len(self.stack),
+            'started': time.time() - seconds,
+            'seconds': seconds,
+            'peak_bytes': peak_bytes,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'memo_hits': memo.hits - self.hits,
+            'memo_misses': memo.misses - self.misses,
+            'error': exc_info[0].__name__ if exc_info[0] is not None else None,
+        })
+        return False
+
+
+class NullStage:
+    rows_out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+null_stage = NullStage()
+
+
+def stage(name, rows_in=None):
+    return Stage(name, rows_in) if is_enabled() else null_stage
+
+
+def instrument(function=None, name=None):
+    # Records every call of the decorated pipeline function; a single flag check when recording is off
+    if function is None:
+        return functools.partial(instrument, name=name)
+    stage_name = name or function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not is_enabled():
+            return function(*args, **kwargs)
+        with Stage(stage_name, rows_of(args)) as record:
+            result = function(*args, **kwargs)
+            record.rows_out = row_count(result)
+        return result
+
+    return wrapper
+
+
+class Diagnostics:
+    # Process-wide store of stage records: the latest records of each session, and running totals per stage
+    def __init__(self):
+        self.records = {}
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    def add(self, record):
+        with self.lock:
+            self.records.setdefault(record['session'], deque(maxlen=MAX_RECORDS)).append(record)
+            totals = self.totals.setdefault(record['stage'], {
+                'calls': 0, 'errors': 0, 'seconds': 0.0, 'rows_in': 0, 'rows_out': 0,
+                'memo_hits': 0, 'memo_misses': 0, 'peak_bytes': 0,
+            })
+            totals['calls'] += 1
+            totals['errors'] += record['error'] is not None
+            totals['seconds'] += record['seconds']
+            totals['rows_in'] += record['rows_in'] or 0
+            totals['rows_out'] += record['rows_out'] or 0
+            totals['memo_hits'] += record['memo_hits']
+            totals['memo_misses'] += record['memo_misses']
+            totals['peak_bytes'] = max(totals['peak_bytes'], record['peak_bytes'] or 0)
+
+    def start_run(self, session):
+        # Each rerun starts a fresh list, so the panel shows what the last run did
+        with self.lock:
+            self.records.pop(session, None)
+
+    def session_records(self, session):
+        with self.lock:
+            return list(self.records.get(session, ()))
+
+    def to_json(self, session=None):
+        with self.lock:
+            totals = {name: dict(values) for name, values in self.totals.items()}
+        return json.dumps({
+            'session': session,
+            'records': self.session_records(session) if session is not None else [],
+            'totals': totals,
+            'memo': memo.stats(),
+        }, indent=2, default=str)
+
+    def to_prometheus(self):
+        with self.lock:
+            totals = {name: dict(values) for name, values in self.totals.items()}
+        metrics = [
+            ('gaps_stage_calls_total', 'counter', 'Calls of each pipeline stage', 'calls'),
+            ('gaps_stage_errors_total', 'counter', 'Calls of each pipeline stage that raised', 'errors'),
+            ('gaps_stage_seconds_total', 'counter', 'Wall time spent in each pipeline stage', 'seconds'),
+            ('gaps_stage_rows_in_total', 'counter', 'Input rows seen by each pipeline stage', 'rows_in'),
+            ('gaps_stage_rows_out_total', 'counter', 'Output rows produced by each pipeline stage', 'rows_out'),
+            ('gaps_stage_memo_hits_total', 'counter', 'Memo hits during each pipeline stage', 'memo_hits'),
+            ('gaps_stage_memo_misses_total', 'counter', 'Memo misses during each pipeline stage', 'memo_misses'),
+            ('gaps_stage_peak_bytes', 'gauge', 'Largest allocation peak of each pipeline stage', 'peak_bytes'),
+        ]
+        lines = []
+        for metric, kind, description, field in metrics:
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, values in sorted(totals.items()):
+                label = name.replace('\\', '\\\\').replace('"', '\\"')
+                lines.append(f'{metric}{{stage="{label}"}} {values[field]}')
+
+        stats = memo.stats()
+        for field, kind in [('hits', 'counter'), ('misses', 'counter'), ('evictions', 'counter'), ('entries', 'gauge'), ('bytes', 'gauge')]:
+            metric = f"gaps_memo_{field}" + ("_total" if kind == 'counter' else "")
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric} {stats[field]}")
+        return "\n".join(lines) + "\n"
+
+
+diagnostics = Diagnostics()
+
+
+def set_memory_tracing(enabled):
+    # tracemalloc is process-wide and slows every allocation down, so it only runs while asked for
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def start_run():
+    # Called once at the top of every script run, before any instrumented code
+    enabled = st.session_state.get('diagnostics_enabled', DIAGNOSTICS_ENABLED)
+    state.enabled = enabled
+    state.stack = []
+    if enabled:
+        set_memory_tracing(st.session_state.get('diagnostics_memory', DIAGNOSTICS_MEMORY))
+        diagnostics.start_run(session_id())
+
+
+def diagnostics_panel():
+    # Collapsible sidebar panel with the stages of the last run; drawn at the end of the script
+    with st.sidebar.expander("Diagnostics", expanded=False):
+        enabled = st.toggle("Record pipeline timings", value=DIAGNOSTICS_ENABLED, key='diagnostics_enabled')
+        st.toggle("Track peak memory", value=DIAGNOSTICS_MEMORY, key='diagnostics_memory', disabled=not enabled)
+        if not enabled:
+            st.caption("Recording is off. Switch it on and interact with the page to see where the time goes.")
+            return
+
+        session = session_id()
+        records = diagnostics.session_records(session)
+        if records:
+            # Records are added as stages finish; start order puts each stage above the ones it called
+            table = pd.DataFrame(records).sort_values('started', kind='stable')
+            table['rows_in'] = table['rows_in'].astype('Int64')
+            table['rows_out'] = table['rows_out'].astype('Int64')
+            table['stage'] = ['· ' * depth + name for depth, name in zip(table['depth'], table['stage'])]
+            table['ms'] = (table['seconds'] * 1000).round(1)
+            table['peak MB'] = (table['peak_bytes'].astype(float) / 1024 ** 2).round(2)
+            table['memo'] = table['memo_hits'].astype(str) + '/' + table['memo_misses'].astype(str)
+            st.dataframe(
+                table[['stage', 'ms', 'peak MB', 'rows_in', 'rows_out', 'memo']],
+                hide_index=True, use_container_width=True,
+            )
+            top_level = sum(record['seconds'] for record in records if record['depth'] == 0)
+            st.caption(f"{len(records)} stage calls, {top_level * 1000:,.0f} ms at top level. Memo is hits/misses.")
+        else:
+            st.caption("No instrumented stage ran in the last rerun.")
+
+        stats = memo.stats()
+        st.caption(f"Memo: {stats['entries']} entries, {stats['bytes'] / 1024 ** 2:,.1f} MB, hit rate {stats['hit_rate']:.0%}")
+
+        st.download_button("Export JSON", diagnostics.to_json(session), file_name="gaps_diagnostics.json", mime="application/json")
+        st.download_button("Export Prometheus", diagnostics.to_prometheus(), file_name="gaps_diagnostics.prom", mime="text/plain")
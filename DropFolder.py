@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+
+from DataCache import dataset_key, file_fingerprint
+from Diagnostics import stage
+from Pipeline import pipeline
+
+# Folder the server watches for exports; no folder is watched unless it is set
+DATA_DIR = os.environ.get("GAPS_DATA_DIR")
+# How often the folder is listed for new or changed files
+DROP_POLL_SECONDS = float(os.environ.get("GAPS_DROP_POLL_SECONDS", 5))
+DROP_SUFFIX = ".csv"
+
+# Session the folder's ingests and datasets are registered under; it never has a script run
+FOLDER_SESSION = "data-folder"
+# Companies the dashboard shows by default, prewarmed so its first chart comes from the memo
+PREWARM_TOP_COMPANIES = 4
+
+WAITING = 'waiting'
+INGESTING = 'ingesting'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class FolderFile:
+    # One export in the folder, as of its last size and modification time
+    def __init__(self, path, size, mtime):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.size = size
+        self.mtime = mtime
+        self.key = None
+        self.state = WAITING
+        self.error = None
+        self.seconds = None
+
+    @property
+    def file_id(self):
+        # Sessions track their source by id; folder files by content, like uploads
+        return f"folder:{self.key}"
+
+
+def prewarm(dataset):
+    # Build what a session's first script run reads for the default year: the year slice, the
+    # status counts and the aggregates of every page, so first charts come straight from the memo
+    year = dataset.default_year()
+    pipeline.get(dataset, 'year', year=year)
+    status_counts = pipeline.get(dataset, 'status_counts', year=year)
+    metrics = pipeline.get(dataset, 'metrics', year=year)
+    pipeline.get(dataset, 'type_summary', year=year)
+    if status_counts.sum():
+        pipeline.get(dataset, 'top_companies', year=year, number=min(PREWARM_TOP_COMPANIES, metrics['companies']))
+    pipeline.get(dataset, 'type_by_month', years=[year])
+    pipeline.get(dataset, 'quarterly', year=year)
+    pipeline.get(dataset, 'weekday_pivot', year=year)
+    pipeline.get(dataset, 'paid_hours', year=year)
+
+
+class DropFolder:
+    # Watches the data folder and ingests every export dropped there, on the shared ingest workers,
+    # into the shared store. Folder datasets are pinned and prewarmed, so sessions open them warm.
+    # A file still being copied is picked up once its size and modification time hold still for a poll.
+    def __init__(self, directory, loader, store, workers, poll_seconds=DROP_POLL_SECONDS):
+        self.directory = directory
+        self.loader = loader
+        self.store = store
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.files = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.watch, name="gaps-drop-folder", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def watch(self):
+        while not self.stopped.is_set():
+            try:
+                self.scan()
+            except OSError:
+                # The folder may be missing or unmounted for a while; try again on the next poll
+                pass
+            self.stopped.wait(self.poll_seconds)
+
+    def scan(self):
+        # One poll: note new and changed files, load the ones that held still, forget removed ones
+        found = {}
+        for name in sorted(os.listdir(self.directory)):
+            if name.lower().endswith(DROP_SUFFIX):
+                path = os.path.join(self.directory, name)
+                found[path] = os.stat(path)
+
+        settled = []
+        with self.lock:
+            for path in [path for path in self.files if path not in found]:
+                self.release(self.files.pop(path))
+            for path, stat in found.items():
+                entry = self.files.get(path)
+                if entry is None or (entry.size, entry.mtime) != (stat.st_size, stat.st_mtime):
+                    if entry is not None:
+                        self.release(entry)
+                    entry = self.files[path] = FolderFile(path, stat.st_size, stat.st_mtime)
+                    # Files older than a poll (e.g. there before the server started) are not being written
+                    if time.time() - stat.st_mtime < self.poll_seconds:
+                        continue
+                if entry.state == WAITING:
+                    settled.append(entry)
+
+        for entry in settled:
+            self.load(entry)
+
+    def release(self, entry):
+        # A removed or replaced file's dataset stays pinned only while another folder file has the same content
+        if entry.key is not None and not any(other.key == entry.key for other in self.files.values() if other is not entry):
+            self.store.unpin(entry.key)
+
+    def load(self, entry):
+        start = time.perf_counter()
+        try:
+            entry.key = dataset_key(file_fingerprint(entry.path))
+            # Pinned before it is opened, so the store never drops it for having no live session
+            self.store.pin(entry.key)
+            entry.state = INGESTING
+            dataset = self.open(entry)
+            with stage("prewarm"):
+                prewarm(dataset)
+        except Exception as error:
+            entry.state = FAILED
+            entry.error = error
+            with self.lock:
+                self.release(entry)
+            return
+        entry.seconds = time.perf_counter() - start
+        entry.state = READY
+
+    def open(self, entry):
+        key = entry.key
+        dataset = self.store.get(key)
+        if dataset is not None:
+            return dataset
+
+        job = self.workers.job(FOLDER_SESSION, key)
+        if job is None and not self.loader.is_cached(key):
+            job = self.workers.submit(FOLDER_SESSION, key, entry.size, lambda job: self.ingest(job, entry.path), self.store)
+        if job is not None:
+            # Sessions opening the file meanwhile follow this same job and see its partial results
+            job.finished.wait()
+            if job.error is not None:
+                self.workers.forget(job)
+                raise job.error
+            return self.workers.claim(FOLDER_SESSION, job, self.store)
+        return self.store.open(FOLDER_SESSION, key, lambda: self.loader.open_cached(key))
+
+    def ingest(self, job, path):
+        with open(path, 'rb') as source:
+            return self.loader.ingest(job, source)
+
+    def available(self):
+        # Files sessions can open, newest first: ready ones and ones still being ingested
+        with self.lock:
+            entries = [entry for entry in self.files.values() if entry.state in (INGESTING, READY)]
+        return sorted(entries, key=lambda entry: entry.mtime, reverse=True)
+
+    def ready(self):
+        # Files already parsed and prewarmed, newest first
+        return [entry for entry in self.available() if entry.state == READY]
+
+    def failed(self):
+        with self.lock:
+            return [entry for entry in self.files.values() if entry.state == FAILED]
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+
+from Diagnostics import stage
+from Memo import memo, version_token
+
+# Roughly the widest chart on the page in pixels; longer series are downsampled to this many points
+MAX_POINTS = 1200
+
+
+def numeric_x(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(float)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=float)
+    # Categorical or string x values ('YYYY-MM' months) are evenly spaced
+    return np.arange(len(values), dtype=float)
+
+
+def lttb_indices(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: keeps the first and last point and, per bucket, the point
+    # forming the largest triangle with the previous pick and the next bucket's mean
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    picked = np.empty(threshold, dtype=np.int64)
+    picked[0] = 0
+    previous = 0
+    for bucket in range(threshold - 2):
+        next_start = int((bucket + 1) * every) + 1
+        next_stop = min(int((bucket + 2) * every) + 1, n)
+        next_x = x[next_start:next_stop].mean()
+        next_y = y[next_start:next_stop].mean()
+
+        start = int(bucket * every) + 1
+        stop = int((bucket + 1) * every) + 1
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        picked[bucket + 1] = previous
+    picked[-1] = n - 1
+    return picked
+
+
+def minmax_indices(y, threshold):
+    # Keeps the smallest and largest value of each bucket, so peaks survive
+    n = len(y)
+    if threshold >= n:
+        return np.arange(n)
+    buckets = max(threshold // 2, 1)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    picked = []
+    for start, stop in zip(edges[:-1], edges[1:]):
+        if stop > start:
+            window = y[start:stop]
+            picked.extend([start + int(np.argmin(window)), start + int(np.argmax(window))])
+    return np.unique(picked)
+
+
+def downsample_frame(frame, x, y, group=None, max_points=MAX_POINTS, method='lttb'):
+    # Downsample each series (one per `group` value) of a long-format frame that is sorted by x.
+    # x=None uses the index as the x axis.
+    if group is None:
+        groups = [np.arange(len(frame))]
+    else:
+        groups = [positions for positions in frame.groupby(group, observed=True, sort=False).indices.values()]
+
+    keep = []
+    for positions in groups:
+        if len(positions) <= max_points:
+            keep.append(positions)
+            continue
+        series = frame.iloc[positions]
+        y_values = series[y].to_numpy(dtype=float)
+        if method == 'minmax':
+            picked = minmax_indices(y_values, max_points)
+        else:
+            x_values = series.index.to_series() if x is None else series[x]
+            picked = lttb_indices(numeric_x(x_values), y_values, max_points)
+        keep.append(positions[picked])
+
+    if sum(len(positions) for positions in keep) == len(frame):
+        return frame
+    return frame.iloc[np.sort(np.concatenate(keep))]
+
+
+def cached_figure(build, data, **options):
+    # Figures are stored as Plotly JSON, keyed by the builder, the version of its input and the options
+    with stage(f"figure {build.__qualname__}", rows_in=len(data)):
+        token = version_token(data)
+        if token is None:
+            return build(data, **options)
+        key = ('figure', build.__code__.co_filename, build.__qualname__, token, tuple(sorted(options.items())))
+        spec = memo.get_or_build(key, lambda: build(data, **options).to_json())
+        return pio.from_json(spec)
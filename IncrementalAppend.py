@@ -0,0 +1,99 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from AggregateCube import AggregateCube
+from DataProcessing import PAYMENT_DATE_COLUMN, PROCESSING_VERSION
+from DatasetStore import Dataset
+from Diagnostics import instrument
+from TransactionStatus import transaction_status
+
+
+def appended_key(key, delta_fingerprint):
+    # The same base file with the same delta appended always gets the same key
+    digest = hashlib.sha256(f"{key}+{delta_fingerprint}".encode()).hexdigest()
+    return f"{digest}-p{PROCESSING_VERSION}"
+
+
+def unseen_rows(dataset, delta):
+    # Rows of the delta whose TransID is neither in the dataset nor earlier in the delta.
+    # Lookups go through the dataset's TransID hash index, so they cost O(len(delta)).
+    # A blank TransID matches nothing, so those rows are always new.
+    trans_ids = delta['TransID'].to_numpy()
+    unseen = dataset.trans_ids().get_indexer(trans_ids) == -1
+    unseen &= ~pd.Series(trans_ids).duplicated().to_numpy()
+    unseen |= delta['TransID'].isna().to_numpy()
+    return delta[unseen]
+
+
+def align_dtypes(data, delta):
+    # Give the delta the dtypes of the dataset so the two concatenate without upcasting.
+    # Categories new in the delta are appended to the dataset's, which leaves its codes as they are.
+    data_columns = {}
+    delta_columns = {}
+    for column in data.columns:
+        values = data[column]
+        delta_values = delta[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            new_categories = pd.Index(delta_values.dropna().unique()).astype(values.cat.categories.dtype, copy=False)
+            new_categories = new_categories.difference(values.cat.categories)
+            if len(new_categories):
+                values = values.cat.add_categories(new_categories)
+            delta_values = pd.Series(
+                pd.Categorical(delta_values.astype(object), categories=values.cat.categories),
+                index=delta_values.index, name=column,
+            )
+        elif delta_values.dtype != values.dtype:
+            try:
+                delta_values = delta_values.astype(values.dtype)
+            except (TypeError, ValueError):
+                # e.g. missing flags in the delta; concat falls back to a dtype holding both
+                pass
+        data_columns[column] = values
+        delta_columns[column] = delta_values
+    return pd.DataFrame(data_columns, copy=False), pd.DataFrame(delta_columns, copy=False)
+
+
+def merge_order(dataset, delta_dates):
+    # Row order interleaving the date-sorted delta into the date-sorted dataset, missing dates last.
+    # None when the delta simply follows the dataset, which is the usual case for a daily export.
+    n = len(dataset.data)
+    dates = dataset.time_index.values
+    valid = len(dates)
+    delta_values = delta_dates.to_numpy(dtype='datetime64[ns]')
+    delta_valid = int(delta_dates.notna().sum())
+
+    insert_at = np.searchsorted(dates, delta_values[:delta_valid], side='right')
+    if valid == n and (delta_valid == 0 or insert_at[0] == valid):
+        return None
+    order = np.insert(np.arange(valid), insert_at, n + np.arange(delta_valid))
+    return np.concatenate([order, np.arange(valid, n), n + np.arange(delta_valid, len(delta_values))])
+
+
+@instrument
+def append_dataset(dataset, key, delta):
+    # New dataset of `dataset` plus the processed `delta` rows, which must be unseen and date-sorted.
+    # Status codes, the aggregate cube and the TransID index are extended with the delta's instead
+    # of recomputed; the rows themselves are copied once into the merged frame.
+    data, delta = align_dtypes(dataset.data, delta.reset_index(drop=True))
+    delta_status = transaction_status(delta)
+    order = merge_order(dataset, delta[PAYMENT_DATE_COLUMN])
+
+    merged = pd.concat([data, delta], ignore_index=True)
+    status = np.concatenate([dataset.status(), delta_status])
+    if order is not None:
+        merged = merged.take(order).reset_index(drop=True)
+        status = status[order]
+
+    cube = AggregateCube.combine(
+        [dataset.cube(), AggregateCube(delta, status=delta_status)],
+        version=(key, 'cube'),
+    )
+    trans_ids = dataset.trans_ids().append(pd.Index(delta['TransID'].to_numpy()))
+
+    appended = Dataset(key, merged)
+    appended.derive('status', build=lambda: status)
+    appended.derive('cube', build=lambda: cube)
+    appended.derive('trans_ids', build=lambda: trans_ids)
+    return appended
@@ -1,30 +1,413 @@
+import io
+import os
+import time
+
 import streamlit as st
 import pandas as pd
 
-class ExcelHandler:
-    def __init__(self):
-        # Check if 'excel_data' is in session_state, if not, initialize it
-        if 'excel_data' not in st.session_state:
-            st.session_state.excel_data = None
+from BackgroundIngest import INGEST_REFRESH_SECONDS, get_ingest_workers
+from DataCache import CACHE_SUFFIX, DataCache, dataset_key, fingerprint
+from DataTable import paged_table
+from DataProcessing import prepare_dataset
+from DatasetStore import current_session_id, get_dataset_store
+from DateParser import merge_reports, parse_dates
+from DropFolder import DATA_DIR, DropFolder
+from Diagnostics import instrument, start_run
+from IncrementalAppend import append_dataset, appended_key, unseen_rows
+from SqlBackend import SqlDataset, SqlWriter, sql_engine
+
+# Columns the dashboard actually uses; everything else in the export is skipped at parse time
+INGEST_COLUMNS = [
+    'TransID',
+    'BatchID',
+    'VendorName',
+    'VendorBankName',
+    'VendorAcctNumber',
+    'Amount',
+    'Currency',
+    'CustomerAcctNumber',
+    'CompanyName',
+    'PaymentDate',
+    'PaidDate',
+    'ProcessFlag',
+    'ProcessType',
+    'PaymentDeclined',
+    'PaymentFlag',
+    'Remarks'
+]
+
+# Explicit dtypes so pandas does not have to infer (and re-infer) types per chunk.
+# Dates are read as text and converted chunk by chunk; IDs are nullable, as exports can leave them blank.
+INGEST_DTYPES = {
+    'TransID': 'Int64',
+    'BatchID': 'Int64',
+    'VendorName': 'str',
+    'VendorBankName': 'str',
+    'VendorAcctNumber': 'str',
+    'Amount': 'float64',
+    'Currency': 'str',
+    'CustomerAcctNumber': 'str',
+    'CompanyName': 'str',
+    'PaymentDate': 'str',
+    'PaidDate': 'str',
+    'ProcessFlag': 'str',
+    'ProcessType': 'Int8',
+    'PaymentDeclined': 'Int8',
+    'PaymentFlag': 'Int8',
+    'Remarks': 'str'
+}
 
+# Rows per chunk; bounds the peak memory of a single parse step
+CHUNK_SIZE = 250_000
+# The first chunk is small so a background ingest has partial results to show within seconds
+FIRST_CHUNK_SIZE = 25_000
+
+
+class DatasetLoader:
+    # Parsing and caching of exports, with no Streamlit calls: used by sessions and by the data folder watcher
+    def __init__(self, store=None):
         self.PAID_DATE_COLUMN = "PaidDate"
         self.PAYMENT_DATE_COLUMN = "PaymentDate"
+        self.chunk_size = CHUNK_SIZE
+        # Cached files of the datasets open in `store` are kept when the cache is trimmed or cleared
+        self.store = store
+        in_use = store.keys if store is not None else None
+        # With a SQL backend (GAPS_BACKEND) uploads are loaded into database files in the upload cache
+        self.engine = sql_engine()
+        suffix = CACHE_SUFFIX if self.engine is None else self.engine.suffix
+        self.cache = DataCache(suffix=suffix, in_use=in_use)
+        self.date_reports = []
+
+    def is_cached(self, key):
+        return os.path.exists(self.cache.path(key))
+
+    def open_cached(self, key):
+        # The dataset parsed earlier from the disk cache (processed rows or a database), or None
+        if not self.is_cached(key):
+            return None
+        if self.engine is not None:
+            return SqlDataset(key, self.cache.path(key), self.engine)
+        return self.cache.get(key)
+
+    @instrument
+    def ingest(self, job, source):
+        # Runs on an ingest worker thread, so nothing here may call Streamlit; messages go on the job
+        date_reports = []
+        if self.engine is not None:
+            path = self.cache.path(job.key)
+            with SqlWriter(path, self.engine) as writer:
+                for chunk in self.iter_csv_chunks(source, date_reports):
+                    job.add_chunk(chunk, source.tell())
+                    writer.add(chunk)
+            job.date_report = merge_reports(date_reports)
+            self.cache.evict()
+            return SqlDataset(job.key, path, self.engine)
+
+        chunks = []
+        for chunk in self.iter_csv_chunks(source, date_reports):
+            chunks.append(chunk)
+            job.add_chunk(chunk, source.tell())
+        job.date_report = merge_reports(date_reports)
+
+        if chunks:
+            raw_data = pd.concat(chunks, ignore_index=True)
+            chunks.clear()
+        else:
+            raw_data = self.convert_dates(pd.DataFrame(columns=INGEST_COLUMNS), date_reports)
+        data = prepare_dataset(raw_data)
+        try:
+            self.cache.put(job.key, data)
+        except OSError as error:
+            job.warnings.append(f"Could not cache the parsed file: {error}")
+        return data
+
+    def ingest_from(self, job, read):
+        with read() as source:
+            return self.ingest(job, source)
+
+    @instrument
+    def convert_dates(self, chunk, date_reports=None):
+        chunk[self.PAID_DATE_COLUMN], report = parse_dates(chunk[self.PAID_DATE_COLUMN])
+        (self.date_reports if date_reports is None else date_reports).append(report)
+        chunk[self.PAYMENT_DATE_COLUMN] = pd.to_datetime(chunk[self.PAYMENT_DATE_COLUMN], format='ISO8601')
+        return chunk
+
+    def iter_csv_chunks(self, source, date_reports=None):
+        reader = pd.read_csv(
+            source,
+            usecols=lambda column: column in INGEST_COLUMNS,
+            dtype=INGEST_DTYPES,
+            chunksize=self.chunk_size,
+        )
+        with reader:
+            size = min(FIRST_CHUNK_SIZE, self.chunk_size)
+            while True:
+                try:
+                    chunk = reader.get_chunk(size)
+                except StopIteration:
+                    return
+                yield self.convert_dates(chunk, date_reports)
+                size = self.chunk_size
+
+
+@st.cache_resource
+def get_drop_folder():
+    # The watcher starts with the server's first script run and is shared by every session
+    if DATA_DIR is None:
+        return None
+    store = get_dataset_store()
+    folder = DropFolder(DATA_DIR, DatasetLoader(store), store, get_ingest_workers())
+    folder.start()
+    return folder
+
+
+class ExcelHandler(DatasetLoader):
+    def __init__(self):
+        # Every page builds its handler first, so this is where a script run's diagnostics begin
+        start_run()
+
+        # Sessions only keep the key of their dataset; the data itself lives in the shared store
+        if 'dataset_key' not in st.session_state:
+            st.session_state.dataset_key = None
+        if 'upload_file_id' not in st.session_state:
+            st.session_state.upload_file_id = None
+        # Key and upload of a file still being parsed in the background
+        if 'ingest_key' not in st.session_state:
+            st.session_state.ingest_key = None
+            st.session_state.ingest_file_id = None
+        # Last delta export appended to this session's dataset
+        if 'append_file_id' not in st.session_state:
+            st.session_state.append_file_id = None
+
+        super().__init__(get_dataset_store())
+        self.workers = get_ingest_workers()
+        self.folder = get_drop_folder()
 
     def load_excel_file(self):
         uploaded_file = st.sidebar.file_uploader("Upload a CSV file", type=["csv"], label_visibility="collapsed")
+        # An upload takes precedence over the data folder
+        folder_file = self.select_folder_file() if uploaded_file is None else None
 
-        if uploaded_file is not None:
-            data =  pd.read_csv(uploaded_file)
-            data[self.PAID_DATE_COLUMN] = pd.to_datetime(data[self.PAID_DATE_COLUMN], format='mixed')
-            data[self.PAYMENT_DATE_COLUMN] = pd.to_datetime(data[self.PAYMENT_DATE_COLUMN], format='ISO8601')
-            st.session_state.excel_data = data
-            return st.session_state.excel_data
+        if st.sidebar.button("Clear Cached Uploads") and st.session_state.dataset_key is not None:
+            # Only this session's file is dropped, and only once no other session has it open
+            key = st.session_state.dataset_key
+            st.session_state.dataset_key = None
+            self.store.release(current_session_id())
+            self.cache.invalidate(key)
+
+        if uploaded_file is not None or folder_file is not None:
+            file_id = uploaded_file.file_id if uploaded_file is not None else folder_file.file_id
+            dataset = None
+            # Same file as the last rerun: skip re-hashing the bytes
+            if file_id == st.session_state.upload_file_id:
+                dataset = self.current_dataset()
+            if dataset is None:
+                # Reopening the base file means any delta has to be appended again
+                st.session_state.append_file_id = None
+                if uploaded_file is not None:
+                    dataset = self.open_upload(uploaded_file)
+                else:
+                    dataset = self.open_folder_file(folder_file)
+            if dataset is not None and st.session_state.ingest_key is None:
+                dataset = self.append_export(dataset)
+            return dataset
+
+        st.session_state.ingest_key = None
         return None
 
+    def select_folder_file(self):
+        # Exports in the watched data folder (GAPS_DATA_DIR), newest first, so a new session opens
+        # the newest one, already parsed and prewarmed by the folder watcher
+        if self.folder is None:
+            return None
+        for entry in self.folder.failed():
+            st.sidebar.warning(f"Could not read {entry.name} from the data folder: {entry.error}")
+        entries = self.folder.available()
+        if not entries:
+            return None
+        names = [entry.name for entry in entries]
+        name = st.sidebar.selectbox("Or open from the data folder", names, key="folder_file")
+        return entries[names.index(name)] if name in names else entries[0]
+
+    def open_upload(self, uploaded_file):
+        if uploaded_file.file_id == st.session_state.ingest_file_id:
+            key = st.session_state.ingest_key
+        else:
+            key = dataset_key(fingerprint(uploaded_file))
+        return self.open_source(
+            key, uploaded_file.file_id, uploaded_file.size,
+            lambda: io.BytesIO(uploaded_file.getvalue()),
+            lambda: self.build_dataset(key, uploaded_file),
+        )
+
+    def open_folder_file(self, entry):
+        def build():
+            with open(entry.path, 'rb') as source:
+                return self.build_dataset(entry.key, source)
+
+        return self.open_source(entry.key, entry.file_id, entry.size, lambda: open(entry.path, 'rb'), build)
+
+    def open_source(self, key, file_id, size, read, build):
+        # Files already in the store or the disk cache open right away. New files are parsed on an
+        # ingest worker; until that finishes this returns a PartialDataset of the rows read so far.
+        session_id = current_session_id()
+
+        job = self.workers.job(session_id, key)
+        if job is None and self.store.get(key) is None and not self.is_cached(key):
+            job = self.workers.submit(session_id, key, size, lambda job: self.ingest_from(job, read), self.store)
+
+        if job is not None and not job.done():
+            # The previous dataset is no longer shown, so the store may drop it while this one is read
+            st.session_state.dataset_key = None
+            self.store.release(session_id)
+            st.session_state.ingest_key = key
+            st.session_state.ingest_file_id = file_id
+            self.show_ingest_progress(job)
+            return job.partial()
+
+        # Not (or no longer) ingesting; another session or the folder watcher may have claimed the job first
+        st.session_state.ingest_key = None
+        st.session_state.ingest_file_id = None
+        if job is not None:
+            if job.error is not None:
+                self.workers.forget(job)
+                st.sidebar.error(f"Could not read the file: {job.error}")
+                return None
+            for warning in job.warnings:
+                st.sidebar.warning(warning)
+            self.report_unparseable_dates(job.date_report)
+            dataset = self.workers.claim(session_id, job, self.store)
+        else:
+            dataset = self.store.open(session_id, key, build)
+
+        st.session_state.dataset_key = key
+        st.session_state.upload_file_id = file_id
+        return dataset
+
+    def append_export(self, dataset):
+        # A newer export of the same feed: only rows with unseen TransIDs are merged into the loaded
+        # dataset, so a daily refresh costs about as much as the delta file
+        if not hasattr(dataset, 'trans_ids'):
+            # Database-backed datasets are not appended to; a newer export is loaded as a new file
+            return dataset
+        delta_file = st.sidebar.file_uploader("Append a newer export", type=["csv"], key="append_file")
+        if delta_file is None or delta_file.file_id == st.session_state.append_file_id:
+            return dataset
+
+        key = appended_key(dataset.key, fingerprint(delta_file))
+        delta = prepare_dataset(self.read_csv_chunked(delta_file))
+        new_rows = unseen_rows(dataset, delta)
+        st.session_state.append_file_id = delta_file.file_id
+        if not len(new_rows):
+            st.sidebar.info(f"No new transactions: all {len(delta):,} rows are already loaded.")
+            return dataset
+
+        dataset = self.store.open(current_session_id(), key, lambda: append_dataset(dataset, key, new_rows))
+        st.session_state.dataset_key = key
+        st.sidebar.success(f"Appended {len(new_rows):,} new transactions ({len(delta) - len(new_rows):,} already loaded).")
+        return dataset
+
+    def show_ingest_progress(self, job):
+        fraction = job.fraction()
+        st.sidebar.progress(fraction, text=f"Reading {job.rows_read:,} rows ({fraction:.0%}) in the background")
+        st.sidebar.info("Showing the rows read so far. The dashboard refines itself until the whole file is in.")
+
+    def follow_ingest(self):
+        # Called at the end of the script: while a background ingest runs, rerun now and then
+        # to refine the partial results and pick up the finished dataset
+        if st.session_state.ingest_key is not None:
+            time.sleep(INGEST_REFRESH_SECONDS)
+            st.rerun()
+
+    def current_dataset(self):
+        if st.session_state.dataset_key is None:
+            return None
+        return self.store.get(st.session_state.dataset_key)
+
+    def page_dataset(self):
+        # Pages show the session's dataset. A session that opens a page before the main page gets what the
+        # main page opens by default, the data folder's newest export, once the watcher has it ready.
+        dataset = self.current_dataset()
+        if dataset is not None or st.session_state.ingest_key is not None or self.folder is None:
+            return dataset
+        entries = self.folder.ready()
+        if not entries:
+            return None
+        return self.open_folder_file(entries[0])
+
+    def selected_year(self, dataset):
+        # Pages follow the year picked on the main dashboard, or the default when it was not visited
+        selected_year = st.session_state.get('selected_year')
+        if selected_year not in dataset.year_options():
+            selected_year = dataset.default_year()
+        return selected_year
+
+    @instrument
+    def build_dataset(self, key, uploaded_file):
+        if self.engine is not None:
+            path = self.cache.path(key)
+            if not os.path.exists(path):
+                # The export streams into the database chunk by chunk; no frame of the whole file is built
+                with SqlWriter(path, self.engine) as writer:
+                    self.read_csv_chunked(uploaded_file, on_chunk=writer.add, keep_rows=False)
+                self.cache.evict()
+            return SqlDataset(key, path, self.engine)
+
+        data = self.cache.get(key)
+        if data is None:
+            data = prepare_dataset(self.read_csv_chunked(uploaded_file))
+            try:
+                self.cache.put(key, data)
+            except OSError as error:
+                st.sidebar.warning(f"Could not cache the parsed file: {error}")
+        return data
+
+    @instrument
+    def read_csv_chunked(self, uploaded_file, on_chunk=None, keep_rows=True):
+        # Stream the upload in bounded chunks. `on_chunk` lets callers fold aggregates
+        # chunk by chunk; with keep_rows=False no rows are retained at all.
+        total_bytes = getattr(uploaded_file, 'size', None)
+        progress = st.sidebar.progress(0.0, text="Reading CSV ...")
+
+        chunks = []
+        rows_read = 0
+        self.date_reports = []
+        for chunk in self.iter_csv_chunks(uploaded_file):
+            rows_read += len(chunk)
+            if on_chunk is not None:
+                on_chunk(chunk)
+            if keep_rows:
+                chunks.append(chunk)
+            if total_bytes:
+                fraction = min(uploaded_file.tell() / total_bytes, 1.0)
+                progress.progress(fraction, text=f"Read {rows_read:,} rows ({fraction:.0%})")
+        progress.empty()
+        self.report_unparseable_dates()
+
+        if not keep_rows:
+            return None
+        if not chunks:
+            return self.convert_dates(pd.DataFrame(columns=INGEST_COLUMNS))
+
+        data = pd.concat(chunks, ignore_index=True)
+        chunks.clear()
+        return data
+
+    def report_unparseable_dates(self, report=None):
+        if report is None:
+            report = merge_reports(self.date_reports)
+        if report['unparseable_rows']:
+            samples = ', '.join(repr(value) for value in report['unparseable_samples'])
+            st.sidebar.warning(
+                f"{report['unparseable_rows']:,} rows have a {self.PAID_DATE_COLUMN} that could not be parsed "
+                f"and were left empty. Examples: {samples}"
+            )
+        return report
+
     def view_data(self):
-        if st.session_state.excel_data is not None:
+        dataset = self.current_dataset()
+        if dataset is not None:
             st.write("### Raw Data Overview")
-            st.write(st.session_state.excel_data)
+            paged_table(dataset.data, key="view_data_table")
         else:
             st.warning("Missing Data, Please Add Data source.")
-
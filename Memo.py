@@ -0,0 +1,181 @@
+import functools
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import pandas as pd
+
+# Memory budget and optional time-to-live (seconds) for memoized results, settable from the environment
+MEMO_MAX_BYTES = int(os.environ.get("GAPS_MEMO_MAX_BYTES", 1024 ** 3))
+MEMO_TTL = float(os.environ["GAPS_MEMO_TTL"]) if os.environ.get("GAPS_MEMO_TTL") else None
+
+# Frames without a version token are keyed by their content only when they are this small
+SMALL_FRAME_ROWS = 10_000
+
+
+# Version tokens of frames handed out by a Dataset, by object identity. Anything derived from
+# such a frame is a new object and gets no token, so it can never be mistaken for its source.
+frame_versions = {}
+
+
+def set_version(frame, token):
+    frame_id = id(frame)
+    frame_versions[frame_id] = (weakref.ref(frame, lambda _: frame_versions.pop(frame_id, None)), token)
+    return frame
+
+
+def version_token(value):
+    # Cheap key for an argument: datasets, cubes and dataset slices carry a version token,
+    # small frames are hashed, scalars are used as is. None means the value cannot be keyed cheaply.
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        entry = frame_versions.get(id(value))
+        if entry is not None and entry[0]() is value:
+            return entry[1]
+        if len(value) <= SMALL_FRAME_ROWS:
+            return ('content', len(value), int(pd.util.hash_pandas_object(value).sum()))
+        return None
+    if hasattr(value, 'version'):
+        return value.version
+    if isinstance(value, (list, tuple)):
+        tokens = tuple(version_token(item) for item in value)
+        return None if any(token is None for token in tokens) else tokens
+    try:
+        hash(value)
+    except TypeError:
+        return None
+    return value
+
+
+def mentions(key, version):
+    if key == version:
+        return True
+    return isinstance(key, tuple) and any(mentions(part, version) for part in key)
+
+
+def estimate_size(value):
+    # Result objects holding frames or arrays (cubes, bucket totals) report their own nbytes
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True))
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+class Memo:
+    # Process-wide LRU of derived results, bounded by an estimate of their memory, with an optional TTL
+    def __init__(self, max_bytes=MEMO_MAX_BYTES, ttl=MEMO_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.building = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+            value, size, created = entry
+            if self.ttl is not None and time.monotonic() - created > self.ttl:
+                self.discard(key)
+                return False, None
+            self.entries.move_to_end(key)
+            return True, value
+
+    def get_or_build(self, key, build):
+        found, value = self.lookup(key)
+        if found:
+            with self.lock:
+                self.hits += 1
+            return value
+
+        # One build per key at a time; other callers wait for it and then hit
+        with self.lock:
+            building = self.building.setdefault(key, threading.Lock())
+        with building:
+            found, value = self.lookup(key)
+            if found:
+                with self.lock:
+                    self.hits += 1
+                return value
+
+            try:
+                value = build()
+                with self.lock:
+                    self.misses += 1
+                    self.store(key, value)
+            finally:
+                with self.lock:
+                    self.building.pop(key, None)
+            return value
+
+    def store(self, key, value):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (value, size, time.monotonic())
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self.discard(oldest)
+            self.evictions += 1
+
+    def discard(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def invalidate(self, version=None):
+        # Drop every entry whose key mentions the given version token, or everything
+        with self.lock:
+            for key in list(self.entries):
+                if version is None or mentions(key, version):
+                    self.discard(key)
+
+    def count_uncached(self):
+        with self.lock:
+            self.uncached += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'uncached': self.uncached,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+memo = Memo()
+
+
+def memoize(function):
+    # Keys results by function plus the version tokens of the arguments, instead of hashing
+    # whole DataFrames the way st.cache_data does. Pages run as __main__, so the file name
+    # tells their functions apart.
+    name = (function.__code__.co_filename, function.__qualname__)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        arg_tokens = tuple(version_token(arg) for arg in args)
+        kwarg_tokens = tuple((keyword, version_token(value)) for keyword, value in sorted(kwargs.items()))
+        if any(token is None for token in arg_tokens) or any(token is None for _, token in kwarg_tokens):
+            memo.count_uncached()
+            return function(*args, **kwargs)
+        return memo.get_or_build((name,) + arg_tokens + kwarg_tokens, lambda: function(*args, **kwargs))
+
+    return wrapper
@@ -0,0 +1,24 @@
+import functools
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from Diagnostics import instrument, start_run
+
+
+def section(function):
+    # A part of a page that reruns on its own (st.fragment): changing a widget inside it reruns only
+    # this function, with the arguments of the page's last full run. Sections get everything they
+    # show as arguments and read no sidebar widget, so their data dependencies are their signature;
+    # the year, the data source and anything else outside still rerun the whole page.
+    stage = instrument(function)
+
+    @functools.wraps(function)
+    def run(*args, **kwargs):
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is not None and ctx.fragment_ids_this_run:
+            # Only sections are rerunning: the page's start, which resets diagnostics, was skipped
+            start_run()
+        return stage(*args, **kwargs)
+
+    return st.fragment(run)
@@ -0,0 +1,183 @@
+import multiprocessing
+import os
+import sys
+import threading
+import types
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+# Only numpy is imported here: pool processes are spawned and import this module, and nothing else
+
+# Processes counting a dataset's months at once; 0 or 1 counts them in the calling thread
+PARALLEL_WORKERS = int(os.environ.get("GAPS_PARALLEL_WORKERS", os.cpu_count() or 1))
+# Below this many rows, handing the months to the pool costs more than it saves
+PARALLEL_MIN_ROWS = int(os.environ.get("GAPS_PARALLEL_MIN_ROWS", 2_000_000))
+
+DAY_NS = 86_400 * 10 ** 9
+HOUR_NS = 3_600 * 10 ** 9
+STATUS_RADIX = 4
+BUCKETS = ['day', 'week', 'month', 'quarter']
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(workers):
+    # One pool per size, started on first use and kept for the life of the process.
+    # Spawned rather than forked: forking a process running Streamlit's threads is not safe.
+    # Spawned processes first import __main__, which Streamlit sets to the page being run, so every
+    # process is started at once while __main__ is an empty module; they import only this module.
+    with pools_lock:
+        pool = pools.get(workers)
+        if pool is None:
+            main = sys.modules['__main__']
+            sys.modules['__main__'] = types.ModuleType('__main__')
+            try:
+                pool = pools[workers] = multiprocessing.get_context('spawn').Pool(workers)
+            finally:
+                sys.modules['__main__'] = main
+        return pool
+
+
+class SharedColumns:
+    # Numpy columns copied once into shared memory blocks; pool processes map them by name
+    # instead of receiving pickled frames
+    def __init__(self, columns):
+        self.blocks = []
+        self.specs = {}
+        try:
+            for name, values in columns.items():
+                values = np.ascontiguousarray(values)
+                block = SharedMemory(create=True, size=max(values.nbytes, 1))
+                self.blocks.append(block)
+                np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+                self.specs[name] = (block.name, values.dtype.str, len(values))
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def attach(specs):
+    blocks = {name: SharedMemory(name=block_name) for name, (block_name, _, _) in specs.items()}
+    arrays = {
+        name: np.ndarray((length,), dtype=np.dtype(dtype), buffer=blocks[name].buf)
+        for name, (_, dtype, length) in specs.items()
+    }
+    return blocks, arrays
+
+
+def month_partitions(dates):
+    # (start, stop) of every calendar month in date-sorted datetime64[ns] values, missing dates
+    # (sorted last) left out; months without rows give no partition
+    valid = len(dates) - int(np.isnat(dates).sum())
+    if valid == 0:
+        return []
+    months = np.arange(dates[0].astype('datetime64[M]'), dates[valid - 1].astype('datetime64[M]') + 1)
+    bounds = np.append(np.searchsorted(dates[:valid], months.astype(dates.dtype)), valid)
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def bucket_ids(dates, bucket):
+    # Integer id of the bucket holding each date: days, weeks (from Monday), months or quarters
+    # since 1970, from the datetime64 values alone. Missing dates must be left out by the caller.
+    days = np.asarray(dates, dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+    if bucket == 'day':
+        return days
+    if bucket == 'week':
+        # 1970-01-01 was a Thursday, so the week holding it started 3 days earlier
+        return (days + 3) // 7
+    months = np.asarray(dates, dtype='datetime64[ns]').astype('datetime64[M]').astype(np.int64)
+    if bucket == 'month':
+        return months
+    if bucket == 'quarter':
+        return months // 3
+    raise ValueError(f"Unknown time bucket {bucket!r}: expected one of {BUCKETS}")
+
+
+def weekday_hour_codes(dates):
+    # Weekday (Monday 0) and hour of every date from integer arithmetic on the nanosecond values,
+    # with no per-row strings or Timestamps; missing dates are left out, `valid` marks the others
+    values = np.asarray(dates, dtype='datetime64[ns]')
+    valid = ~np.isnat(values)
+    hours = values[valid].view(np.int64) // HOUR_NS
+    # 1970-01-01 was a Thursday, weekday 3
+    return (hours // 24 + 3) % 7, hours % 24, valid
+
+
+def count_rows(columns, start, stop, type_radix, company_radix):
+    # One month of rows: count and sum them by (weekday, type, status, company) over a single
+    # integer key, and return only the groups
+    dates = columns['dates'][start:stop]
+    # 1970-01-01 was a Thursday, weekday 3
+    weekday = (dates // DAY_NS + 3) % 7
+    key = weekday * type_radix + columns['types'][start:stop]
+    key = key * STATUS_RADIX + columns['status'][start:stop]
+    key = key * company_radix + columns['companies'][start:stop]
+    groups, inverse = np.unique(key, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(groups))
+    sums = np.bincount(inverse, weights=columns['amount'][start:stop], minlength=len(groups))
+    return groups, counts, sums
+
+
+def count_weekday_hours(columns, start, stop, type_count):
+    # One partition's rows per (type, weekday, hour) of 'dates', from a single bincount over one combined key
+    weekday, hour, valid = weekday_hour_codes(columns['dates'][start:stop])
+    codes = columns['types'][start:stop][valid]
+    typed = codes >= 0
+    key = (codes[typed].astype(np.int64) * 7 + weekday[typed]) * 24 + hour[typed]
+    return np.bincount(key, minlength=type_count * 7 * 24)
+
+
+def count_buckets(columns, start, stop, bucket, first, size, type_count):
+    # One partition's counts and amount sums per (bucket, type), buckets numbered from `first`.
+    # Rows count once each, or by their 'weights' when given (e.g. rows that are already per-day totals).
+    dates = columns['dates'][start:stop]
+    codes = columns['types'][start:stop]
+    keep = ~np.isnat(dates) & (codes >= 0)
+    key = (bucket_ids(dates[keep], bucket) - first) * type_count + codes[keep]
+    weights = columns['weights'][start:stop][keep] if 'weights' in columns else None
+    counts = np.bincount(key, weights=weights, minlength=size * type_count)
+    sums = np.bincount(key, weights=columns['amount'][start:stop][keep], minlength=size * type_count)
+    return counts, sums
+
+
+def run_partition(task, specs, start, stop, args):
+    # A task in a pool process, over the columns in shared memory
+    blocks, columns = attach(specs)
+    try:
+        return task(columns, start, stop, *args)
+    finally:
+        del columns
+        for block in blocks.values():
+            block.close()
+
+
+def partitioned(task, columns, partitions, args=(), workers=PARALLEL_WORKERS):
+    # task(columns, start, stop, *args) for every partition, in partition order. Tasks are functions
+    # of this module, so pool processes import nothing else.
+    if workers <= 1 or len(partitions) <= 1:
+        return [task(columns, start, stop, *args) for start, stop in partitions]
+    with SharedColumns(columns) as shared:
+        pool = get_pool(workers)
+        results = [pool.apply_async(run_partition, (task, shared.specs, start, stop, args)) for start, stop in partitions]
+        return [result.get() for result in results]
+
+
+def partitioned_counts(columns, partitions, type_radix, company_radix, workers=PARALLEL_WORKERS):
+    # Group keys, counts and amount sums of every partition, in partition order. `columns` holds
+    # int64 'dates' (ns), integer 'types', 'status' and 'companies' (all >= 0) and float 'amount'.
+    return partitioned(count_rows, columns, partitions, (type_radix, company_radix), workers)
@@ -0,0 +1,195 @@
+from AggregateCube import quarterly_frame
+from DataProcessing import PAID_DATE_COLUMN, PAYMENT_DATE_COLUMN
+from Diagnostics import stage
+from Memo import memo
+from TimeBuckets import BucketTotals
+
+
+def freeze(value):
+    # Parameters become part of memo keys, so lists (e.g. compared years) are keyed as tuples
+    if isinstance(value, (list, tuple, set)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class Node:
+    # One named step: the nodes it reads, the parameters it takes and the function building it.
+    # Uncached nodes are ones the dataset already memoizes itself (or cheap views of it).
+    def __init__(self, name, build, inputs, params, cached):
+        self.name = name
+        self.build = build
+        self.inputs = inputs
+        self.params = params
+        self.cached = cached
+
+
+class Pipeline:
+    # Declarative graph of named, lazily evaluated nodes over a dataset. A page asks for the nodes it
+    # shows and only those and the nodes they read are built. Results are memoized per dataset and
+    # parameters; invalidating a node also drops every node that reads it, directly or not.
+    def __init__(self):
+        self.nodes = {}
+
+    def node(self, name, inputs=(), params=(), cached=True):
+        def register(build):
+            for input_name in inputs:
+                if input_name not in self.nodes:
+                    raise ValueError(f"Node {name!r} reads unknown node {input_name!r}")
+            self.nodes[name] = Node(name, build, tuple(inputs), tuple(params), cached)
+            return build
+
+        return register
+
+    def params_of(self, name):
+        # Parameters of a node and of every node it reads: together they decide its value
+        node = self.nodes[name]
+        names = list(node.params)
+        for input_name in node.inputs:
+            names += [param for param in self.params_of(input_name) if param not in names]
+        return names
+
+    def get(self, dataset, name, **params):
+        node = self.nodes[name]
+        missing = [param for param in self.params_of(name) if param not in params]
+        if missing:
+            raise TypeError(f"Node {name!r} needs parameters {missing}")
+
+        def build():
+            # Inputs are resolved only here, so a memoized node never touches the nodes it reads
+            inputs = [self.get(dataset, input_name, **params) for input_name in node.inputs]
+            with stage(f"node {name}"):
+                return node.build(dataset, *inputs, **{param: params[param] for param in node.params})
+
+        if not node.cached or dataset.version is None:
+            return build()
+        key = ((dataset.key, 'node', name),) + tuple(freeze(params[param]) for param in self.params_of(name))
+        return memo.get_or_build(key, build)
+
+    def dependents(self, name):
+        # The node and every node reading it, directly or through other nodes
+        found = {name}
+        changed = True
+        while changed:
+            changed = False
+            for node in self.nodes.values():
+                if node.name not in found and found.intersection(node.inputs):
+                    found.add(node.name)
+                    changed = True
+        return found
+
+    def invalidate(self, dataset, name):
+        for dependent in self.dependents(name):
+            memo.invalidate((dataset.key, 'node', dependent))
+
+
+pipeline = Pipeline()
+
+
+# Rows and row subsets. Datasets memoize these themselves, so the nodes only name them.
+
+@pipeline.node('processed', cached=False)
+def processed(dataset):
+    return dataset.data
+
+
+@pipeline.node('year', inputs=['processed'], params=['year'], cached=False)
+def year_rows(dataset, processed, year):
+    return dataset.year(year)
+
+
+@pipeline.node('date_range', inputs=['processed'], params=['start', 'end'], cached=False)
+def date_range(dataset, processed, start, end):
+    return dataset.date_range(start, end)
+
+
+@pipeline.node('status_counts', params=['year'], cached=False)
+def status_counts(dataset, year):
+    return dataset.status_counts(year)
+
+
+@pipeline.node('successful', inputs=['processed'], params=['year'], cached=False)
+def successful(dataset, processed, year):
+    return dataset.successful(year)
+
+
+@pipeline.node('declined', inputs=['processed'], params=['year'], cached=False)
+def declined(dataset, processed, year):
+    return dataset.declined(year)
+
+
+# The cube is read from the dataset rather than from 'processed': a file still being ingested has a cube but no rows yet
+@pipeline.node('cube', cached=False)
+def cube(dataset):
+    return dataset.cube()
+
+
+# Page aggregates, all answered by the cube
+
+@pipeline.node('metrics', inputs=['cube'], params=['year'])
+def metrics(dataset, cube, year):
+    return cube.metrics(year)
+
+
+@pipeline.node('year_metrics', inputs=['cube'], params=['years'])
+def year_metrics(dataset, cube, years):
+    return cube.year_metrics(years)
+
+
+@pipeline.node('type_summary', inputs=['cube'], params=['year'])
+def type_summary(dataset, cube, year):
+    return cube.type_summary(year)
+
+
+@pipeline.node('top_companies', inputs=['cube'], params=['year', 'number'])
+def top_companies(dataset, cube, year, number):
+    return cube.top_companies(year, number)
+
+
+@pipeline.node('type_totals', inputs=['cube'], params=['years'])
+def type_totals(dataset, cube, years):
+    return cube.type_totals(years)
+
+
+# Time series: successful transactions per day, week, month or quarter and type, empty periods included
+
+@pipeline.node('time_buckets', params=['year', 'bucket'], cached=False)
+def time_buckets(dataset, year, bucket):
+    return dataset.time_buckets(year, bucket)
+
+
+@pipeline.node('type_by_month', params=['years'])
+def type_by_month(dataset, years):
+    # Months of every compared year one after the other; months between two compared years are not filled
+    return BucketTotals.combine(dataset.time_buckets(year, 'month') for year in years).by_type()
+
+
+@pipeline.node('quarterly', params=['year'])
+def quarterly(dataset, year):
+    # Quarterly page layout: every quarter of the year with transactions, as 'Q1'-style labels
+    totals = dataset.time_buckets(year, 'quarter').totals()
+    summary = totals[['Count', 'Amount']].set_axis(totals['Start'].dt.quarter.to_numpy())
+    return quarterly_frame(summary)
+
+
+# Weekly page: successful transactions by type, weekday and hour, from one bincount per date column
+
+@pipeline.node('payment_hours', params=['year'], cached=False)
+def payment_hours(dataset, year):
+    return dataset.weekday_hours(year, PAYMENT_DATE_COLUMN)
+
+
+@pipeline.node('paid_hours', params=['year'], cached=False)
+def paid_hours(dataset, year):
+    return dataset.weekday_hours(year, PAID_DATE_COLUMN)
+
+
+@pipeline.node('type_by_weekday', inputs=['payment_hours'])
+def type_by_weekday(dataset, hours):
+    return hours.type_by_weekday()
+
+
+@pipeline.node('weekday_pivot', inputs=['type_by_weekday'])
+def weekday_pivot(dataset, counts):
+    # Weekly page table: weekdays by transaction type
+    pivoted = counts.pivot(index=PAYMENT_DATE_COLUMN, columns='ProcessType_Description', values='Count')
+    return pivoted.fillna(0)
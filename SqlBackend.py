@@ -0,0 +1,489 @@
+import os
+import pathlib
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from AggregateCube import type_totals_frame, year_metrics_frame
+from DataProcessing import PAID_DATE_COLUMN, PAYMENT_DATE_COLUMN, SELECTED_COLUMNS, process_transactions
+from DatasetStore import DEFAULT_YEAR
+from Diagnostics import instrument
+from Memo import memo
+from TransactionStatus import DECLINED, NOT_DECLINED, STATUS_COUNT, STATUS_DECLINED, STATUS_PENDING, STATUS_SUCCESSFUL, SUCCESSFUL, transaction_status
+from TimeBuckets import bucket_totals
+from WeekdayHours import WeekdayHours
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Where datasets live: "pandas" keeps them in memory; "sqlite" or "duckdb" keep them in a database
+# file next to the upload cache and push the dashboard's aggregations down to it
+BACKEND = os.environ.get("GAPS_BACKEND", "pandas").lower()
+
+TABLE = "transactions"
+
+# Column types of the table: the processed columns, then the ones queries group and filter by
+SCHEMA = {
+    'TransID': 'BIGINT',
+    'BatchID': 'BIGINT',
+    'VendorName': 'TEXT',
+    'VendorBankName': 'TEXT',
+    'VendorAcctNumber': 'TEXT',
+    'Amount': 'DOUBLE',
+    'Currency': 'TEXT',
+    'CustomerAcctNumber': 'TEXT',
+    'CompanyName': 'TEXT',
+    'PaymentDate': 'TIMESTAMP',
+    'PaidDate': 'TIMESTAMP',
+    'ProcessFlag': 'TEXT',
+    'ProcessType': 'INTEGER',
+    'ProcessType_Description': 'TEXT',
+    'PaymentDeclined': 'INTEGER',
+    'PaymentFlag': 'INTEGER',
+    'Remarks': 'TEXT',
+    'Year': 'INTEGER',
+    'Month': 'INTEGER',
+    'Quarter': 'INTEGER',
+    'DayOfWeek': 'INTEGER',
+    'Status': 'INTEGER',
+    'Company': 'TEXT',
+}
+
+INDEXES = {
+    'year_status': ['Year', 'Status'],
+    'payment_date': [PAYMENT_DATE_COLUMN],
+}
+
+DATE_COLUMNS = [PAYMENT_DATE_COLUMN, PAID_DATE_COLUMN]
+NUMERIC_COLUMNS = ['TransID', 'BatchID', 'Amount', 'ProcessType', 'PaymentDeclined', 'PaymentFlag']
+FLAG_COLUMNS = ['ProcessType', 'PaymentDeclined', 'PaymentFlag']
+
+
+def quote(column):
+    if column not in SCHEMA:
+        raise ValueError(f"Unknown column {column!r}")
+    return f'"{column}"'
+
+
+def in_clause(column, values):
+    values = [int(value) for value in np.atleast_1d(values)]
+    return f"{column} IN ({', '.join('?' * len(values))})", values
+
+
+def status_clause(status):
+    return in_clause('Status', status)
+
+
+def year_status_clause(year, status):
+    # One year or a list of them, and one status code or several
+    year_where, year_params = in_clause('Year', year)
+    status_where, status_params = in_clause('Status', status)
+    return f"{year_where} AND {status_where}", year_params + status_params
+
+
+def like_pattern(text):
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def iso_strings(values):
+    # Dates as ISO text for engines without a timestamp type; missing dates stay NULL
+    text = np.datetime_as_string(values.to_numpy(dtype='datetime64[ms]'), unit='ms').astype(object)
+    text[values.isna().to_numpy()] = None
+    return text
+
+
+class SqliteEngine:
+    name = 'sqlite'
+    suffix = '.sqlite'
+    like = 'LIKE'
+
+    def connect(self, path, read_only=False):
+        if read_only:
+            return sqlite3.connect(pathlib.Path(path).absolute().as_uri() + "?mode=ro", uri=True)
+        connection = sqlite3.connect(path)
+        # The file is written to a temporary path and renamed when complete, so no journal is needed
+        connection.execute("PRAGMA journal_mode=OFF")
+        connection.execute("PRAGMA synchronous=OFF")
+        return connection
+
+    def insert(self, connection, rows):
+        rows = rows.copy()
+        for column in DATE_COLUMNS:
+            rows[column] = iso_strings(rows[column])
+        rows.to_sql(TABLE, connection, if_exists='append', index=False, chunksize=50_000)
+
+    def query(self, connection, sql, params=()):
+        return pd.read_sql_query(sql, connection, params=list(params))
+
+    def day(self, column):
+        return f"date({column})"
+
+    def weekday(self, column):
+        # strftime counts weekdays from Sunday; the dashboard from Monday
+        return f"((CAST(strftime('%w', {column}) AS INTEGER) + 6) % 7)"
+
+    def hour(self, column):
+        return f"CAST(strftime('%H', {column}) AS INTEGER)"
+
+    def timestamp(self, value):
+        # Compared as text with the stored ISO dates
+        return np.datetime_as_string(np.datetime64(value, 'ms'), unit='ms')
+
+    def close(self, connection):
+        connection.commit()
+        connection.close()
+
+
+class DuckdbEngine:
+    name = 'duckdb'
+    suffix = '.duckdb'
+    like = 'ILIKE'
+
+    def connect(self, path, read_only=False):
+        return duckdb.connect(path, read_only=read_only)
+
+    def insert(self, connection, rows):
+        columns = ', '.join(quote(column) for column in rows.columns)
+        connection.register('chunk_rows', rows)
+        try:
+            connection.execute(f"INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM chunk_rows")
+        finally:
+            connection.unregister('chunk_rows')
+
+    def query(self, connection, sql, params=()):
+        return connection.execute(sql, list(params)).df()
+
+    def day(self, column):
+        return f"CAST({column} AS DATE)"
+
+    def weekday(self, column):
+        return f"(isodow({column}) - 1)"
+
+    def hour(self, column):
+        return f"hour({column})"
+
+    def timestamp(self, value):
+        return value.to_pydatetime()
+
+    def close(self, connection):
+        connection.close()
+
+
+def sql_engine(backend=BACKEND):
+    # None for the in-memory pandas backend
+    if backend == 'pandas':
+        return None
+    if backend == 'sqlite':
+        return SqliteEngine()
+    if backend == 'duckdb':
+        if duckdb is None:
+            raise ImportError("GAPS_BACKEND=duckdb needs the duckdb package (pip install duckdb)")
+        return DuckdbEngine()
+    raise ValueError(f"Unknown GAPS_BACKEND {backend!r}: expected pandas, sqlite or duckdb")
+
+
+@instrument
+def sql_rows(chunk):
+    # One chunk of the export as table rows, with the grouping columns computed once here instead of per query
+    data = process_transactions(chunk)
+    payment_date = data[PAYMENT_DATE_COLUMN]
+    return data.assign(
+        Year=payment_date.dt.year.astype('Int16'),
+        Month=payment_date.dt.month.astype('Int8'),
+        Quarter=payment_date.dt.quarter.astype('Int8'),
+        DayOfWeek=payment_date.dt.dayofweek.astype('Int8'),
+        Status=transaction_status(data),
+        Company=data['CompanyName'].str.strip(),
+    )
+
+
+class SqlWriter:
+    # Loads an export chunk by chunk into a new database file. Rows go to a temporary file that replaces
+    # `path` once every chunk and index is in, so readers never open a half-written database.
+    def __init__(self, path, engine):
+        self.path = path
+        self.engine = engine
+        self.tmp_path = path + ".tmp"
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.connection = engine.connect(self.tmp_path)
+        columns = ', '.join(f"{quote(column)} {kind}" for column, kind in SCHEMA.items())
+        self.connection.execute(f"CREATE TABLE {TABLE} ({columns})")
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.engine.close(self.connection)
+            os.remove(self.tmp_path)
+        return False
+
+    @instrument
+    def add(self, chunk):
+        self.engine.insert(self.connection, sql_rows(chunk))
+        self.rows += len(chunk)
+
+    def close(self):
+        for name, columns in INDEXES.items():
+            self.connection.execute(f"CREATE INDEX {name} ON {TABLE} ({', '.join(quote(column) for column in columns)})")
+        self.engine.close(self.connection)
+        os.replace(self.tmp_path, self.path)
+
+
+class SqlDataset:
+    # A dataset kept in a database file instead of memory. It answers the same calls as Dataset;
+    # aggregations run as queries and only their small results come back as frames.
+    def __init__(self, key, path, engine):
+        self.key = key
+        self.version = key
+        self.path = path
+        self.engine = engine
+        # Connections are not shared between threads, and every session runs its script on its own
+        self.local = threading.local()
+        self.data = SqlTable(self, 'data', "1 = 1", ())
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = self.engine.connect(self.path, read_only=True)
+        return connection
+
+    def query(self, sql, params=()):
+        return self.engine.query(self.connection(), sql, params)
+
+    def derive(self, name, *params, build):
+        return memo.get_or_build((self.key, name) + params, build)
+
+    def year_options(self):
+        return self.derive('year_options', build=lambda: [
+            int(year) for year in self.query(f"SELECT DISTINCT Year FROM {TABLE} WHERE Year IS NOT NULL ORDER BY Year")['Year']
+        ])
+
+    def default_year(self):
+        year_options = self.year_options()
+        return DEFAULT_YEAR if DEFAULT_YEAR in year_options else year_options[-1]
+
+    def cube(self):
+        return SqlCube(self)
+
+    def year(self, selected_year):
+        return SqlTable(self, 'year', "Year = ?", [int(selected_year)])
+
+    def date_range(self, start, end):
+        # Rows with start <= PaymentDate < end, read through the payment date index
+        date = quote(PAYMENT_DATE_COLUMN)
+        bounds = [self.engine.timestamp(pd.Timestamp(value)) for value in (start, end)]
+        return SqlTable(self, 'rows', f"{date} >= ? AND {date} < ?", bounds)
+
+    @instrument
+    def status_counts(self, selected_year):
+        def build():
+            counts = self.query(f"SELECT Status, COUNT(*) AS Count FROM {TABLE} WHERE Year = ? GROUP BY Status", [int(selected_year)])
+            return np.bincount(counts['Status'].astype(int), weights=counts['Count'], minlength=STATUS_COUNT).astype(np.int64)
+
+        return self.derive('status_counts', selected_year, build=build)
+
+    @instrument
+    def weekday_hours(self, selected_year, column):
+        # Successful transactions of the year by type, weekday and hour of `column`, counted in the database
+        def build():
+            date = quote(column)
+            where, params = year_status_clause(selected_year, STATUS_SUCCESSFUL)
+            counts = self.query(
+                f"SELECT ProcessType_Description, {self.engine.weekday(date)} AS Weekday, {self.engine.hour(date)} AS Hour, "
+                f"COUNT(*) AS Count FROM {TABLE} "
+                f"WHERE {where} AND ProcessType_Description IS NOT NULL AND {date} IS NOT NULL "
+                f"GROUP BY 1, 2, 3", params,
+            )
+            types = pd.Index(sorted(counts['ProcessType_Description'].unique()), dtype=object)
+            grid = np.zeros((len(types), 7, 24), dtype=np.int64)
+            grid[types.get_indexer(counts['ProcessType_Description']), counts['Weekday'].astype(int), counts['Hour'].astype(int)] = counts['Count']
+            return WeekdayHours(types, grid)
+
+        return self.derive('weekday_hours', selected_year, column, build=build)
+
+    @instrument
+    def time_buckets(self, selected_year, bucket):
+        # The database totals successful transactions per day and type; the days are then bucketed
+        # like Dataset's rows, so empty buckets are filled the same way
+        def build():
+            date = quote(PAYMENT_DATE_COLUMN)
+            span = self.query(f"SELECT MIN({date}) AS First, MAX({date}) AS Last FROM {TABLE} WHERE Year = ?", [int(selected_year)])
+            where, params = year_status_clause(selected_year, STATUS_SUCCESSFUL)
+            days = self.query(
+                f"SELECT ProcessType_Description, {self.engine.day(date)} AS Day, COUNT(*) AS Count, "
+                f"COALESCE(SUM(Amount), 0) AS Amount FROM {TABLE} "
+                f"WHERE {where} AND ProcessType_Description IS NOT NULL AND {date} IS NOT NULL "
+                f"GROUP BY 1, 2", params,
+            )
+            types = pd.Index(sorted(days['ProcessType_Description'].unique()), dtype=object)
+            return bucket_totals(
+                bucket, pd.to_datetime(span.iloc[0], format='ISO8601').to_numpy(),
+                pd.to_datetime(days['Day'], format='ISO8601').to_numpy(), types.get_indexer(days['ProcessType_Description']),
+                types, days['Amount'].to_numpy(), counts=days['Count'].to_numpy(),
+            )
+
+        return self.derive('time_buckets', selected_year, bucket, build=build)
+
+    def successful(self, selected_year):
+        return SqlStatusView(self, selected_year, 'successful', SUCCESSFUL)
+
+    def declined(self, selected_year):
+        return SqlStatusView(self, selected_year, 'declined', DECLINED)
+
+    def not_declined(self, selected_year):
+        return SqlStatusView(self, selected_year, 'not_declined', NOT_DECLINED)
+
+
+class SqlStatusView:
+    # The rows of one year with the given status codes, as a table read a page at a time
+    def __init__(self, dataset, selected_year, name, statuses):
+        self.dataset = dataset
+        self.selected_year = selected_year
+        self.name = name
+        self.statuses = statuses
+        self.version = (dataset.key, name, selected_year)
+
+    def __len__(self):
+        counts = self.dataset.status_counts(self.selected_year)
+        return int(counts[list(self.statuses)].sum())
+
+    def rows(self):
+        where, params = status_clause(self.statuses)
+        return SqlTable(self.dataset, self.name, f"Year = ? AND {where}", [int(self.selected_year)] + params)
+
+
+class SqlTable:
+    # Rows of a SQL dataset matching `where`. Stands in for a frame in paged_table, which sorts,
+    # filters and pages it with queries so only the visible page is ever read.
+    def __init__(self, dataset, name, where, params):
+        self.dataset = dataset
+        self.where = where
+        self.params = tuple(params)
+        self.columns = SELECTED_COLUMNS
+        self.version = (dataset.key, name) + self.params
+
+    def __len__(self):
+        return self.count()
+
+    def filter_clause(self, filter_column, filter_text):
+        if filter_column is None or not filter_text:
+            return self.where, list(self.params)
+        if filter_column in NUMERIC_COLUMNS:
+            number = pd.to_numeric(filter_text, errors='coerce')
+            if np.isnan(number):
+                return "1 = 0", []
+            return f"{self.where} AND {quote(filter_column)} = ?", list(self.params) + [float(number)]
+        condition = f"CAST({quote(filter_column)} AS TEXT) {self.dataset.engine.like} ? ESCAPE '\\'"
+        return f"{self.where} AND {condition}", list(self.params) + [like_pattern(filter_text)]
+
+    def count(self, filter_column=None, filter_text=None):
+        where, params = self.filter_clause(filter_column, filter_text)
+        return self.dataset.derive(
+            'count', where, tuple(params),
+            build=lambda: int(self.dataset.query(f"SELECT COUNT(*) AS n FROM {TABLE} WHERE {where}", params)['n'].iloc[0]),
+        )
+
+    @instrument
+    def page(self, sort_column, descending, filter_column, filter_text, offset, limit):
+        where, params = self.filter_clause(filter_column, filter_text)
+        # Unsorted tables keep the date order of the in-memory datasets
+        order = f"{quote(sort_column)} {'DESC' if descending else 'ASC'} NULLS LAST, " if sort_column else ""
+        columns = ', '.join(quote(column) for column in self.columns)
+        rows = self.dataset.query(
+            f"SELECT {columns} FROM {TABLE} WHERE {where} "
+            f"ORDER BY {order}{quote(PAYMENT_DATE_COLUMN)} NULLS LAST LIMIT ? OFFSET ?",
+            params + [int(limit), int(offset)],
+        )
+        for column in DATE_COLUMNS:
+            rows[column] = pd.to_datetime(rows[column], format='ISO8601')
+        for column in FLAG_COLUMNS:
+            rows[column] = rows[column].astype('Int8')
+        rows.index = range(offset, offset + len(rows))
+        return rows
+
+
+class SqlCube:
+    # The AggregateCube queries of the pages, each one GROUP BY in the database. Results are
+    # memoized like every other derived frame and laid out by the same functions as the cube's.
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.version = (dataset.key, 'cube')
+
+    def query(self, name, params, sql, sql_params):
+        return self.dataset.derive('cube', name, *params, build=lambda: self.dataset.query(sql, sql_params))
+
+    @instrument
+    def metrics(self, year):
+        year = int(year)
+        totals = self.query('totals', (year,), (
+            f"SELECT COUNT(*) AS total, COALESCE(SUM(Amount), 0) AS amount, COUNT(DISTINCT Company) AS companies "
+            f"FROM {TABLE} WHERE Year = ?"
+        ), [year])
+        # Types in the order they first occur in the year, like the cube's
+        types = self.query('types', (year,), (
+            f"SELECT ProcessType_Description FROM {TABLE} WHERE Year = ? AND ProcessType_Description IS NOT NULL "
+            f"GROUP BY ProcessType_Description ORDER BY MIN(Month * 7 + DayOfWeek), ProcessType_Description"
+        ), [year])
+        status_counts = self.dataset.status_counts(year)
+        return {
+            'total': int(totals['total'].iloc[0]),
+            'amount': float(totals['amount'].iloc[0]),
+            'successful': int(status_counts[STATUS_SUCCESSFUL]),
+            'pending': int(status_counts[STATUS_PENDING]),
+            'declined': int(status_counts[STATUS_DECLINED]),
+            'not_declined': int(status_counts[STATUS_SUCCESSFUL] + status_counts[STATUS_PENDING]),
+            'companies': int(totals['companies'].iloc[0]),
+            'types': list(types['ProcessType_Description']),
+        }
+
+    @instrument
+    def year_metrics(self, years):
+        # The metrics of several years at once, from one GROUP BY Year
+        where, params = in_clause('Year', years)
+        metrics = self.query('year_metrics', tuple(params), (
+            f"SELECT Year, COUNT(*) AS total, COALESCE(SUM(Amount), 0) AS amount, "
+            f"SUM(CASE WHEN Status = {STATUS_SUCCESSFUL} THEN 1 ELSE 0 END) AS successful, "
+            f"SUM(CASE WHEN Status = {STATUS_PENDING} THEN 1 ELSE 0 END) AS pending, "
+            f"SUM(CASE WHEN Status = {STATUS_DECLINED} THEN 1 ELSE 0 END) AS declined, "
+            f"COUNT(DISTINCT Company) AS companies FROM {TABLE} WHERE {where} GROUP BY Year ORDER BY Year"
+        ), params)
+        return year_metrics_frame(metrics.set_index('Year'))
+
+    @instrument
+    def type_totals(self, years, status=STATUS_SUCCESSFUL):
+        where, params = year_status_clause(years, status)
+        counts = self.query('type_totals', tuple(params), (
+            f"SELECT ProcessType_Description, Year, COUNT(*) AS Count FROM {TABLE} "
+            f"WHERE {where} AND ProcessType_Description IS NOT NULL GROUP BY ProcessType_Description, Year"
+        ), params)
+        return type_totals_frame(counts, years)
+
+    @instrument
+    def type_summary(self, year, status=STATUS_SUCCESSFUL):
+        where, params = year_status_clause(year, status)
+        summary = self.query('type_summary', tuple(params), (
+            f"SELECT ProcessType_Description, COUNT(DISTINCT Company) AS TotalCompanies, SUM(Amount) AS TotalAmount "
+            f"FROM {TABLE} WHERE {where} AND Company IS NOT NULL AND ProcessType_Description IS NOT NULL "
+            f"GROUP BY ProcessType_Description ORDER BY ProcessType_Description"
+        ), params)
+        return summary.set_index('ProcessType_Description')
+
+    @instrument
+    def top_companies(self, year, number, status=STATUS_SUCCESSFUL):
+        where, params = year_status_clause(year, status)
+        # Ties go to the company seen first, as in the cube
+        top = self.query('top_companies', (int(number),) + tuple(params), (
+            f"SELECT Company, COUNT(*) AS Count FROM {TABLE} WHERE {where} AND Company IS NOT NULL "
+            f"GROUP BY Company ORDER BY Count DESC, MIN({quote(PAYMENT_DATE_COLUMN)}) LIMIT ?"
+        ), params + [int(number)])
+        return pd.Series(top['Count'].to_numpy(), index=pd.Index(top['Company']), name='Count')
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+
+from DataProcessing import PAYMENT_DATE_COLUMN
+from Diagnostics import instrument
+from ParallelAgg import BUCKETS, bucket_ids, count_buckets, partitioned
+
+
+def bucket_starts(ids, bucket):
+    # First day of every bucket
+    ids = np.asarray(ids, dtype=np.int64)
+    if bucket == 'day':
+        return ids.astype('datetime64[D]')
+    if bucket == 'week':
+        return (ids * 7 - 3).astype('datetime64[D]')
+    months = ids * 3 if bucket == 'quarter' else ids
+    return months.astype('datetime64[M]').astype('datetime64[D]')
+
+
+def bucket_labels(ids, bucket):
+    starts = pd.DatetimeIndex(bucket_starts(ids, bucket))
+    if bucket == 'month':
+        return list(starts.strftime('%Y-%m'))
+    if bucket == 'quarter':
+        return [f"{year}-Q{quarter}" for year, quarter in zip(starts.year, starts.quarter)]
+    return list(starts.strftime('%Y-%m-%d'))
+
+
+@instrument
+def bucket_totals(bucket, span, dates, codes, types, amounts, counts=None, partitions=None, workers=1):
+    # Counts and amount sums per (bucket, type) from one bincount each over a combined integer key, per
+    # partition of the rows (all of them by default), counted in the process pool when there are workers.
+    # Every bucket from the one holding span[0] to the one holding span[1] is kept, empty or not.
+    # `counts` weighs each date (e.g. dates that are already per-day totals); by default each is one row.
+    first, last = bucket_ids(span, bucket)
+    size = int(last - first + 1)
+    columns = {
+        'dates': np.asarray(dates, dtype='datetime64[ns]'),
+        'types': np.asarray(codes),
+        'amount': np.nan_to_num(np.asarray(amounts, dtype=np.float64)),
+    }
+    if counts is not None:
+        columns['weights'] = np.asarray(counts, dtype=np.float64)
+    if partitions is None:
+        partitions = [(0, len(columns['dates']))]
+
+    results = partitioned(count_buckets, columns, partitions, (bucket, int(first), size, len(types)), workers)
+    totals = sum((result[0] for result in results), np.zeros(size * len(types)))
+    sums = sum((result[1] for result in results), np.zeros(size * len(types)))
+    return BucketTotals(
+        bucket, np.arange(first, last + 1), types,
+        totals.astype(np.int64).reshape(size, len(types)), sums.reshape(size, len(types)),
+    )
+
+
+class BucketTotals:
+    # Transactions and amounts per time bucket and type. Buckets without transactions are kept with
+    # zeros, so charts and period-over-period changes never skip an empty period.
+    def __init__(self, bucket, ids, types, counts, amounts):
+        self.bucket = bucket
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.types = pd.Index(types)
+        self.counts = counts
+        self.amounts = amounts
+
+    @property
+    def nbytes(self):
+        return int(self.ids.nbytes + self.counts.nbytes + self.amounts.nbytes) + int(self.types.memory_usage(deep=True))
+
+    @classmethod
+    def combine(cls, parts):
+        # Buckets of several spans (e.g. compared years) one after the other, over the union of their types
+        parts = list(parts)
+        types = pd.Index(sorted(set().union(*(part.types for part in parts))))
+        counts, amounts = [], []
+        for part in parts:
+            positions = types.get_indexer(part.types)
+            part_counts = np.zeros((len(part.ids), len(types)), dtype=np.int64)
+            part_amounts = np.zeros((len(part.ids), len(types)))
+            part_counts[:, positions] = part.counts
+            part_amounts[:, positions] = part.amounts
+            counts.append(part_counts)
+            amounts.append(part_amounts)
+        return cls(
+            parts[0].bucket, np.concatenate([part.ids for part in parts]), types,
+            np.concatenate(counts), np.concatenate(amounts),
+        )
+
+    def labels(self):
+        return bucket_labels(self.ids, self.bucket)
+
+    def totals(self):
+        # One row per bucket: its label, first day, and transactions and amount over every type
+        return pd.DataFrame({
+            self.bucket.title(): self.labels(),
+            'Start': bucket_starts(self.ids, self.bucket).astype('datetime64[ns]'),
+            'Count': self.counts.sum(axis=1),
+            'Amount': self.amounts.sum(axis=1),
+        })
+
+    def by_type(self):
+        # Long frame of the types present in each bucket ('ProcessType', bucket label in 'PaymentDate',
+        # Count, Amount), sorted by type; empty buckets get a zero row for every type in the span
+        present = self.counts > 0
+        empty = ~present.any(axis=1)
+        present[empty] = self.counts.sum(axis=0) > 0
+        types, buckets = np.nonzero(present.T)
+        labels = np.array(self.labels(), dtype=object)
+        return pd.DataFrame({
+            'ProcessType': self.types[types].astype(str),
+            PAYMENT_DATE_COLUMN: labels[buckets],
+            'Count': self.counts[buckets, types],
+            'Amount': self.amounts[buckets, types],
+        })
+
+    def pivot(self, values='Count'):
+        # Buckets by types, every bucket and type present
+        present = self.counts.sum(axis=0) > 0
+        table = self.counts if values == 'Count' else self.amounts
+        return pd.DataFrame(table[:, present], index=pd.Index(self.labels(), name=self.bucket.title()), columns=self.types[present])
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+
+def sort_by_time(data, column):
+    # Stable sort on the date column, missing dates last. Already-sorted frames are returned as is.
+    dates = data[column]
+    valid = dates.notna()
+    n_valid = int(valid.sum())
+    if valid.iloc[:n_valid].all() and dates.iloc[:n_valid].is_monotonic_increasing:
+        return data
+    return data.sort_values(column, kind='stable', na_position='last', ignore_index=True)
+
+
+class TimeIndex:
+    # Month and year offsets into a frame sorted by one date column, so year and date-range
+    # selections are binary searches and positional slices instead of full scans.
+    def __init__(self, dates):
+        values = dates.to_numpy(dtype='datetime64[ns]')
+        self.values = values[:int(dates.notna().sum())]
+
+        months = self.values.astype('datetime64[M]')
+        starts = np.flatnonzero(np.r_[True, months[1:] != months[:-1]]) if len(months) else np.array([], dtype=np.int64)
+        self.months = months[starts]
+        self.month_offsets = np.r_[starts, len(self.values)]
+
+        years = self.months.astype('datetime64[Y]').astype(np.int64) + 1970
+        year_starts = np.flatnonzero(np.r_[True, years[1:] != years[:-1]]) if len(years) else np.array([], dtype=np.int64)
+        self.years = years[year_starts]
+        self.year_offsets = np.r_[self.month_offsets[year_starts], len(self.values)]
+
+    def year_options(self):
+        return [int(year) for year in self.years]
+
+    def year_bounds(self, year):
+        position = np.searchsorted(self.years, year)
+        if position == len(self.years) or self.years[position] != year:
+            return 0, 0
+        return int(self.year_offsets[position]), int(self.year_offsets[position + 1])
+
+    def month_bounds(self, year, month):
+        position = np.searchsorted(self.months, np.datetime64(f'{year:04d}-{month:02d}', 'M'))
+        if position == len(self.months) or self.months[position] != np.datetime64(f'{year:04d}-{month:02d}', 'M'):
+            return 0, 0
+        return int(self.month_offsets[position]), int(self.month_offsets[position + 1])
+
+    def range_bounds(self, start, end):
+        # Rows with start <= date < end
+        start = np.datetime64(pd.Timestamp(start), 'ns')
+        end = np.datetime64(pd.Timestamp(end), 'ns')
+        return int(np.searchsorted(self.values, start, side='left')), int(np.searchsorted(self.values, end, side='left'))
@@ -0,0 +1,66 @@
+import numpy as np
+
+from Diagnostics import instrument
+
+STATUS_SUCCESSFUL = 0
+STATUS_PENDING = 1
+STATUS_DECLINED = 2
+STATUS_OTHER = 3
+STATUS_COUNT = 4
+
+# Status codes making up each transaction subset shown on the dashboard
+SUCCESSFUL = (STATUS_SUCCESSFUL,)
+NOT_DECLINED = (STATUS_SUCCESSFUL, STATUS_PENDING)
+DECLINED = (STATUS_DECLINED,)
+
+
+def flag_equals(values, flag):
+    # Nullable flag columns compare to <NA>; a missing flag never matches
+    return np.asarray((values == flag).fillna(False), dtype=bool)
+
+
+@instrument
+def transaction_status(data):
+    # One pass over the flags giving a status code per row:
+    # successful (not declined, paid, ProcessFlag 'A'), pending (not declined otherwise), declined, other
+    not_declined = flag_equals(data['PaymentDeclined'], 0)
+    declined = flag_equals(data['PaymentDeclined'], 1)
+    successful = not_declined & flag_equals(data['PaymentFlag'], 1) & np.asarray(data['ProcessFlag'].isin(['A']), dtype=bool)
+
+    status = np.full(len(data), STATUS_OTHER, dtype=np.int8)
+    status[not_declined] = STATUS_PENDING
+    status[successful] = STATUS_SUCCESSFUL
+    status[declined] = STATUS_DECLINED
+    return status
+
+
+class StatusView:
+    # The rows of one year with the given status codes. Only row positions are kept;
+    # the rows themselves are taken from the dataset the first time a page asks for them.
+    def __init__(self, dataset, selected_year, name, statuses):
+        self.dataset = dataset
+        self.selected_year = selected_year
+        self.name = name
+        self.statuses = statuses
+        self.version = (dataset.key, name, selected_year)
+
+    def __len__(self):
+        counts = self.dataset.status_counts(self.selected_year)
+        return int(counts[list(self.statuses)].sum())
+
+    @instrument
+    def positions(self):
+        def build():
+            start, stop = self.dataset.time_index.year_bounds(self.selected_year)
+            status = self.dataset.status()[start:stop]
+            positions = np.flatnonzero(np.isin(status, self.statuses)) + start
+            return positions.astype(np.int32) if len(self.dataset.data) < 2 ** 31 else positions
+
+        return self.dataset.derive(self.name, self.selected_year, 'positions', build=build)
+
+    @instrument
+    def rows(self):
+        return self.dataset.derive(
+            self.name, self.selected_year, 'rows',
+            build=lambda: self.dataset.versioned(self.dataset.data.take(self.positions()), self.name, self.selected_year, 'rows'),
+        )
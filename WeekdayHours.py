@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from AggregateCube import ordered_days, type_by_weekday_frame
+from Diagnostics import instrument
+from ParallelAgg import count_weekday_hours, partitioned
+
+HOURS = list(range(24))
+
+
+def type_codes(values):
+    # Integer code per row and the types they index, sorted by name; -1 for rows with no type
+    if isinstance(values.dtype, pd.CategoricalDtype) and values.cat.categories.is_monotonic_increasing:
+        return values.cat.codes.to_numpy(), pd.Index(values.cat.categories.astype(str))
+    codes, types = pd.factorize(values, sort=True)
+    return codes, pd.Index(types.astype(str))
+
+
+@instrument
+def weekday_hour_counts(codes, type_count, dates, partitions=None, workers=1):
+    # Rows per (type, weekday, hour): one bincount per partition of the rows (all of them by default),
+    # counted in the process pool when there are workers, and summed
+    columns = {'dates': np.asarray(dates, dtype='datetime64[ns]'), 'types': np.asarray(codes)}
+    if partitions is None:
+        partitions = [(0, len(columns['dates']))]
+    counts = partitioned(count_weekday_hours, columns, partitions, (type_count,), workers)
+    return sum(counts, np.zeros(type_count * 7 * 24, dtype=np.int64)).reshape(type_count, 7, 24)
+
+
+class WeekdayHours:
+    # Transactions counted by type, weekday and hour of one date column. The Weekly page's tables
+    # and heatmaps are sums over its axes, so none of them goes back to the rows.
+    def __init__(self, types, counts):
+        self.types = pd.Index(types)
+        self.counts = counts
+
+    @property
+    def nbytes(self):
+        return int(self.counts.nbytes) + int(self.types.memory_usage(deep=True))
+
+    def present_types(self):
+        return list(self.types[self.counts.sum(axis=(1, 2)) > 0])
+
+    def type_by_weekday(self):
+        # Same layout as the cube's: ProcessType_Description, weekday name, Count for every non-empty pair
+        by_weekday = self.counts.sum(axis=2)
+        types, weekdays = np.nonzero(by_weekday)
+        return type_by_weekday_frame(pd.DataFrame({
+            'ProcessType_Description': self.types[types],
+            'DayOfWeek': weekdays,
+            'Count': by_weekday[types, weekdays],
+        }))
+
+    def heatmap(self, types=None):
+        # Weekdays by hour of the day, over every type or only the given ones
+        counts = self.counts
+        if types is not None:
+            positions = self.types.get_indexer(list(types))
+            counts = counts[positions[positions >= 0]]
+        return pd.DataFrame(counts.sum(axis=0), index=ordered_days, columns=HOURS)
@@ -0,0 +1,73 @@
+# Compares DateParser.parse_dates with the pd.to_datetime(format='mixed') call it replaced.
+#
+#   python benchmarks/bench_date_parsing.py --rows 1000000
+#   python benchmarks/bench_date_parsing.py --csv export.csv
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DateParser import parse_dates
+
+PAID_DATE_COLUMN = "PaidDate"
+
+# Layouts mixed together the way they show up in GAPS exports
+SAMPLE_FORMATS = ['%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%m/%d/%Y %H:%M', '%Y-%m-%d']
+
+
+def synthetic_paid_dates(rows, distinct, seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2021-01-01')
+    offsets = pd.to_timedelta(rng.integers(0, 3 * 365 * 24 * 3600, distinct), unit='s')
+    stamps = pd.DatetimeIndex(start + offsets)
+    layouts = rng.integers(0, len(SAMPLE_FORMATS), distinct)
+    values = np.empty(distinct, dtype=object)
+    for position, date_format in enumerate(SAMPLE_FORMATS):
+        mask = layouts == position
+        values[mask] = stamps[mask].strftime(date_format)
+    # Paid dates repeat heavily: draw the rows from the distinct pool
+    column = pd.Series(values[rng.integers(0, distinct, rows)], dtype='str', name=PAID_DATE_COLUMN)
+    column[rng.random(rows) < 0.02] = None
+    return column
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PaidDate parsing")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--distinct', type=int, default=50_000)
+    parser.add_argument('--csv', help="read PaidDate from a real export instead of generating it")
+    args = parser.parse_args()
+
+    if args.csv:
+        column = pd.read_csv(args.csv, usecols=[PAID_DATE_COLUMN], dtype='str')[PAID_DATE_COLUMN]
+    else:
+        column = synthetic_paid_dates(args.rows, args.distinct)
+
+    baseline, baseline_seconds = timed(lambda: pd.to_datetime(column, format='mixed', errors='coerce'))
+    (parsed, report), parsed_seconds = timed(lambda: parse_dates(column))
+
+    matches = bool((parsed.isna() == baseline.isna()).all() and (parsed.dropna() == baseline.dropna()).all())
+
+    print(f"rows:                  {len(column):,}")
+    print(f"unique values:         {report['unique_values']:,}")
+    print(f"format='mixed':        {baseline_seconds:.3f}s")
+    print(f"parse_dates:           {parsed_seconds:.3f}s")
+    print(f"speedup:               {baseline_seconds / parsed_seconds:.1f}x")
+    print(f"formats used:          {report['formats']}")
+    print(f"unparseable rows:      {report['unparseable_rows']:,}")
+    print(f"same result as mixed:  {matches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# Seeded generator of synthetic GAPS transaction exports, written in chunks so 10^8-row files
+# never have to fit in memory.
+#
+#   python benchmarks/generate_gaps.py --rows 1000000 --output gaps_1m.csv
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DataProcessing import PROCESS_TYPE_MAPPING
+
+CHUNK_ROWS = 1_000_000
+COMPANIES = 5_000
+
+# Share of each process type code, busiest first (GTB and RTGS carry most of the volume)
+PROCESS_TYPE_WEIGHTS = {1: 0.30, 11: 0.18, 4: 0.12, 5: 0.08, 7: 0.07, 2: 0.06, 12: 0.04, 13: 0.04, 14: 0.03, 3: 0.02, 6: 0.02, 8: 0.02, 9: 0.01, 10: 0.01}
+
+# PaidDate layouts mixed together the way they show up in real exports
+PAID_DATE_FORMATS = ['%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%m/%d/%Y %H:%M', '%Y-%m-%d']
+PAID_DATE_FORMAT_WEIGHTS = [0.55, 0.30, 0.10, 0.05]
+
+DECLINED_RATIO = 0.04
+PAYMENT_FLAG_RATIO = 0.92
+PROCESS_FLAG_RATIOS = {'A': 0.85, 'P': 0.10, 'R': 0.05}
+CURRENCY_RATIOS = {'UGX': 0.9, 'USD': 0.08, 'EUR': 0.02}
+BANKS = ['GTBANK', 'STANBIC', 'CENTENARY', 'ABSA', 'DFCU', 'EQUITY', 'BANK OF AFRICA', 'HOUSING FINANCE']
+REMARKS = ['', 'Salary', 'Supplier payment', 'Utility bill', 'Insufficient funds', 'Invalid account', 'Tax']
+
+
+def company_names(rng):
+    names = np.array([f"COMPANY {number:05d} LTD" for number in range(COMPANIES)], dtype=object)
+    # A few companies are exported with stray whitespace, like the real data
+    padded = rng.random(COMPANIES) < 0.02
+    names[padded] = [f" {name} " for name in names[padded]]
+    return names
+
+
+def company_weights():
+    # Zipf-like skew: a handful of corporates submit most of the volume
+    weights = 1.0 / np.arange(1, COMPANIES + 1) ** 1.1
+    return weights / weights.sum()
+
+
+def format_paid_dates(stamps, layouts):
+    values = np.empty(len(stamps), dtype=object)
+    for position, date_format in enumerate(PAID_DATE_FORMATS):
+        mask = layouts == position
+        if mask.any():
+            formatted = stamps[mask].strftime(date_format)
+            if date_format.endswith('%f'):
+                # Exports carry milliseconds, not microseconds
+                formatted = formatted.str[:-3]
+            values[mask] = formatted
+    return values
+
+
+def generate_chunk(rng, start_id, rows, start, seconds, names, weights):
+    payment_dates = start + pd.to_timedelta(np.sort(rng.integers(0, seconds, rows)), unit='s')
+    paid_dates = payment_dates + pd.to_timedelta(rng.integers(60, 3 * 24 * 3600, rows), unit='s')
+
+    declined = (rng.random(rows) < DECLINED_RATIO).astype(np.int8)
+    paid_layouts = rng.choice(len(PAID_DATE_FORMATS), rows, p=PAID_DATE_FORMAT_WEIGHTS)
+    paid_values = format_paid_dates(pd.DatetimeIndex(paid_dates), paid_layouts)
+    # Declined payments are never paid
+    paid_values[declined == 1] = ''
+
+    process_types = PROCESS_TYPE_MAPPING['ProcessType'].to_numpy()
+    process_weights = np.array([PROCESS_TYPE_WEIGHTS[process_type] for process_type in process_types])
+
+    return pd.DataFrame({
+        'TransID': np.arange(start_id, start_id + rows),
+        'BatchID': start_id // 50 + rng.integers(0, rows // 50 + 1, rows),
+        'VendorName': np.char.add('VENDOR ', rng.integers(0, 20_000, rows).astype(str)),
+        'VendorBankName': rng.choice(BANKS, rows),
+        'VendorAcctNumber': rng.integers(10 ** 9, 10 ** 10, rows).astype(str),
+        'Amount': np.round(rng.lognormal(13, 1.5, rows), 2),
+        'Currency': rng.choice(list(CURRENCY_RATIOS), rows, p=list(CURRENCY_RATIOS.values())),
+        'CustomerAcctNumber': rng.integers(10 ** 9, 10 ** 10, rows).astype(str),
+        'CompanyName': names[rng.choice(COMPANIES, rows, p=weights)],
+        'PaymentDate': np.datetime_as_string(payment_dates.to_numpy(dtype='datetime64[ms]'), unit='ms'),
+        'PaidDate': paid_values,
+        'ProcessFlag': rng.choice(list(PROCESS_FLAG_RATIOS), rows, p=list(PROCESS_FLAG_RATIOS.values())),
+        'ProcessType': rng.choice(process_types, rows, p=process_weights),
+        'PaymentDeclined': declined,
+        'PaymentFlag': np.where(declined == 1, 0, rng.random(rows) < PAYMENT_FLAG_RATIO).astype(np.int8),
+        'Remarks': rng.choice(REMARKS, rows),
+        # Columns the dashboard never reads, present in real exports
+        'CreatedBy': rng.choice(['SYSTEM', 'API', 'PORTAL'], rows),
+        'ChargeAmount': np.round(rng.random(rows) * 5000, 2),
+    })
+
+
+def generate(path, rows, seed=0, start_year=2021, years=3):
+    rng = np.random.default_rng(seed)
+    names = company_names(rng)
+    weights = company_weights()
+
+    start = pd.Timestamp(f'{start_year}-01-01')
+    end = pd.Timestamp(f'{start_year + years}-01-01')
+    total_seconds = int((end - start).total_seconds())
+
+    written = 0
+    while written < rows:
+        chunk_rows = min(CHUNK_ROWS, rows - written)
+        # Each chunk covers its share of the period, so the file is in PaymentDate order like an export
+        chunk_start = start + pd.Timedelta(seconds=total_seconds * written // rows)
+        chunk_seconds = max(total_seconds * chunk_rows // rows, 1)
+        chunk = generate_chunk(rng, written + 1, chunk_rows, chunk_start, chunk_seconds, names, weights)
+        chunk.to_csv(path, mode='w' if written == 0 else 'a', header=written == 0, index=False)
+        written += chunk_rows
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic GAPS export")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start-year', type=int, default=2021)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    output = args.output or f"gaps_{args.rows}.csv"
+    generate(output, args.rows, seed=args.seed, start_year=args.start_year, years=args.years)
+    print(f"Wrote {args.rows:,} rows to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+# Starts the dashboard with `streamlit run` on a local port, as it is deployed, and drives simulated
+# analyst sessions against that one app worker over its websocket, the way browser tabs do. Reports
+# rerun latency percentiles, server memory per session and throughput as concurrent sessions grow.
+#
+# Every session opens the synthetic export from the data folder, switches the year, narrows and
+# restores the Transaction Types filter and visits every page.
+#
+#   python benchmarks/load_test.py --rows 500000 --sessions 1 2 4 8
+#   python benchmarks/load_test.py --csv export.csv --sessions 4 16 --rounds 3 --output load.json
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import numpy as np
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from websockets.sync.client import connect
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from generate_gaps import generate
+from run_benchmarks import git_revision
+
+DASHBOARD = os.path.join(APP_DIR, "dashboard.py")
+YEAR_LABEL = "Select a Year"
+# Widgets inside page sections: the step name they are timed under, and the values a session moves
+# through, ending back where it started
+SECTION_CHANGES = [
+    ('top_companies', 'Select the number of companies to show', lambda slider: [slider.max, slider.default[0]]),
+    ('type_filter', 'Select Process Type Descriptions', lambda multiselect: [list(multiselect.options)[:max(len(multiselect.options) // 2, 1)], list(multiselect.options)]),
+    ('period', "Group transactions by", lambda radio: ["Week", "Month"]),
+    ('heatmap_types', "Transaction types", lambda multiselect: [list(multiselect.options)[:1], []]),
+]
+# A rerun taking longer than this counts as stalled and fails the session
+RUN_TIMEOUT = 300
+
+
+def rss_bytes(pid):
+    # Resident memory of the server process, from /proc; None where there is no /proc
+    try:
+        with open(f'/proc/{pid}/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'max': float(max(latencies))}
+
+
+def open_socket(port):
+    return connect(f"ws://localhost:{port}/_stcore/stream", subprotocols=["streamlit"], max_size=None)
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('localhost', 0))
+        return probe.getsockname()[1]
+
+
+class Server:
+    # The dashboard under `streamlit run`, headless, with the data folder and upload cache of the test
+    def __init__(self, data_dir, cache_dir, log_path):
+        self.port = free_port()
+        self.env = dict(os.environ, GAPS_DATA_DIR=data_dir, GAPS_CACHE_DIR=cache_dir, GAPS_DROP_POLL_SECONDS="0.5")
+        self.log_path = log_path
+        self.process = None
+
+    def start(self, timeout=60):
+        with open(self.log_path, 'w') as log:
+            self.process = subprocess.Popen(
+                [
+                    sys.executable, '-m', 'streamlit', 'run', DASHBOARD,
+                    '--server.headless', 'true', '--server.port', str(self.port),
+                    '--server.fileWatcherType', 'none', '--browser.gatherUsageStats', 'false',
+                ],
+                cwd=APP_DIR, env=self.env, stdout=log, stderr=subprocess.STDOUT,
+            )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"the server exited with code {self.process.returncode}; see {self.log_path}")
+            try:
+                with urllib.request.urlopen(f"http://localhost:{self.port}/_stcore/health", timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError(f"the server did not answer within {timeout} s; see {self.log_path}")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(timeout=30)
+
+    def rss(self):
+        return rss_bytes(self.process.pid)
+
+    def prewarm(self):
+        # Same as a deployment: exports are parsed into the upload cache before the server opens them
+        subprocess.run([sys.executable, 'prewarm.py'], cwd=APP_DIR, env=self.env, check=True, stdout=subprocess.DEVNULL)
+
+
+class AppSession:
+    # One browser tab: a websocket session that asks for script runs with its widget values and
+    # page, and reads back the widgets and pages each run rendered. A widget inside a page section
+    # (st.fragment) reruns only its section, as in the browser, unless `full_reruns` is set.
+    def __init__(self, socket, full_reruns=False):
+        self.socket = socket
+        self.full_reruns = full_reruns
+        self.page_hash = ""
+        self.pages = {}
+        self.widgets = {}
+        self.fragments = {}
+        self.states = {}
+
+    def rerun(self, fragment_id=""):
+        back = BackMsg()
+        back.rerun_script.page_script_hash = self.page_hash
+        back.rerun_script.fragment_id = fragment_id
+        back.rerun_script.widget_states.widgets.extend(self.states.values())
+        self.socket.send(back.SerializeToString())
+
+        widgets = {}
+        while True:
+            message = ForwardMsg()
+            message.ParseFromString(self.socket.recv(timeout=RUN_TIMEOUT))
+            kind = message.WhichOneof('type')
+            if kind == 'navigation':
+                self.pages = {page.page_name: page.page_script_hash for page in message.navigation.app_pages}
+            elif kind == 'delta' and message.delta.WhichOneof('type') == 'new_element':
+                element = message.delta.new_element
+                value = getattr(element, element.WhichOneof('type'))
+                if element.WhichOneof('type') == 'exception':
+                    raise RuntimeError(f"{value.type}: {value.message}")
+                if hasattr(value, 'id') and hasattr(value, 'label'):
+                    widgets[value.label] = value
+                    self.fragments[value.id] = message.delta.fragment_id
+            elif kind == 'script_finished':
+                # Runs the app cuts short to rerun itself (e.g. ingest progress) are followed to the end
+                if message.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise RuntimeError("the page did not compile")
+                if message.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    break
+        if fragment_id:
+            # A section rerun only sends that section's widgets; the rest of the page stays as it was
+            widgets = {label: widget for label, widget in self.widgets.items() if self.fragments.get(widget.id) != fragment_id} | widgets
+        self.widgets = widgets
+        # Like the browser, only the values of widgets still on the page are sent again
+        rendered = {widget.id for widget in widgets.values()}
+        self.states = {key: state for key, state in self.states.items() if key in rendered}
+
+    def switch_page(self, name):
+        self.page_hash = self.pages[name]
+        self.rerun()
+
+    def select(self, label, value):
+        # Selectboxes and radios send their option's text, multiselects the list of options, sliders a number
+        widget = self.widgets.get(label)
+        if widget is None:
+            raise RuntimeError(f"no widget {label!r} on the page")
+        state = self.states[widget.id] = WidgetState(id=widget.id)
+        if isinstance(value, list):
+            state.string_array_value.data[:] = value
+        elif isinstance(value, (int, float)):
+            state.double_array_value.data[:] = [value]
+        else:
+            state.string_value = value
+        self.rerun("" if self.full_reruns else self.fragments.get(widget.id, ""))
+
+
+class Session:
+    # One simulated analyst, with a latency per rerun it asked for
+    def __init__(self, index, rounds, port, full_reruns):
+        self.index = index
+        self.rounds = rounds
+        self.port = port
+        self.full_reruns = full_reruns
+        self.latencies = []
+        self.error = None
+
+    def step(self, name, action, *args):
+        start = time.perf_counter()
+        action(*args)
+        self.latencies.append((name, time.perf_counter() - start))
+
+    def run(self, start_barrier):
+        try:
+            start_barrier.wait()
+            with open_socket(self.port) as socket:
+                self.visit(AppSession(socket, self.full_reruns))
+        except Exception as error:
+            self.error = error
+
+    def visit(self, app):
+        self.step('open', app.rerun)
+        year_box = app.widgets.get(YEAR_LABEL)
+        if year_box is None:
+            raise RuntimeError("the dashboard did not open a dataset; is the data folder ready?")
+        years = list(year_box.options)
+        home = next(iter(app.pages))
+
+        for round_number in range(self.rounds):
+            # Each round moves to another year (sessions start on different ones) and back through every page
+            year = years[(self.index + round_number + 1) % len(years)]
+            self.step('dashboard_year', app.select, YEAR_LABEL, year)
+            self.change_sections(app)
+            for page in list(app.pages)[1:]:
+                self.step(f'page {page}', app.switch_page, page)
+                self.change_sections(app)
+            self.step('dashboard', app.switch_page, home)
+
+    def change_sections(self, app):
+        for name, label, values in SECTION_CHANGES:
+            widget = app.widgets.get(label)
+            if widget is not None:
+                for value in values(widget):
+                    self.step(name, app.select, label, value)
+
+
+def run_level(server, count, rounds, full_reruns):
+    # `count` sessions at once. Memory per session is the server's peak resident memory above its
+    # baseline, shared by the sessions: it includes their script runs, not only their session state.
+    sessions = [Session(index, rounds, server.port, full_reruns) for index in range(count)]
+    barrier = threading.Barrier(count + 1)
+    threads = [threading.Thread(target=session.run, args=(barrier,), name=f"load-session-{session.index}") for session in sessions]
+    rss_before = server.rss()
+    with RssSampler(server) as rss:
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+
+    latencies = [latency for session in sessions for _, latency in session.latencies]
+    by_step = {}
+    for session in sessions:
+        for step, latency in session.latencies:
+            by_step.setdefault(step, []).append(latency)
+    errors = [f"session {session.index}: {session.error}" for session in sessions if session.error is not None]
+    return {
+        'sessions': count,
+        'reruns': len(latencies),
+        'seconds': seconds,
+        'throughput': len(latencies) / seconds if seconds else None,
+        'latency': percentiles(latencies),
+        'latency_by_step': {step: percentiles(values) for step, values in sorted(by_step.items())},
+        'rss_before': rss_before,
+        'rss_peak': rss.peak,
+        'rss_per_session': (rss.peak - rss_before) / count if rss_before is not None else None,
+        'errors': errors,
+    }
+
+
+class RssSampler:
+    # Highest resident memory of the server while a level runs, sampled from a background thread
+    def __init__(self, server, interval=0.05):
+        self.server = server
+        self.interval = interval
+        self.peak = server.rss()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, name="load-rss", daemon=True)
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            self.record()
+
+    def record(self):
+        rss = self.server.rss()
+        if rss is not None:
+            self.peak = max(self.peak, rss)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+        self.record()
+        return False
+
+
+def wait_until_ready(server, timeout):
+    # Sessions are only let in once the folder watcher lists the export and a session opens it
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with open_socket(server.port) as socket:
+            app = AppSession(socket)
+            app.rerun()
+        if YEAR_LABEL in app.widgets:
+            return
+        time.sleep(0.5)
+    raise RuntimeError(f"the data folder was not ready after {timeout} s")
+
+
+def print_level(result):
+    latency = result['latency']
+    per_session = result['rss_per_session']
+    line = (
+        f"{result['sessions']:>8} {result['reruns']:>7} {result['throughput']:>10.2f} "
+        f"{latency['p50'] * 1000:>9.0f} {latency['p95'] * 1000:>9.0f} {latency['p99'] * 1000:>9.0f} "
+        + (f"{per_session / 1024 ** 2:>12.1f}" if per_session is not None else f"{'n/a':>12}")
+    ) if latency['p50'] is not None else f"{result['sessions']:>8} no reruns completed"
+    print(line)
+    steps = [(name, result['latency_by_step'][name]['p50']) for name, _, _ in SECTION_CHANGES if name in result['latency_by_step']]
+    if steps:
+        print(f"{'':>8} section widgets, p50: " + ", ".join(f"{name} {p50 * 1000:.0f} ms" for name, p50 in steps))
+    for error in result['errors']:
+        print(f"         ! {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the dashboard with concurrent sessions against a local server")
+    parser.add_argument('--csv', help="Existing GAPS export; a synthetic one is generated otherwise")
+    parser.add_argument('--rows', type=int, default=200_000, help="Rows of the synthetic export")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8], help="Concurrent session counts to try")
+    parser.add_argument('--rounds', type=int, default=2, help="Times each session goes through the year switch and every page")
+    parser.add_argument('--full-reruns', action='store_true', help="Rerun the whole page for widgets in page sections too, to compare")
+    parser.add_argument('--ready-timeout', type=float, default=600, help="Seconds to wait for the export to be ingested")
+    parser.add_argument('--output', default=None, help="JSON file for the results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        data_dir = os.path.join(scratch, "data")
+        os.makedirs(data_dir)
+        if args.csv:
+            os.symlink(os.path.abspath(args.csv), os.path.join(data_dir, os.path.basename(args.csv)))
+        else:
+            generate(os.path.join(data_dir, f"gaps_{args.rows}.csv"), args.rows, seed=args.seed)
+
+        server = Server(data_dir, os.path.join(scratch, "cache"), os.path.join(scratch, "server.log"))
+        start = time.perf_counter()
+        server.prewarm()
+        try:
+            server.start()
+            wait_until_ready(server, args.ready_timeout)
+            print(f"Export ingested and served in {time.perf_counter() - start:.1f} s; {os.cpu_count()} cores")
+            print(f"{'sessions':>8} {'reruns':>7} {'reruns/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'MB/session':>12}")
+            levels = []
+            for count in args.sessions:
+                levels.append(run_level(server, count, args.rounds, args.full_reruns))
+                print_level(levels[-1])
+        finally:
+            server.stop()
+
+    results = {
+        'metadata': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': git_revision(),
+            'source': args.csv or f"synthetic {args.rows} rows (seed {args.seed})",
+            'cpu_count': os.cpu_count(),
+            'rounds': args.rounds,
+            'full_reruns': args.full_reruns,
+        },
+        'levels': levels,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
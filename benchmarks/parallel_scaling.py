@@ -0,0 +1,133 @@
+# Times the aggregate cube build and the page time-series and weekday-hour counts serially and
+# month-partitioned across a growing number of pool processes, to show how the parallel aggregation
+# scales with core count.
+#
+#   python benchmarks/parallel_scaling.py --rows 5000000
+#   python benchmarks/parallel_scaling.py --csv export.csv --workers 1 2 4 8 16 --output scaling.json
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from AggregateCube import AggregateCube
+from DataProcessing import PROCESSING_VERSION, prepare_dataset
+from DatasetStore import Dataset
+from ParallelAgg import month_partitions
+from TimeBuckets import bucket_totals
+from WeekdayHours import type_codes, weekday_hour_counts
+from generate_gaps import generate
+from run_benchmarks import convert_dates, git_revision, quiet, read_csv
+
+
+def default_workers():
+    counts = [1]
+    while counts[-1] * 2 <= (os.cpu_count() or 1):
+        counts.append(counts[-1] * 2)
+    if counts[-1] != (os.cpu_count() or 1):
+        counts.append(os.cpu_count())
+    return counts
+
+
+def best_of(run, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def run_scaling(path, workers, repeat=3):
+    data = quiet(prepare_dataset, convert_dates(read_csv(path)))
+    dataset = Dataset(f"scaling-p{PROCESSING_VERSION}", data)
+    data = dataset.data
+    status = dataset.status()
+    dates = data['PaymentDate'].to_numpy(dtype='datetime64[ns]')
+    partitions = month_partitions(dates)
+    print(f"{len(data):,} rows in {len(partitions)} month partitions, {os.cpu_count()} cores")
+
+    serial, expected = best_of(lambda: AggregateCube(data, status=status), repeat)
+    print(f"{'groupby (serial)':<20} {serial * 1000:10.1f} ms")
+    results = [{'mode': 'groupby', 'workers': 1, 'seconds': serial, 'speedup': 1.0}]
+
+    for count in workers:
+        # The first run starts the pool processes; start-up is reported, not timed with the counting
+        start = time.perf_counter()
+        AggregateCube.partitioned(data, status=status, workers=count)
+        startup = time.perf_counter() - start
+
+        seconds, cube = best_of(lambda: AggregateCube.partitioned(data, status=status, workers=count), repeat)
+        pd.testing.assert_frame_equal(expected.cube, cube.cube, check_exact=False)
+        speedup = serial / seconds
+        print(f"{f'partitioned x{count}':<20} {seconds * 1000:10.1f} ms  speedup x{speedup:5.2f}  first run {startup * 1000:,.0f} ms")
+        results.append({'mode': 'partitioned', 'workers': count, 'seconds': seconds, 'speedup': speedup, 'first_run_seconds': startup})
+
+    # The Monthly page's daily totals and the Weekly page's weekday-hour grid, over the same partitions
+    codes, types = type_codes(data['ProcessType_Description'])
+    amounts = data['Amount'].to_numpy()
+    counts = {
+        'buckets': lambda partitions, count: bucket_totals(
+            'day', dates[[0, -1]], dates, codes, types, amounts, partitions=partitions, workers=count,
+        ).counts,
+        'weekday_hours': lambda partitions, count: weekday_hour_counts(codes, len(types), dates, partitions, count),
+    }
+    for mode, run in counts.items():
+        serial, expected = best_of(lambda: run(None, 1), repeat)
+        print(f"{f'{mode} (serial)':<20} {serial * 1000:10.1f} ms")
+        results.append({'mode': mode, 'workers': 1, 'seconds': serial, 'speedup': 1.0})
+        for count in workers:
+            seconds, result = best_of(lambda: run(partitions, count), repeat)
+            assert np.array_equal(expected, result)
+            speedup = serial / seconds
+            print(f"{f'{mode} x{count}':<20} {seconds * 1000:10.1f} ms  speedup x{speedup:5.2f}")
+            results.append({'mode': f'{mode} partitioned', 'workers': count, 'seconds': seconds, 'speedup': speedup})
+
+    return {
+        'metadata': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': git_revision(),
+            'source': path,
+            'rows': len(data),
+            'partitions': len(partitions),
+            'cpu_count': os.cpu_count(),
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the month-partitioned aggregations against core count")
+    parser.add_argument('--csv', help="Existing GAPS export; a synthetic one is generated otherwise")
+    parser.add_argument('--rows', type=int, default=2_000_000, help="Rows of the synthetic export")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, nargs='+', default=None, help="Pool sizes to try (default: powers of two up to the core count)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None, help="JSON file for the results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        path = args.csv
+        if path is None:
+            path = os.path.join(scratch, f"gaps_{args.rows}.csv")
+            generate(path, args.rows, seed=args.seed)
+        results = run_scaling(path, args.workers or default_workers(), repeat=args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+# Times and memory-profiles each stage of the dashboard pipeline on a GAPS export and saves the
+# results as JSON, so runs from different versions can be compared.
+#
+#   python benchmarks/run_benchmarks.py --rows 1000000 --output results.json
+#   python benchmarks/run_benchmarks.py --csv export.csv --compare baseline.json
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from DataProcessing import PAYMENT_DATE_COLUMN, PROCESSING_VERSION, prepare_dataset
+from DataTable import sort_order
+from DatasetStore import Dataset
+from DateParser import parse_dates
+from LoadData import INGEST_COLUMNS, INGEST_DTYPES
+from Memo import memo
+from generate_gaps import generate
+
+# A stage slower or bigger than the baseline by more than this is reported as a regression
+REGRESSION_RATIO = 1.2
+# Stages faster than this are too noisy to flag on time alone
+MIN_COMPARE_SECONDS = 0.005
+
+
+def rss_bytes():
+    # Resident set size of this process, from /proc where available
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(BENCHMARK_DIR), capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def row_count(value):
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(value)
+    if isinstance(value, dict):
+        counts = [row_count(item) for item in value.values()]
+        return sum(count for count in counts if count is not None)
+    return None
+
+
+def measure(name, run, rows_in, repeat, trace_memory):
+    # Every run starts from an empty memo so memoized stages are timed cold
+    timings = []
+    result = None
+    for _ in range(repeat):
+        memo.invalidate()
+        start = time.perf_counter()
+        result = run()
+        timings.append(time.perf_counter() - start)
+
+    peak_bytes = None
+    if trace_memory:
+        # Traced separately: tracemalloc slows allocation-heavy code down too much to time it
+        memo.invalidate()
+        tracemalloc.start()
+        run()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    record = {
+        'stage': name,
+        'seconds': min(timings),
+        'seconds_median': float(np.median(timings)),
+        'repeat': repeat,
+        'peak_bytes': peak_bytes,
+        'rss_bytes': rss_bytes(),
+        'rows_in': rows_in,
+        'rows_out': row_count(result),
+    }
+    peak = f"{peak_bytes / 1024 ** 2:9.1f} MB" if peak_bytes is not None else "        -"
+    print(f"{name:<22} {record['seconds'] * 1000:10.1f} ms  peak {peak}  rows {rows_in:,} -> {record['rows_out'] or 0:,}")
+    return record, result
+
+
+def read_csv(path):
+    return pd.read_csv(path, usecols=lambda column: column in INGEST_COLUMNS, dtype=INGEST_DTYPES)
+
+
+def convert_dates(raw):
+    data = raw.copy()
+    data['PaidDate'], _ = parse_dates(data['PaidDate'])
+    data[PAYMENT_DATE_COLUMN] = pd.to_datetime(data[PAYMENT_DATE_COLUMN], format='ISO8601')
+    return data
+
+
+def quiet(function, *args):
+    # prepare_dataset prints its memory report; keep it out of the benchmark output
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args)
+
+
+def status_filters(dataset, selected_year):
+    status_counts = dataset.status_counts(selected_year)
+    return {
+        'status_counts': status_counts,
+        'successful': dataset.successful(selected_year).rows(),
+        'declined': dataset.declined(selected_year).rows(),
+        'not_declined': dataset.not_declined(selected_year).positions(),
+    }
+
+
+def dashboard_page(cube, selected_year):
+    return {
+        'metrics': pd.Series(cube.metrics(selected_year)),
+        'type_summary': cube.type_summary(selected_year),
+        'top_companies': cube.top_companies(selected_year, 5),
+    }
+
+
+def run_benchmarks(path, repeat=3, trace_memory=True, selected_year=None):
+    stages = []
+
+    def stage(name, run, rows_in):
+        record, result = measure(name, run, rows_in, repeat, trace_memory)
+        stages.append(record)
+        return result
+
+    raw = stage('csv_load', lambda: read_csv(path), 0)
+    rows = len(raw)
+    converted = stage('date_parsing', lambda: convert_dates(raw), rows)
+    del raw
+    data = stage('processed_data', lambda: quiet(prepare_dataset, converted), rows)
+    del converted
+
+    key = f"benchmark-p{PROCESSING_VERSION}"
+    dataset = Dataset(key, data)
+    if selected_year is None:
+        selected_year = dataset.default_year()
+
+    stage('time_index', lambda: Dataset(key, data).time_index.year_offsets, rows)
+    year_rows = stage('year_selection', lambda: dataset.year(selected_year), rows)
+    stage('status_filters', lambda: status_filters(dataset, selected_year), len(year_rows))
+
+    stage('cube_build', lambda: dataset.cube().cube, rows)
+    cube = dataset.cube()
+    cube_rows = len(cube.cube)
+    stage('page_dashboard', lambda: dashboard_page(cube, selected_year), cube_rows)
+    year_rows = len(year_rows)
+    # Time series and weekday pages count the year's rows; timed cold, with the status codes they read
+    stage('page_transaction_types', lambda: dataset.time_buckets(selected_year, 'month').by_type(), year_rows)
+    stage('page_quarterly', lambda: dataset.time_buckets(selected_year, 'quarter').totals(), year_rows)
+    stage('page_monthly', lambda: dataset.time_buckets(selected_year, 'day').totals(), year_rows)
+    stage('page_weekly', lambda: dataset.weekday_hours(selected_year, PAYMENT_DATE_COLUMN).type_by_weekday(), year_rows)
+    stage('page_data_tables', lambda: sort_order(dataset.data, 'Amount'), rows)
+
+    return {
+        'metadata': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': git_revision(),
+            'source': path,
+            'file_bytes': os.path.getsize(path),
+            'rows': rows,
+            'selected_year': int(selected_year),
+            'repeat': repeat,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+        },
+        'stages': stages,
+    }
+
+
+def compare(results, baseline):
+    # Prints the ratio of every stage to the same stage of a baseline run
+    previous = {record['stage']: record for record in baseline['stages']}
+    regressions = []
+    print(f"\nCompared with {baseline['metadata'].get('revision')} ({baseline['metadata'].get('rows'):,} rows)")
+    for record in results['stages']:
+        old = previous.get(record['stage'])
+        if old is None:
+            continue
+        time_ratio = record['seconds'] / old['seconds'] if old['seconds'] else float('nan')
+        line = f"{record['stage']:<22} time x{time_ratio:5.2f}"
+        if record['peak_bytes'] and old.get('peak_bytes'):
+            memory_ratio = record['peak_bytes'] / old['peak_bytes']
+            line += f"  peak x{memory_ratio:5.2f}"
+        else:
+            memory_ratio = None
+        slower = time_ratio > REGRESSION_RATIO and record['seconds'] > MIN_COMPARE_SECONDS
+        if slower or (memory_ratio or 0) > REGRESSION_RATIO:
+            line += "  REGRESSION"
+            regressions.append(record['stage'])
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the GAPS dashboard pipeline stage by stage")
+    parser.add_argument('--csv', help="Existing GAPS export; a synthetic one is generated otherwise")
+    parser.add_argument('--rows', type=int, default=100_000, help="Rows of the synthetic export")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--year', type=int, default=None, help="Year to select (default: the dashboard default)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc pass")
+    parser.add_argument('--output', default=None, help="JSON file for the results")
+    parser.add_argument('--compare', default=None, help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        path = args.csv
+        if path is None:
+            path = os.path.join(scratch, f"gaps_{args.rows}.csv")
+            start = time.perf_counter()
+            generate(path, args.rows, seed=args.seed)
+            print(f"Generated {args.rows:,} rows in {time.perf_counter() - start:.1f}s")
+        results = run_benchmarks(path, repeat=args.repeat, trace_memory=not args.no_memory, selected_year=args.year)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+        print(f"Saved results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,10 @@ import plotly_express as px
 import humanize
 
 from LoadData import ExcelHandler
+from Diagnostics import diagnostics_panel, instrument
+from PageSections import section
+from Pipeline import pipeline
+from TransactionStatus import STATUS_DECLINED, STATUS_PENDING, STATUS_SUCCESSFUL
 
 
 excel_handler = ExcelHandler()
@@ -32,121 +36,16 @@ st.sidebar.title('GTBANK (Uganda)')
 st.sidebar.subheader('GAPS Dashboard')
 PAID_DATE_COLUMN = "PaidDate"
 PAYMENT_DATE_COLUMN = "PaymentDate"
+# Most companies the top companies list can be asked for
+TOP_COMPANIES_MAX = 50
 
 
 st.sidebar.divider()
 
-@st.cache_data
-def selectDataYear(selected_year, data):
-    data = data[data[PAYMENT_DATE_COLUMN].dt.year == selected_year]
-    return data
-
-@st.cache_data
-def processed_data(raw_data):
-    process_type_mapping = pd.DataFrame({
-        'ProcessType': [1, 10, 11, 12, 13, 14, 2, 3, 4, 5, 6, 7, 8, 9],
-        'ProcessType_Description': [
-            "GTB", "CONFIRMCHEQUE", "RTGS", "ATW", "AGENCYBANKING", "AIRTIME",
-            "AUTOPAY", "DRAFT", "NEFT", "NIPS", "CIT", "OWN", "NEFTDEBIT", "DIT"
-        ]
-    })
-    raw_data = raw_data.merge(process_type_mapping, on='ProcessType', how='left')
-
-    selected_columns = [
-        'TransID',
-        'BatchID',
-        'VendorName',
-        'VendorBankName',
-        'VendorAcctNumber',
-        'Amount',
-        'Currency',
-        'CustomerAcctNumber',
-        'CompanyName',
-        'PaymentDate',
-        'PaidDate',
-        'ProcessFlag',
-        'ProcessType',
-        'ProcessType_Description',
-        'PaymentDeclined',
-        'PaymentFlag',
-        'Remarks'
-    ]
-    
-    processed_data = raw_data[selected_columns]
-
-    # Remove records with PaidDate of null
-    # processed_data = processed_data.dropna(subset=[PAID_DATE_COLUMN])
-
-    return processed_data
-
-@st.cache_data
-def successfulTransaction(processed_data):
-    successful_data = processed_data[(processed_data['PaymentDeclined'] == 0) & (processed_data['PaymentFlag'] == 1) & (processed_data['ProcessFlag'].isin(['A']))]
-
-    return successful_data
-
-
-@st.cache_data
-def notDeclined(processed_data):
-    unDeclined_data = processed_data[(processed_data['PaymentDeclined'] == 0)]
-
-    return unDeclined_data
-
-@st.cache_data
-def declinedTransactions(processed_data):
-    declined_data = processed_data[(processed_data['PaymentDeclined'] == 1)]
-
-    return declined_data
-
-
-@st.cache_data
-def Monthly_count_bar_graph(successful_data_v):
-    successful_data_v['YearMonth'] = successful_data_v[PAYMENT_DATE_COLUMN].dt.to_period('M')
-    monthly_counts = successful_data_v['YearMonth'].value_counts().sort_index()
-
-    # Create a bar graph using Plotly with month names on the x-axis
-    fig = px.bar(
-        x=monthly_counts.index.strftime('%b'),  # Format month names
-        y=monthly_counts.values,
-        labels={'x': 'Month', 'y': 'Transaction Count'},
-        color_discrete_sequence=px.colors.sequential.Aggrnyl,
-    )
-
-    fig.update_layout(
-        title=f'Total Transaction Count by Month',
-        xaxis_title='Month',
-        yaxis_title='Count'
-    )
-
-    st.plotly_chart(fig,use_container_width=True)
-
-@st.cache_data
-def ProcessTypeLineGraph(filtered_data):
-    fig = px.line(
-        filtered_data,
-        x=PAYMENT_DATE_COLUMN,
-        y='Count',
-        color='ProcessType',
-        line_group='ProcessType',
-        labels={PAYMENT_DATE_COLUMN: 'Month'},
-        color_discrete_sequence=px.colors.sequential.Aggrnyl
-    )
-    fig.update_layout(
-        title=f'Total Count of Selected Process Type Descriptions Over Each Month',
-        xaxis_title='Month',
-        yaxis_title='Count',
-        legend=dict(orientation='h', y=-0.2, x=-0.1),
-    )
-    
-    st.plotly_chart(fig,use_container_width=True)
-
-
-
-def usersTop(processed_data_v,number):
-    user_counts = processed_data_v['CompanyName'].value_counts()
-
-    # Sort the user counts in descending order to get the top users
-    top_users = user_counts.head(number)  # You can adjust the number to display more or fewer top user
+@instrument
+def usersTop(dataset, selected_year, number):
+    # Top companies by successful transaction count, straight from the aggregate cube
+    top_users = pipeline.get(dataset, 'top_companies', year=selected_year, number=number)
 
     # Display the top users and their transaction counts
     st.write(f'**Top {number} Companies with the Most Transaction Counts**')
@@ -155,43 +54,101 @@ def usersTop(processed_data_v,number):
 
 
 
-
-def buildDashboard(file_raw_data):
-    data = file_raw_data
-    clean_data = processed_data(file_raw_data)
-    year_options = sorted(clean_data[PAYMENT_DATE_COLUMN].dt.year.unique())
-    default_year = 2022
+@section
+def topCompanies(dataset, selected_year, companies):
+    # The slider reruns only this list. Top-K comes from a bincount over company ids, so any N costs about the same
+    if companies > 1:
+        number_to_display = st.slider('Select the number of companies to show', min_value=1, max_value=min(companies, TOP_COMPANIES_MAX), value=min(4, companies))
+    else:
+        number_to_display = companies
+    usersTop(dataset, selected_year, number_to_display)
+
+
+def yearDelta(comparison, selected_year, column, format_value):
+    # Change of a metric from the closest earlier compared year, as an st.metric delta
+    if comparison is None:
+        return None
+    earlier = comparison.index[comparison.index < selected_year]
+    if not len(earlier):
+        return None
+    previous = comparison.loc[earlier[-1], column]
+    change = comparison.loc[selected_year, column] - previous
+    percent = f" ({change / previous * 100:+.1f} %)" if previous else ""
+    return f"{'+' if change >= 0 else '-'}{format_value(abs(change))}{percent} vs {earlier[-1]}"
+
+
+def yearOverYear(table):
+    # Percentage change of every column from the previous compared year, one column per year pair
+    years = list(table.columns)
+    changes = pd.DataFrame(index=table.index)
+    for previous, year in zip(years, years[1:]):
+        changes[f"{year} vs {previous} (%)"] = ((table[year] / table[previous].replace(0, np.nan) - 1) * 100).round(1)
+    return changes
+
+
+@instrument
+def yearComparison(dataset, comparison):
+    # `comparison` is the year_metrics node of the compared years: one grouped pass over the year key, as are the type totals
+    years = list(comparison.index)
+    st.subheader(f"Year-over-Year Comparison ({', '.join(str(year) for year in years)})")
+
+    table = pd.DataFrame({
+        'Total Count': comparison['total'],
+        'Total Amount': comparison['amount'].round(2),
+        'Processed': comparison['successful'],
+        'Un-Processed': comparison['pending'],
+        'Declined': comparison['declined'],
+        'Processed (%)': (comparison['success_ratio'] * 100).round(2),
+        'Declined (%)': (comparison['declined_ratio'] * 100).round(2),
+        'Companies': comparison['companies'],
+    }).T
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        st.write('**Metrics per Year**')
+        st.dataframe(table, use_container_width=True)
+    with col2:
+        st.write('**Year-over-Year Change**')
+        st.dataframe(yearOverYear(table), use_container_width=True)
+
+    type_totals = pipeline.get(dataset, 'type_totals', years=years)
+    st.write('**Processed Transactions per Type and Year**')
+    st.dataframe(type_totals.join(yearOverYear(type_totals)), use_container_width=True)
+
+
+@instrument
+def buildDashboard(dataset):
+    year_options = dataset.year_options()
+    default_year = dataset.default_year()
     selected_year = st.sidebar.selectbox("Select a Year", year_options, index=year_options.index(default_year))
+    st.session_state.selected_year = selected_year
+    compare_years = st.sidebar.multiselect("Compare with years", [year for year in year_options if year != selected_year])
+    st.session_state.compare_years = compare_years
 
-    processed_data_v = selectDataYear(selected_year, clean_data)
-
-    Total_v = len(processed_data_v)
-    total_amount_v = processed_data_v['Amount'].sum()
-    users_v = processed_data_v['CompanyName'].str.strip().nunique()
-
+    # Only the nodes this page shows are built; other pages ask the pipeline for their own
+    metrics = pipeline.get(dataset, 'metrics', year=selected_year)
+    compared_years = sorted([selected_year] + compare_years)
+    comparison = pipeline.get(dataset, 'year_metrics', years=compared_years) if compare_years else None
 
+    # Every status count for the year comes from one bincount over the per-row status codes
+    status_counts = pipeline.get(dataset, 'status_counts', year=selected_year)
 
-    successful_data_v = successfulTransaction(processed_data_v)
-    st.session_state.successful_data_v = successful_data_v
-
-    declined = declinedTransactions(processed_data_v)
-    st.session_state.declined = declined
-    not_declined = notDeclined(processed_data_v)
+    Total_v = int(status_counts.sum())
+    total_amount_v = metrics['amount']
+    users_v = metrics['companies']
 
 
    
-    success_v = len(successful_data_v)
-    st.session_state.success_v = success_v
+    success_v = int(status_counts[STATUS_SUCCESSFUL])
    
 
-    not_declined_v = len(not_declined)
-    declined_v = len(declined)
+    not_declined_v = int(status_counts[STATUS_SUCCESSFUL] + status_counts[STATUS_PENDING])
+    declined_v = int(status_counts[STATUS_DECLINED])
 
     un_successful_v = not_declined_v - success_v
 
     
-    Transaction_types_v = processed_data_v['ProcessType_Description'].nunique()
-    process_descriptions = processed_data_v['ProcessType_Description'].unique()
+    Transaction_types_v = len(metrics['types'])
+    process_descriptions = metrics['types']
     process_descriptions_str = ', '.join(process_descriptions)
 
 
@@ -209,8 +166,10 @@ def buildDashboard(file_raw_data):
         col1, col2, col4 = st.columns([1,1,2])
 
         with col1:
-            st.metric(label=f"Total Count ({selected_year})", value=str("{:,.0f}".format(Total_v)))
-            st.metric(label=f"Total Transaction Amount ({selected_year})", value=str(humanize.intword(total_amount_v)))
+            st.metric(label=f"Total Count ({selected_year})", value=str("{:,.0f}".format(Total_v)),
+                      delta=yearDelta(comparison, selected_year, 'total', "{:,.0f}".format))
+            st.metric(label=f"Total Transaction Amount ({selected_year})", value=str(humanize.intword(total_amount_v)),
+                      delta=yearDelta(comparison, selected_year, 'amount', humanize.intword))
 
             st.metric(label="Transaction Types", value=str(Transaction_types_v))
             st.write(f"**Transaction Types Labels** ({process_descriptions_str})")
@@ -222,18 +181,15 @@ def buildDashboard(file_raw_data):
         # with col3:
         #     st.metric(label=f"UnDeclined Transaction Count ", value=str("{:,.0f}".format(not_declined_v)), delta = f"+ UnDeclined  - ({undeclined_percent} %)" )
         with col4:
-            st.metric(label=f"Total Number of Companies on GAPS", value=str(users_v) )
-            # number_to_display = st.slider('Select the number of customers to show', min_value=1, max_value=len(successful_data_v['CompanyName'].unique()), value=10)
-            number_to_display = 4
-            usersTop(successful_data_v, number_to_display)
+            st.metric(label=f"Total Number of Companies on GAPS", value=str(users_v),
+                      delta=yearDelta(comparison, selected_year, 'companies', "{:,.0f}".format))
+            topCompanies(dataset, selected_year, users_v)
 
     with st.container():
         col2,col1 = st.columns([2,1])
         with col1:
-            result = successful_data_v.groupby('ProcessType_Description').agg({
-                'CompanyName': 'nunique',  # Count unique company names
-                'Amount': 'sum'          # Calculate the sum of Amount
-            }).rename(columns={'CompanyName': 'TotalCompanies', 'Amount': 'TotalAmount'})
+            # Unique companies and total amount per process type
+            result = pipeline.get(dataset, 'type_summary', year=selected_year)
 
             st.write(result)
 
@@ -253,19 +209,27 @@ def buildDashboard(file_raw_data):
 
             st.write("This pie chart illustrates the proportion of companies participating in different process types. Each slice represents a unique process type, and the size of the slice corresponds to the number of companies associated with that process type.")
 
+    if compare_years:
+        with st.container():
+            st.markdown("---")
+            yearComparison(dataset, comparison)
+
 
 
 
-if st.session_state.excel_data is not None:
+if excel_handler.current_dataset() is not None:
     st.sidebar.success("Data is Loaded")
 
-file_upload_csv = excel_handler.load_excel_file()
-file_session_csv = st.session_state.excel_data
+file_upload_dataset = excel_handler.load_excel_file()
+file_session_dataset = excel_handler.current_dataset()
 
-if file_session_csv is not None:
+if file_session_dataset is not None:
     st.write("session")
-    buildDashboard(file_session_csv)
+    buildDashboard(file_session_dataset)
 else:
-    if file_upload_csv is not None:
+    if file_upload_dataset is not None:
         st.sidebar.success("Upload A CSV File to Begin Analysis")
-        buildDashboard(file_upload_csv)
+        buildDashboard(file_upload_dataset)
+
+diagnostics_panel()
+excel_handler.follow_ingest()
@@ -1,5 +1,12 @@
 import streamlit as st
 from LoadData import ExcelHandler
+from FigureCache import cached_figure, downsample_frame
+from Diagnostics import diagnostics_panel, instrument
+from Memo import memoize
+from PageSections import section
+from Pipeline import pipeline
+import numpy as np
+import pandas as pd
 import plotly_express as px 
 
 # Create an instance of the ExcelHandler class
@@ -10,19 +17,21 @@ excel_handler = ExcelHandler()
 PAID_DATE_COLUMN = "PaidDate"
 PAYMENT_DATE_COLUMN = "PaymentDate"
 
-@st.cache_data
-def BarChartProcessTypes(filtered_data):
-    st.subheader("**Distribution of Transaction Types by Percent**")
-    
+@instrument
+@memoize
+def ProcessTypePercentages(filtered_data):
     # Calculate the percentage for each process type
-    filtered_data['Percentage'] = (filtered_data['Count'] / filtered_data['Count'].sum()) * 100
+    percentage = (filtered_data['Count'] / filtered_data['Count'].sum()) * 100
     
     # Group by 'ProcessType' to get total percentage for each category
-    total_percentages = filtered_data.groupby('ProcessType')['Percentage'].sum().reset_index()
+    total_percentages = percentage.groupby(filtered_data['ProcessType'], observed=True).sum().rename('Percentage').reset_index()
     
     # Sort the data in descending order by 'Percentage'
     total_percentages = total_percentages.sort_values(by='Percentage', ascending=False)
-    
+
+    return total_percentages
+
+def ProcessTypePercentFigure(total_percentages):
     # Create a horizontal bar chart using Plotly Express
     fig = px.bar(
         total_percentages,
@@ -41,12 +50,20 @@ def BarChartProcessTypes(filtered_data):
         yaxis_title='ProcessType',
         showlegend=False,  # Hide the legend for better clarity
     )
+
+    return fig
+
+def BarChartProcessTypes(filtered_data):
+    st.subheader("**Distribution of Transaction Types by Percent**")
     
-    # Displaying the horizontal bar chart using Streamlit
-    st.plotly_chart(fig, use_container_width=True)
+    total_percentages = ProcessTypePercentages(filtered_data)
+    
+    # Displaying the horizontal bar chart using Streamlit; the figure is built once per type selection
+    st.plotly_chart(cached_figure(ProcessTypePercentFigure, total_percentages), use_container_width=True)
 
-def growthTrendGraph(pivoted_data_table):
-    st.subheader("Comparison of Transaction Counts Over Time")
+def growthTrendFigure(pivoted_data_table):
+    # Long month ranges are thinned to what the chart can show
+    pivoted_data_table = downsample_frame(pivoted_data_table, None, 'MonthlyAverageCounts')
 
     # Create a line graph for the monthly total counts with markers
     line_fig = px.line(
@@ -130,10 +147,16 @@ def growthTrendGraph(pivoted_data_table):
     # Customize the line graph
     line_fig.update_xaxes(title_text='Month')
     line_fig.update_yaxes(title_text=None, showline=False, showticklabels=False)  # Remove the y-axis line
-    
+
+    return line_fig
+
+def growthTrendGraph(pivoted_data_table):
+    st.subheader("Comparison of Transaction Counts Over Time")
+
     # Use Streamlit to display the line graph
-    st.plotly_chart(line_fig, use_container_width=True)
+    st.plotly_chart(cached_figure(growthTrendFigure, pivoted_data_table), use_container_width=True)
 
+@instrument
 def GrowthTrend(filtered_data):
    # Pivot the DataFrame to create a suitable format for the grouped bar graph
     pivoted_data = filtered_data.pivot(index=PAYMENT_DATE_COLUMN, columns='ProcessType', values='Count')
@@ -158,23 +181,24 @@ def GrowthTrend(filtered_data):
     pivoted_data['AverageChange'].iloc[0] = 0
 
 
-    pivoted_data['PercentageChange'] = ((pivoted_data['MonthlyAverageCounts'] / pivoted_data['MonthlyAverageCounts'].shift(1) - 1) * 100).round()
+    # A month after an empty one has no percentage change
+    previous_average = pivoted_data['MonthlyAverageCounts'].shift(1)
+    pivoted_data['PercentageChange'] = ((pivoted_data['MonthlyAverageCounts'] / previous_average.where(previous_average > 0) - 1) * 100).round()
     pivoted_data['PercentageChange'].iloc[0] = 0  # Set the first value to 0
 
+    # Change from the same month a year earlier, when the compared years include it
+    months = pd.PeriodIndex(pivoted_data.index, freq='M')
+    previous = pd.Series(pivoted_data['MonthlyAverageCounts'].to_numpy(), index=months).reindex(months - 12).to_numpy()
+    if not np.isnan(previous).all():
+        pivoted_data['YoYChange'] = pivoted_data['MonthlyAverageCounts'] - previous
+        pivoted_data['YoYPercentageChange'] = ((pivoted_data['MonthlyAverageCounts'] / previous - 1) * 100).round()
 
-    return pivoted_data
 
-def Filtered_data(successful_data_v):
-    # Map 'ProcessType_Description' to 'ProcessType' in the DataFrame
-    process_type_monthly_counts = successful_data_v.copy()
-    process_type_monthly_counts['ProcessType'] = process_type_monthly_counts['ProcessType_Description']
-
-    # Group the data by 'ProcessType' and year-month of 'PaymentDate' and count the occurrences
-    process_type_monthly_counts = process_type_monthly_counts.groupby(['ProcessType', process_type_monthly_counts[PAYMENT_DATE_COLUMN].dt.to_period('M')]).size().reset_index(name='Count')
-
-    # Format the 'PaymentDate' to 'YYYY-MM'
-    process_type_monthly_counts[PAYMENT_DATE_COLUMN] = process_type_monthly_counts[PAYMENT_DATE_COLUMN].dt.strftime('%Y-%m')
+    return pivoted_data
 
+def Filtered_data(process_type_monthly_counts):
+    # process_type_monthly_counts comes from the month buckets: 'ProcessType', 'YYYY-MM' 'PaymentDate', 'Count' and
+    # 'Amount', with months without transactions included as zero
     all_descriptions = process_type_monthly_counts['ProcessType'].unique()
 
     # Streamlit filter for selecting 'ProcessType_Description' with multi-select checkboxes
@@ -185,15 +209,17 @@ def Filtered_data(successful_data_v):
 
     return filtered_data
 
-@st.cache_data
-def ProcessTypeBarGraph(filtered_data):
-    st.subheader("Comparison of Transaction Types by Count Over Time")
+def ProcessTypeBarFigure(filtered_data):
     # Pivot the DataFrame to create a suitable format for the grouped bar graph
     pivoted_data = filtered_data.pivot(index=PAYMENT_DATE_COLUMN, columns='ProcessType', values='Count')
 
     # If there are missing values in the pivoted data, replace them with 0
     pivoted_data = pivoted_data.fillna(0)
 
+    # Keep the busiest and quietest periods when there are more bars than pixels
+    kept = downsample_frame(pivoted_data.sum(axis=1).rename('Total').to_frame(), None, 'Total', method='minmax')
+    pivoted_data = pivoted_data.loc[kept.index]
+
     # Create a grouped bar graph using Plotly Express
     fig = px.bar(pivoted_data, x=pivoted_data.index, 
                  y=pivoted_data.columns, 
@@ -207,29 +233,51 @@ def ProcessTypeBarGraph(filtered_data):
     fig.update_yaxes(title_text='Transaction Count')
     fig.update_traces(texttemplate='%{text}', textposition='outside')  # Add labels on each bar
 
-    # Use Streamlit to display the Plotly figure
-    st.plotly_chart(fig,use_container_width=True)
+    return fig
 
-with st.container():
+def ProcessTypeBarGraph(filtered_data):
+    st.subheader("Comparison of Transaction Types by Count Over Time")
 
-    st.header("Transaction Count and Types Analysis")
-    
-    filtered_table = Filtered_data(st.session_state.successful_data_v)
+    # Use Streamlit to display the Plotly figure
+    st.plotly_chart(cached_figure(ProcessTypeBarFigure, filtered_data),use_container_width=True)
+
+@section
+def TypeBreakdown(process_type_monthly_counts):
+    filtered_table = Filtered_data(process_type_monthly_counts)
     pivote_data = GrowthTrend(filtered_table)
 
+    with st.container():
+        col1, col2 = st.columns([1,1])
+
+        with col1:
+            BarChartProcessTypes(filtered_table)
 
-    col1, col2 = st.columns([1,1])
+        with col2:
+            growthTrendGraph(pivote_data)
 
-    with col1:
-        BarChartProcessTypes(filtered_table)
+    with st.container():
 
-    with col2:
-        growthTrendGraph(pivote_data)
+        col1, col2 = st.columns([1,2])
+        with col1:
+            st.write(pivote_data)
+        with col2:
+            ProcessTypeBarGraph(filtered_table)
+
+dataset = excel_handler.page_dataset()
+if dataset is None:
+    st.warning("Missing Data, Please Add Data source.")
+    st.stop()
+selected_year = excel_handler.selected_year(dataset)
+# Years picked for comparison on the main dashboard are fetched in the same pass as the selected one
+compared_years = sorted({selected_year} | {year for year in st.session_state.get('compare_years', []) if year in dataset.year_options()})
 
 with st.container():
 
-    col1, col2 = st.columns([1,2])
-    with col1:
-        st.write(pivote_data)
-    with col2:          
-        ProcessTypeBarGraph(filtered_table)
\ No newline at end of file
+    st.header("Transaction Count and Types Analysis")
+    if len(compared_years) > 1:
+        st.caption(f"Comparing {', '.join(str(year) for year in compared_years)}: the table shows the change from the same month a year earlier.")
+
+# The type filter and everything it drives rerun on their own; the year and data source rerun the page
+TypeBreakdown(pipeline.get(dataset, 'type_by_month', years=compared_years))
+
+diagnostics_panel()
@@ -1,7 +1,8 @@
 import streamlit as st
 from LoadData import ExcelHandler
+from Diagnostics import diagnostics_panel
+from Pipeline import pipeline
 import plotly_express as px 
-import pandas as pd
 
 # Create an instance of the ExcelHandler class
 excel_handler = ExcelHandler()
@@ -46,6 +47,30 @@ def Quarterly_count_bar_graph(quarterly_data_v):
     st.plotly_chart(fig,use_container_width=True)
 
 
+def Quarterly_amount_bar_graph(quarterly_volume_summary):
+    st.subheader("Comparison of Transaction Amounts by Quarter")
+    fig = px.bar(quarterly_volume_summary,
+        x='Quarter',
+        y='TotalAmount',
+        labels={'TotalAmount': 'Total Amount'},
+        color_discrete_sequence=px.colors.sequential.Aggrnyl,
+    )
+
+    fig.update_layout(
+        title=f'Bar Graph of Total Transaction Amount For Each Quarter',
+        xaxis_title='Quarter',
+        yaxis_title='Total Amount'
+    )
+
+    st.plotly_chart(fig,use_container_width=True)
+
+
+
+dataset = excel_handler.page_dataset()
+if dataset is None:
+    st.warning("Missing Data, Please Add Data source.")
+    st.stop()
+selected_year = excel_handler.selected_year(dataset)
 
 with st.container():
 
@@ -53,33 +78,22 @@ with st.container():
     st.write("**An Overview of Transaction Counts by Quarter, Presented Through Bar Graphs and Pie Charts**")
     col1, col2 = st.columns([2,1])
 
-    successful_data_v = st.session_state.successful_data_v
-
-    # Resample the data to quarterly counts
-    quarterly_counts = successful_data_v.resample('Q', on=PAYMENT_DATE_COLUMN).size()    
-    # Calculate the total amount per quarter
-    quarterly_total_amount = successful_data_v.resample('Q', on=PAYMENT_DATE_COLUMN)['Amount'].sum()
-
-    # Get the labels for quarters
-    quarter_labels = ['Q1', 'Q2', 'Q3', 'Q4']
+    # Quarterly counts and amounts from the time buckets: every quarter from the year's first transaction
+    # to its last, so a partial year shows only its own quarters and an empty quarter shows as zero
+    quarterly = pipeline.get(dataset, 'quarterly', year=selected_year)
 
-    # Create a new DataFrame with counts, total amount, and labels
-    quarterly_summary = pd.DataFrame({
-        'Quarter': quarter_labels,
-        'TransactionCount': quarterly_counts,
-    })
+    quarterly_summary = quarterly[['Quarter', 'TransactionCount']]
 
-
-    quarterly_volume_summary = pd.DataFrame({
-        'Quarter': quarter_labels,
-        'TotalAmount': quarterly_total_amount
-    })
+    quarterly_volume_summary = quarterly[['Quarter', 'TotalAmount']]
 
 
     with col1:
         Quarterly_count_bar_graph(quarterly_summary)
-        # Monthly_count_bar_graph(successful_data_v)
 
     with col2:
         Quarterly_Count_Pie_chart(quarterly_summary)
-       
\ No newline at end of file
+
+with st.container():
+    Quarterly_amount_bar_graph(quarterly_volume_summary)
+
+diagnostics_panel()
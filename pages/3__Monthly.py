@@ -1,9 +1,113 @@
 import streamlit as st
 from LoadData import ExcelHandler
+from Diagnostics import diagnostics_panel, instrument
+from FigureCache import MAX_POINTS, cached_figure, downsample_frame
+from PageSections import section
+from Pipeline import pipeline
+from TimeBuckets import BUCKETS
+import plotly_express as px
 
 
 # Create an instance of the ExcelHandler class
 excel_handler = ExcelHandler()
 
+PAYMENT_DATE_COLUMN = "PaymentDate"
+
 if st.sidebar.button('View Data'):
-    excel_handler.view_data()
\ No newline at end of file
+    excel_handler.view_data()
+
+
+def PeriodCountFigure(by_type, period):
+    # Labels sort in time order. Day and week spans keep their busiest and quietest periods, so the
+    # bars of every type together stay within what the chart can show.
+    totals = by_type.groupby(PAYMENT_DATE_COLUMN)['Count'].sum().to_frame()
+    kept = downsample_frame(totals, None, 'Count', method='minmax', max_points=MAX_POINTS // max(by_type['ProcessType'].nunique(), 1))
+    by_type = by_type[by_type[PAYMENT_DATE_COLUMN].isin(kept.index)]
+
+    fig = px.bar(
+        by_type,
+        x=PAYMENT_DATE_COLUMN,
+        y='Count',
+        color='ProcessType',
+        labels={PAYMENT_DATE_COLUMN: period, 'Count': 'Transaction Count'},
+        color_discrete_sequence=px.colors.sequential.Aggrnyl,
+    )
+    fig.update_layout(
+        title=f'Transaction Count by {period} and Type',
+        xaxis_title=period,
+        yaxis_title='Transaction Count',
+        legend=dict(orientation='h', y=-0.2, x=-0.1),
+    )
+    # Empty periods stay on the axis in order, as zero bars
+    fig.update_xaxes(type='category', categoryorder='array', categoryarray=list(kept.index))
+    return fig
+
+
+def PeriodAmountFigure(totals, period):
+    totals = downsample_frame(totals, 'Start', 'Amount')
+    fig = px.line(
+        totals,
+        x=period,
+        y='Amount',
+        markers=True,
+        labels={'Amount': 'Total Amount'},
+        color_discrete_sequence=px.colors.sequential.Redor_r,
+    )
+    fig.update_layout(title=f'Total Transaction Amount by {period}', xaxis_title=period, yaxis_title='Total Amount')
+    fig.update_xaxes(type='category')
+    return fig
+
+
+@instrument
+def PeriodChanges(totals, period):
+    # Change from the period before; the step into or out of an empty period has no percentage
+    table = totals.set_index(period)[['Count', 'Amount']]
+    previous = table['Count'].shift(1)
+    table['CountChange'] = table['Count'].diff().fillna(0).astype('int64')
+    table['CountChange (%)'] = ((table['Count'] / previous.where(previous > 0) - 1) * 100).round(2)
+    table['Amount'] = table['Amount'].round(2)
+    return table
+
+
+@section
+def PeriodTrends(dataset, selected_year):
+    with st.container():
+        bucket = st.radio("Group transactions by", BUCKETS, index=BUCKETS.index('month'), horizontal=True, format_func=str.title)
+        period = bucket.title()
+        buckets = pipeline.get(dataset, 'time_buckets', year=selected_year, bucket=bucket)
+        totals = buckets.totals()
+
+        busiest = totals['Count'].idxmax()
+        quietest = totals['Count'].idxmin()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric(f"Busiest {period}", totals[period][busiest], f"{totals['Count'][busiest]:,} transactions", delta_color="off")
+        col2.metric(f"Quietest {period}", totals[period][quietest], f"{totals['Count'][quietest]:,} transactions", delta_color="off")
+        col3.metric(f"Average per {period}", f"{totals['Count'].mean():,.0f}")
+        col4.metric(f"{period}s without Transactions", f"{int((totals['Count'] == 0).sum()):,}")
+
+    with st.container():
+        col1, col2 = st.columns([3, 2])
+        with col1:
+            st.plotly_chart(cached_figure(PeriodCountFigure, buckets.by_type(), period=period), use_container_width=True)
+        with col2:
+            st.plotly_chart(cached_figure(PeriodAmountFigure, totals, period=period), use_container_width=True)
+
+    with st.container():
+        st.subheader(f"Change from the Previous {period}")
+        st.dataframe(PeriodChanges(totals, period), use_container_width=True)
+
+
+dataset = excel_handler.page_dataset()
+if dataset is None:
+    st.warning("Missing Data, Please Add Data source.")
+    st.stop()
+selected_year = excel_handler.selected_year(dataset)
+
+with st.container():
+    st.header("Transaction Trends Over Time")
+    st.write(f"**Processed transactions of {selected_year} by period, with periods without transactions shown as zero**")
+
+# Switching the period reruns only the section below
+PeriodTrends(dataset, selected_year)
+
+diagnostics_panel()
@@ -1,7 +1,10 @@
 import streamlit as st
 from LoadData import ExcelHandler
+from Diagnostics import diagnostics_panel
+from FigureCache import cached_figure
+from PageSections import section
+from Pipeline import pipeline
 import plotly_express as px 
-import pandas as pd
 
 # Create an instance of the ExcelHandler class
 excel_handler = ExcelHandler()
@@ -11,21 +14,6 @@ PAYMENT_DATE_COLUMN = "PaymentDate"
 ordered_days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
 
 
-@st.cache_data
-def Grouped_data_dayOfWeek(successful_data_v):
-    week_day_name_count = successful_data_v.groupby(['ProcessType_Description', successful_data_v[PAYMENT_DATE_COLUMN].dt.day_name()]).size().reset_index(name='Count')
-
-    return week_day_name_count
-
-def PivotWeekDayPrcessType(week_day_name_count):
-    pivoted_Week_data = week_day_name_count.pivot(index=PAYMENT_DATE_COLUMN, columns='ProcessType_Description', values='Count')
-    pivoted_Week_data = pivoted_Week_data.fillna(0)
-
-    # pivoted_Week_data['Daily_Total'] = pivoted_Week_data.sum(axis=1)
-
-    return pivoted_Week_data
-
-
 @st.cache_data
 def TopDayOfWeekPlot(grouped_data,ordered_days):
     st.subheader("**Transaction Type Analysis by Day of the Week**")
@@ -52,17 +40,56 @@ def TopDayOfWeekPlot(grouped_data,ordered_days):
     st.plotly_chart(fig, use_container_width=True)
 
 
+def WeekdayHourFigure(heatmap, title):
+    fig = px.imshow(
+        heatmap,
+        labels={'x': 'Hour of the Day', 'y': 'Day of the Week', 'color': 'Transactions'},
+        aspect='auto',
+        color_continuous_scale=px.colors.sequential.Aggrnyl,
+    )
+    fig.update_layout(title=title)
+    fig.update_xaxes(dtick=2)
+    return fig
+
+
+@section
+def WeekdayHourHeatmaps(payment_hours, paid_hours):
+    st.subheader("**When Payments are Submitted and Paid**")
+    # The heatmaps are sums over the (type, weekday, hour) counts, so changing the types never touches the rows
+    types = st.multiselect("Transaction types", payment_hours.present_types(), placeholder="All transaction types")
+    selected_types = types or None
+
+    # Each heatmap is a 7x24 frame, so its figure is keyed on its content
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        st.plotly_chart(cached_figure(WeekdayHourFigure, payment_hours.heatmap(selected_types), title=f'Submitted ({PAYMENT_DATE_COLUMN})'), use_container_width=True)
+    with col2:
+        st.plotly_chart(cached_figure(WeekdayHourFigure, paid_hours.heatmap(selected_types), title=f'Paid ({PAID_DATE_COLUMN})'), use_container_width=True)
+
+
+dataset = excel_handler.page_dataset()
+if dataset is None:
+    st.warning("Missing Data, Please Add Data source.")
+    st.stop()
+selected_year = excel_handler.selected_year(dataset)
 
 with st.container():
     st.subheader("Top Day of the Week")
 
     col1, col2 = st.columns([1,2])
-    successful_data_v = st.session_state.successful_data_v
-    
-    week_day_transaction_count = Grouped_data_dayOfWeek(successful_data_v)
+    week_day_transaction_count = pipeline.get(dataset, 'type_by_weekday', year=selected_year)
 
     with col1:
-        st.write(PivotWeekDayPrcessType(week_day_transaction_count))
+        st.write(pipeline.get(dataset, 'weekday_pivot', year=selected_year))
 
     with col2:
-        TopDayOfWeekPlot(week_day_transaction_count, ordered_days)
\ No newline at end of file
+        TopDayOfWeekPlot(week_day_transaction_count, ordered_days)
+
+# The type filter reruns only the heatmaps
+with st.container():
+    WeekdayHourHeatmaps(
+        pipeline.get(dataset, 'payment_hours', year=selected_year),
+        pipeline.get(dataset, 'paid_hours', year=selected_year),
+    )
+
+diagnostics_panel()
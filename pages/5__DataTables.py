@@ -1,28 +1,56 @@
+import datetime
+
 import streamlit as st
 from LoadData import ExcelHandler
+from Diagnostics import diagnostics_panel
+from DataTable import paged_table
+from PageSections import section
+from Pipeline import pipeline
 
 
 # Create an instance of the ExcelHandler class
 excel_handler = ExcelHandler()
-successful_data_v = st.session_state.successful_data_v
-data = file_session_csv = st.session_state.excel_data
-success_v = st.session_state.success_v
-declined = st.session_state.declined
+dataset = excel_handler.page_dataset()
+if dataset is None:
+    st.warning("Missing Data, Please Add Data source.")
+    st.stop()
+selected_year = excel_handler.selected_year(dataset)
+
+
+@section
+def TransactionTables(dataset, successful_data_v, declined):
+    # Switching tables, sorting, filtering and paging rerun only this section
+    data = pipeline.get(dataset, 'processed')
+    success_v = len(successful_data_v)
+    with st.container():
+        st.subheader("Transaction Data Tables")
+        # Only the selected table is built and sent, so a radio stands in for st.tabs (which runs every tab)
+        tab1, tab2, tab3 = f"Raw Data ({len(data)})", f"Processed Transactions ({success_v})", f"Declined Transactions ({len(declined)})"
+        tab = st.radio("Table", [tab1, tab2, tab3], horizontal=True, label_visibility="collapsed")
+        if tab == tab1:
+            st.write('**Raw data ( Year: Mixed)**')
+            dates = st.date_input("Payment dates", value=(), key="raw_dates")
+            if len(dates) == 2:
+                # A slice of the date-sorted rows found by binary search, not a scan
+                data = pipeline.get(dataset, 'date_range', start=dates[0], end=dates[1] + datetime.timedelta(days=1))
+            paged_table(data, key="raw_table")
+
+        elif tab == tab2:
+            st.write(f'**Processed data (No: {len(successful_data_v)})**')
+            paged_table(successful_data_v.rows, key="successful_table")
+
+        else:
+            st.write(f'**Declined Transactions (No: {len(declined)})**')
+            paged_table(declined.rows, key="declined_table")
 
-with st.container():
-    st.subheader("Transaction Data Tables")
-    tab1, tab2, tab3 = st.tabs([f"Raw Data ({len(data)})", f"Processed Transactions ({success_v})", f"Declined Transactions ({len(declined)})"])
-    with tab1:
-        st.write('**Raw data ( Year: Mixed)**')
-        st.write(data)
 
-    with tab2:
-        st.write(f'**Processed data (No: {len(successful_data_v)})**')
-        st.write(successful_data_v)
+        st.markdown("---")
 
-    with tab3:
-        st.write(f'**Declined Transactions (No: {len(declined)})**')
-        st.write(declined)
 
+TransactionTables(
+    dataset,
+    pipeline.get(dataset, 'successful', year=selected_year),
+    pipeline.get(dataset, 'declined', year=selected_year),
+)
 
-    st.markdown("---")
\ No newline at end of file
+diagnostics_panel()
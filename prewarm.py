@@ -0,0 +1,58 @@
+# Parses every export in the data folder into the upload cache ahead of time, so the server's
+# folder watcher opens them from disk instead of parsing them as it starts, then times how long
+# the first charts of each take to build from the cached dataset.
+#
+#   GAPS_DATA_DIR=/srv/gaps/exports python prewarm.py && streamlit run dashboard.py
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from BackgroundIngest import IngestJob
+from DataCache import dataset_key, file_fingerprint
+from DatasetStore import Dataset
+from DropFolder import DATA_DIR, DROP_SUFFIX, prewarm
+from LoadData import DatasetLoader
+
+
+def prewarm_file(loader, path):
+    key = dataset_key(file_fingerprint(path))
+    start = time.perf_counter()
+    if not loader.is_cached(key):
+        job = IngestJob(key, os.path.getsize(path))
+        with open(path, 'rb') as source:
+            job.run(lambda job: loader.ingest(job, source))
+        if job.error is not None:
+            raise job.error
+    parsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    dataset = loader.open_cached(key)
+    if isinstance(dataset, pd.DataFrame):
+        dataset = Dataset(key, dataset)
+    prewarm(dataset)
+    return parsed, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse the exports in the data folder into the upload cache")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="Folder of exports (default: GAPS_DATA_DIR)")
+    args = parser.parse_args()
+    if args.data_dir is None:
+        parser.error("set GAPS_DATA_DIR or pass --data-dir")
+
+    loader = DatasetLoader()
+    for name in sorted(os.listdir(args.data_dir)):
+        if not name.lower().endswith(DROP_SUFFIX):
+            continue
+        try:
+            parsed, warm = prewarm_file(loader, os.path.join(args.data_dir, name))
+        except Exception as error:
+            print(f"{name}: could not be read: {error}")
+            continue
+        print(f"{name}: parsed in {parsed:.1f} s, first charts from the cache in {warm * 1000:,.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from DataProcessing import PAYMENT_DATE_COLUMN, prepare_dataset
+from DatasetStore import Dataset
+from IncrementalAppend import append_dataset, unseen_rows
+from LoadData import INGEST_COLUMNS, DatasetLoader
+
+ROW = "{trans_id},1,C Co,GTB,4623743387,{amount},UGX,8492601734,Company {company},{payment_date},2022-12-01 20:54:00.000,A,9,0,1,ok"
+
+
+def processed(rows):
+    source = io.BytesIO("\n".join([",".join(INGEST_COLUMNS)] + rows).encode())
+    return prepare_dataset(pd.concat(list(DatasetLoader().iter_csv_chunks(source)), ignore_index=True))
+
+
+def row(trans_id, payment_date, company=1):
+    return ROW.format(trans_id=trans_id, amount=100 * (trans_id or 1), company=company, payment_date=payment_date)
+
+
+def test_overlapping_delta_is_merged_in_date_order():
+    base_rows = [
+        row(1, '2022-01-10T09:00:00'),
+        row(2, '2022-03-05T10:00:00', company=2),
+        row(3, '2022-06-20T11:00:00'),
+    ]
+    # Two rows already loaded, one dated between the loaded ones and one after them
+    delta_rows = [
+        row(2, '2022-03-05T10:00:00', company=2),
+        row(3, '2022-06-20T11:00:00'),
+        row(4, '2022-02-14T12:00:00', company=3),
+        row(5, '2022-07-01T13:00:00', company=2),
+    ]
+    base = Dataset('base', processed(base_rows))
+
+    new_rows = unseen_rows(base, processed(delta_rows))
+    assert new_rows['TransID'].tolist() == [4, 5]
+
+    appended = append_dataset(base, 'appended', new_rows)
+    expected = Dataset('expected', processed(base_rows + delta_rows[2:]))
+
+    assert appended.data['TransID'].tolist() == [1, 4, 2, 3, 5]
+    assert appended.data[PAYMENT_DATE_COLUMN].is_monotonic_increasing
+    assert (appended.status() == expected.status()).all()
+    assert appended.cube().metrics(2022) == expected.cube().metrics(2022)
+    assert sorted(appended.trans_ids()) == [1, 2, 3, 4, 5]
+
+
+def test_rows_without_a_trans_id_are_always_new():
+    base = Dataset('base with blanks', processed([row(1, '2022-01-10T09:00:00'), row('', '2022-01-11T09:00:00')]))
+    delta = processed([
+        row(1, '2022-01-10T09:00:00'),
+        row('', '2022-01-12T09:00:00'),
+        row('', '2022-01-13T09:00:00'),
+        row(2, '2022-01-14T09:00:00'),
+    ])
+
+    new_rows = unseen_rows(base, delta)
+    assert new_rows['TransID'].isna().sum() == 2
+    assert new_rows['TransID'].dropna().tolist() == [2]
+    assert len(append_dataset(base, 'appended with blanks', new_rows).data) == 5
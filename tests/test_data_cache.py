@@ -0,0 +1,34 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DataCache import DataCache
+
+
+def cache_with(tmp_path, keys, in_use, max_bytes=1024):
+    cache = DataCache(cache_dir=str(tmp_path), max_bytes=max_bytes, suffix='.sqlite', in_use=lambda: set(in_use))
+    for age, key in enumerate(keys):
+        with open(cache.path(key), 'wb') as file:
+            file.write(b'x' * 1000)
+        os.utime(cache.path(key), (age, age))
+    return cache
+
+
+def test_files_of_open_datasets_survive_invalidate(tmp_path):
+    cache = cache_with(tmp_path, ['open', 'closed'], in_use=['open'])
+
+    cache.invalidate()
+    assert os.path.exists(cache.path('open'))
+    assert not os.path.exists(cache.path('closed'))
+
+    cache.invalidate('open')
+    assert os.path.exists(cache.path('open'))
+
+
+def test_eviction_skips_files_of_open_datasets(tmp_path):
+    # The oldest file is open, so the next oldest goes instead
+    cache = cache_with(tmp_path, ['open', 'old', 'new'], in_use=['open'])
+
+    cache.evict()
+    assert [cache.key(path) for path, _, _ in cache.entries()] == ['open']
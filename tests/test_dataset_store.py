@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DatasetStore import DatasetStore
+
+
+def test_released_dataset_is_dropped_once_no_session_uses_it():
+    store = DatasetStore()
+    dataset = object()
+    store.open('first', 'key', lambda: dataset)
+    store.open('second', 'key', lambda: object())
+
+    store.release('first')
+    assert store.get('key') is dataset
+
+    store.release('second')
+    assert store.get('key') is None
+
+
+def test_pinned_dataset_survives_release():
+    store = DatasetStore()
+    store.pin('key')
+    store.open('session', 'key', lambda: object())
+
+    store.release('session')
+    assert store.get('key') is not None
@@ -0,0 +1,30 @@
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from DataProcessing import prepare_dataset
+from LoadData import INGEST_COLUMNS, DatasetLoader
+
+ROW = "{trans_id},{batch_id},C Co,GTB,4623743387,516299.46,UGX,8492601734,Company 1,2022-11-29T11:21:11,2022-12-01 20:54:00.000,A,9,0,1,ok"
+
+
+def export(rows):
+    return io.BytesIO("\n".join([",".join(INGEST_COLUMNS)] + rows).encode())
+
+
+def test_blank_ids_do_not_abort_the_ingest():
+    source = export([
+        ROW.format(trans_id=1, batch_id=10),
+        ROW.format(trans_id="", batch_id=11),
+        ROW.format(trans_id=3, batch_id=""),
+    ])
+    raw = pd.concat(list(DatasetLoader().iter_csv_chunks(source)), ignore_index=True)
+
+    assert len(raw) == 3
+    assert raw['TransID'].isna().tolist() == [False, True, False]
+    assert raw['BatchID'].isna().tolist() == [False, False, True]
+    assert len(prepare_dataset(raw)) == 3
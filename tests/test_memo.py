@@ -0,0 +1,21 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from Memo import Memo
+from WeekdayHours import WeekdayHours
+
+
+def test_result_objects_are_charged_for_their_arrays():
+    memo = Memo(max_bytes=10_000)
+    hours = WeekdayHours(['GTB', 'RTGS'], np.ones((2, 7, 24), dtype=np.int64))
+    memo.get_or_build(('hours',), lambda: hours)
+    assert memo.bytes >= hours.counts.nbytes
+
+    # An object larger than the whole budget is returned but not kept
+    large = WeekdayHours(['GTB'] * 8, np.ones((8, 7, 24), dtype=np.int64))
+    assert memo.get_or_build(('large',), lambda: large) is large
+    assert ('large',) not in memo.entries
@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from ParallelAgg import month_partitions
+from TimeBuckets import BUCKETS, bucket_totals
+from WeekdayHours import weekday_hour_counts
+
+
+def rows(count=5000, seed=0):
+    # Date-sorted payment dates over a year and a half, unsorted paid dates, a few missing dates and types
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2021-07-01', 'ns')
+    offsets = np.sort(rng.integers(0, 540 * 86_400, count)).astype('timedelta64[s]')
+    payment = start + offsets
+    paid = payment + rng.integers(0, 3 * 86_400, count).astype('timedelta64[s]')
+    paid[rng.random(count) < 0.05] = np.datetime64('NaT')
+    codes = rng.integers(-1, 5, count)
+    amounts = rng.random(count) * 1000
+    amounts[rng.random(count) < 0.05] = np.nan
+    return payment, paid, codes, amounts
+
+
+def test_month_partitions_in_the_pool_match_one_pass():
+    payment, paid, codes, amounts = rows()
+    partitions = month_partitions(payment)
+    types = pd.Index(list('ABCDE'))
+    assert len(partitions) == 18
+
+    for bucket in BUCKETS:
+        serial = bucket_totals(bucket, payment[[0, -1]], payment, codes, types, amounts)
+        pooled = bucket_totals(bucket, payment[[0, -1]], payment, codes, types, amounts, partitions=partitions, workers=2)
+        assert (serial.counts == pooled.counts).all()
+        assert np.allclose(serial.amounts, pooled.amounts)
+
+    # Paid dates are not sorted, but the payment date partitions still cover every row once
+    serial = weekday_hour_counts(codes, len(types), paid)
+    pooled = weekday_hour_counts(codes, len(types), paid, partitions, workers=2)
+    assert (serial == pooled).all()
+    assert serial.sum() == ((codes >= 0) & ~np.isnat(paid)).sum()
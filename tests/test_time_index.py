@@ -0,0 +1,31 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from TimeIndex import TimeIndex
+
+DATES = pd.Series(pd.to_datetime([
+    '2021-12-31 23:00', '2022-01-05 00:00', '2022-01-20 00:00', '2022-03-01 00:00', '2022-03-31 12:00', '2023-02-01 00:00', None,
+]))
+
+
+def test_year_and_month_bounds_are_positional_slices():
+    index = TimeIndex(DATES)
+
+    assert index.year_options() == [2021, 2022, 2023]
+    assert index.year_bounds(2022) == (1, 5)
+    assert index.year_bounds(2020) == (0, 0)
+    assert index.month_bounds(2022, 3) == (3, 5)
+    assert index.month_bounds(2022, 2) == (0, 0)
+
+
+def test_range_bounds_include_start_and_exclude_end():
+    index = TimeIndex(DATES)
+
+    assert index.range_bounds('2022-01-05', '2022-03-01') == (1, 3)
+    assert index.range_bounds('2022-03-01', '2022-04-01') == (3, 5)
+    # Missing dates sort last and fall in no range
+    assert index.range_bounds('2000-01-01', '2100-01-01') == (0, 6)